@@ -0,0 +1,265 @@
+"""
+Replay of recorded traffic: the requests logged by the routers, or a JSONL workload, sent again with their
+original inter-arrival times (or scaled by `--speed`) to a running server or to the API in this process
+with the fake backend. The report gives the latency and throughput per endpoint, as `benchmarks.run`.
+
+Sources:
+    - log files or directories (`logs/<day>/<endpoint>_logs.log`), in the JSON lines format or in the former text
+      format. The "Request received" lines hold the request body; the bodies truncated by the logger cannot be
+      replayed, and the files uploaded to /profile/full are not logged, so those requests are replayed without file.
+    - JSONL workloads, one request per line: {"endpoint": "goals", "stream": false, "body": {...}, "time": <ISO date
+      or epoch seconds>} (or "offset" in seconds instead of "time"). Lines without an endpoint and a body are skipped:
+      the requests.jsonl at the root of the repository is the backlog of change requests, not HTTP traffic.
+
+Usage:
+    python -m benchmarks.replay logs/2025-08-07 --speed 10 --max-gap 5
+    python -m benchmarks.replay traffic.jsonl --url http://127.0.0.1:8000
+"""
+# Rejeu du trafic enregistré (journaux des routeurs ou charge de travail JSONL), avec ses intervalles d'origine.
+import argparse
+import asyncio
+import glob
+import json
+import os
+import re
+import sys
+from datetime import datetime
+from typing import Iterable, Optional
+
+from benchmarks.run import add_target_arguments, open_client, percentile, print_report, send, summarize
+
+
+# Paths of the recommendation endpoints, by the name of their logger.
+# Chemins des endpoints de recommandation, par nom de leur logger.
+ENDPOINTS = {
+    "strengths": "/api/v1/strengths/",
+    "challenges": "/api/v1/challenges/",
+    "goals": "/api/v1/goals/",
+    "means": "/api/v1/means/",
+    "full": "/api/v1/profile/full/",
+}
+
+_TEXT_LINE = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - (\w+) - (.*)$")
+_JSON_REQUEST = re.compile(r"^(Stream request|Request) received \([^)]*\): (\{.*\})$")
+_FULL_REQUEST = re.compile(r"^(Stream request|Request) received for full profile\. Age: (.*?), Gender: (.*?),  description: (.*?)(, potential_file_name: .*)?$")
+
+
+class ReplayEntry:
+    """
+    A recorded request: its time, its endpoint and its body.
+    """
+
+    def __init__(self, time: float, endpoint: str, stream: bool, body: dict):
+        self.time = time
+        self.endpoint = endpoint
+        self.stream = stream
+        self.body = body
+
+    @property
+    def name(self) -> str:
+        return f"{self.endpoint}_stream" if self.stream else self.endpoint
+
+    @property
+    def path(self) -> str:
+        return ENDPOINTS[self.endpoint] + ("stream" if self.stream else "")
+
+    @property
+    def request(self) -> dict:
+        # /profile/full reçoit un formulaire, les autres endpoints un corps JSON.
+        if self.endpoint == "full":
+            return {"data": {key: str(value) for key, value in self.body.items() if value is not None}}
+        return {"json": self.body}
+
+
+def _timestamp(value) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace(",", ".")).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def _parse_message(endpoint: str, message: str) -> tuple:
+    """
+    Returns (stream, body) of a logged "Request received" message, (None, None) for another message,
+    or (None, "invalid") for a request that cannot be replayed.
+    """
+    match = _JSON_REQUEST.match(message)
+    if match:
+        try:
+            return match.group(1) == "Stream request", json.loads(match.group(2))
+        except ValueError:
+            return None, "invalid"
+    match = _FULL_REQUEST.match(message)
+    if match:
+        age = None if match.group(2) == "None" else match.group(2)
+        return match.group(1) == "Stream request", {"age": age, "gender": match.group(3), "description": match.group(4)}
+    if "received" in message and message.startswith(("Request", "Stream request")):
+        # Ligne de requête tronquée par le logger ou sur plusieurs lignes.
+        return None, "invalid"
+    return None, None
+
+
+def _log_files(paths: Iterable[str]) -> list:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "**", "*_logs.log"), recursive=True)))
+        else:
+            files.append(path)
+    return files
+
+
+def load(paths: Iterable[str], statistics: dict) -> list:
+    """
+    Loads the recorded requests of log files, log directories and JSONL workloads, sorted by time.
+    :param statistics: Counters of the loaded and skipped lines, updated in place.
+    """
+    entries = []
+    for path in _log_files(paths):
+        if path.endswith(".jsonl"):
+            entries.extend(_load_jsonl(path, statistics))
+        else:
+            entries.extend(_load_log(path, statistics))
+    entries.sort(key=lambda entry: entry.time)
+    return entries
+
+
+def _skip(statistics: dict, reason: str) -> None:
+    statistics[reason] = statistics.get(reason, 0) + 1
+
+
+def _load_log(path: str, statistics: dict) -> list:
+    endpoint = os.path.basename(path).rsplit("_logs.log", 1)[0]
+    if endpoint not in ENDPOINTS:
+        return []
+    entries = []
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        for line in file:
+            line = line.rstrip("\n")
+            if line.startswith("{"):
+                try:
+                    record = json.loads(line)
+                    time, message = _timestamp(record["time"]), record["message"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+            else:
+                match = _TEXT_LINE.match(line)
+                if not match:
+                    continue
+                time, message = _timestamp(match.group(1)), match.group(3)
+            stream, body = _parse_message(endpoint, message)
+            if body is None:
+                continue
+            if body == "invalid" or time is None:
+                _skip(statistics, "truncated_or_invalid")
+                continue
+            statistics["loaded"] = statistics.get("loaded", 0) + 1
+            entries.append(ReplayEntry(time, endpoint, stream, body))
+    return entries
+
+
+def _load_jsonl(path: str, statistics: dict) -> list:
+    entries = []
+    with open(path, "r", encoding="utf-8") as file:
+        for number, line in enumerate(file):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                _skip(statistics, "truncated_or_invalid")
+                continue
+            if not isinstance(record, dict) or "endpoint" not in record or not isinstance(record.get("body"), dict):
+                _skip(statistics, "not_a_request")
+                continue
+            if record["endpoint"] not in ENDPOINTS:
+                _skip(statistics, "unknown_endpoint")
+                continue
+            time = _timestamp(record.get("time"))
+            if time is None:
+                # Sans date, l'ordre des lignes et le décalage éventuel tiennent lieu de chronologie.
+                time = float(record.get("offset", number))
+            statistics["loaded"] = statistics.get("loaded", 0) + 1
+            entries.append(ReplayEntry(time, record["endpoint"], bool(record.get("stream")), record["body"]))
+    return entries
+
+
+def schedule(entries: list, speed: float, max_gap: Optional[float]) -> list:
+    """
+    Returns the send offset of every entry, in seconds from the start of the replay: the original inter-arrival
+    times divided by `speed`, each gap being capped at `max_gap` seconds (e.g. the nights of production logs).
+    """
+    offsets = []
+    offset = 0.0
+    for index, entry in enumerate(entries):
+        if index:
+            gap = (entry.time - entries[index - 1].time) / speed
+            offset += min(gap, max_gap) if max_gap is not None else gap
+        offsets.append(offset)
+    return offsets
+
+
+async def replay(client, entries: list, offsets: list, headers: dict) -> tuple:
+    """
+    Sends the entries at their offsets, without waiting for the previous responses.
+    :return: The results of the entries, the duration of the replay and the lateness of the sends.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    tasks = []
+    lateness = []
+    for entry, offset in zip(entries, offsets):
+        await asyncio.sleep(max(0.0, start + offset - loop.time()))
+        lateness.append(loop.time() - start - offset)
+        tasks.append(asyncio.create_task(send(client, entry.path, entry.request, entry.stream, headers)))
+    results = await asyncio.gather(*tasks)
+    return results, loop.time() - start, lateness
+
+
+async def main(arguments) -> dict:
+    statistics = {"loaded": 0}
+    entries = load(arguments.sources, statistics)
+    if arguments.limit:
+        entries = entries[:arguments.limit]
+    if not entries:
+        return {"statistics": statistics, "rows": []}
+    offsets = schedule(entries, arguments.speed, arguments.max_gap)
+    headers = {"cache-control": "no-cache"} if arguments.no_cache else {}
+    async with open_client(arguments) as client:
+        results, elapsed, lateness = await replay(client, entries, offsets, headers)
+
+    by_name = {}
+    for entry, result in zip(entries, results):
+        by_name.setdefault(entry.name, []).append(result)
+    streamed = {entry.name for entry in entries if entry.stream}
+    rows = [summarize(name, by_name[name], elapsed, name in streamed) for name in sorted(by_name)]
+    rows.append(summarize("total", list(results), elapsed, False))
+    statistics.update({"replayed": len(entries), "duration": elapsed, "recorded_span": entries[-1].time - entries[0].time,
+                       "send_lateness_p99": percentile(lateness, 0.99)})
+    return {"statistics": statistics, "rows": rows}
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Replays recorded requests (router logs or JSONL workloads) with their original timing.")
+    parser.add_argument("sources", nargs="+", help="Log files, log directories (searched recursively) or .jsonl workloads.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed: 10 sends the requests ten times faster than recorded.")
+    parser.add_argument("--max-gap", type=float, help="Caps every gap between two requests, in seconds of replay.")
+    parser.add_argument("--limit", type=int, help="Replays only the first requests.")
+    add_target_arguments(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    report = asyncio.run(main(arguments))
+    print(json.dumps(report["statistics"]))
+    if report["rows"]:
+        print_report(report["rows"], in_process=not arguments.url)
+    else:
+        print("No replayable request found in the sources.")
+    if arguments.json:
+        with open(arguments.json, "w", encoding="utf-8") as file:
+            json.dump({"arguments": vars(arguments), **report}, file, indent=2)
+    sys.exit(0 if report["rows"] and all(row["ok"] for row in report["rows"]) else 1)
@@ -0,0 +1,217 @@
+"""
+Load test of the recommendation routes at a fixed request rate.
+
+By default the API runs in this process with the deterministic fake model backend (no API key, no API credit),
+and every scenario is driven in turn for `--duration` seconds at `--rps` requests per second, whatever the
+response times (open loop). The report gives, per scenario, the p50/p95/p99 latency, the throughput, the
+time to first byte of the streamed routes, the errors and the memory of the process.
+
+Usage:
+    python -m benchmarks.run --rps 20 --duration 30
+    python -m benchmarks.run --routes goals,goals_stream --latency lognormal:1.0,0.5 --concurrency 8 --no-cache
+    python -m benchmarks.run --url http://127.0.0.1:8000 --rps 5     # a running server, e.g. started with ELSIA_LLM_BACKEND=fake
+
+The time to first byte of the streamed routes is only meaningful with `--url`: in this process the ASGI
+transport of httpx hands over the response once it is complete. The batch routes are not driven: they submit
+to the Message Batches API, see tools/fake_batch_server.py.
+"""
+# Test de charge des routes de recommandation à débit fixe.
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+
+from benchmarks.scenarios import select
+
+
+def percentile(values: list, fraction: float) -> Optional[float]:
+    """
+    Returns the nearest-rank percentile of a list of values, or None when it is empty.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def memory() -> dict:
+    """
+    Returns the current and peak resident memory of this process, in MiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    current = None
+    try:
+        with open("/proc/self/statm", "r") as file:
+            current = int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    return {"rss_mib": current, "peak_rss_mib": peak}
+
+
+async def send(client: httpx.AsyncClient, path: str, request: dict, stream: bool, headers: dict) -> dict:
+    """
+    Sends one POST request and reads its whole response.
+    :param request: The body of the request, as keyword arguments of httpx (`json` or `data`).
+    :param stream: Whether the route answers with Server-Sent Events.
+    :return: The status (an HTTP code, "sse_error" or the name of the client error), the latency and the time to first byte.
+    """
+    start = time.perf_counter()
+    first_byte = None
+    failed = False
+    try:
+        async with client.stream("POST", path, headers=headers, **request) as response:
+            async for chunk in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+                # Un flux SSE répond 200 même lorsque la génération échoue : l'événement `error` compte comme une erreur.
+                if stream and b"event: error" in chunk:
+                    failed = True
+            status = "sse_error" if failed else response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    return {"status": status, "latency": time.perf_counter() - start, "first_byte": first_byte}
+
+
+def summarize(name: str, results: list, elapsed: float, stream: bool) -> dict:
+    """
+    Returns the statistics of a set of results: successes, errors by status, throughput and latency percentiles.
+    """
+    latencies = [result["latency"] for result in results if result["status"] == 200]
+    first_bytes = [result["first_byte"] for result in results if result["status"] == 200 and result["first_byte"] is not None]
+    errors = {}
+    for result in results:
+        if result["status"] != 200:
+            errors[str(result["status"])] = errors.get(str(result["status"]), 0) + 1
+    return {
+        "scenario": name,
+        "sent": len(results),
+        "ok": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "ttfb_p50": percentile(first_bytes, 0.50) if stream else None,
+        **memory(),
+    }
+
+
+async def drive(client: httpx.AsyncClient, scenario, rps: float, duration: float, distinct: int, headers: dict) -> dict:
+    """
+    Sends the requests of a scenario at a fixed rate for `duration` seconds and waits for their responses.
+    :param distinct: The number of distinct request bodies, cycled over (1 makes every request identical).
+    :return: The statistics of the scenario.
+    """
+    loop = asyncio.get_running_loop()
+    tasks = []
+    start = loop.time()
+    count = int(rps * duration)
+    for index in range(count):
+        # Boucle ouverte : l'envoi suit l'horloge, sans attendre les réponses précédentes.
+        await asyncio.sleep(max(0.0, start + index / rps - loop.time()))
+        tasks.append(asyncio.create_task(send(client, scenario.path, scenario.build(index % distinct), scenario.stream, headers)))
+    results = await asyncio.gather(*tasks)
+    return summarize(scenario.name, results, loop.time() - start, scenario.stream)
+
+
+def _milliseconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}"
+
+
+def print_report(rows: list, in_process: bool) -> None:
+    header = f"{'scenario':<18} {'sent':>6} {'ok':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttfb ms':>8} {'rss MiB':>8}  errors"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        rss = f"{row['rss_mib']:.0f}" if in_process and row["rss_mib"] is not None else "-"
+        print(f"{row['scenario']:<18} {row['sent']:>6} {row['ok']:>6} {row['throughput']:>7.1f} {_milliseconds(row['p50']):>8} "
+              f"{_milliseconds(row['p95']):>8} {_milliseconds(row['p99']):>8} {_milliseconds(row['ttfb_p50']):>8} {rss:>8}  "
+              f"{json.dumps(row['errors']) if row['errors'] else ''}")
+
+
+def configure(arguments) -> None:
+    """
+    Configures the service started in this process: the variables are read when `utils.variables` is imported.
+    """
+    os.environ["ELSIA_LLM_BACKEND"] = "fake"
+    os.environ["ELSIA_FAKE_LLM_LATENCY"] = arguments.latency
+    os.environ["ELSIA_FAKE_LLM_ERROR_RATE"] = str(arguments.error_rate)
+    os.environ["ELSIA_FAKE_LLM_SEED"] = str(arguments.seed)
+    if arguments.concurrency is not None:
+        os.environ["ELSIA_ADMISSION_MAX_CONCURRENCY"] = str(arguments.concurrency)
+    if arguments.no_cache:
+        os.environ["ELSIA_CACHE_ENABLED"] = "false"
+
+
+@asynccontextmanager
+async def open_client(arguments):
+    """
+    Opens the HTTP client of a load test: to the server of `--url`, or to the API started in this process with the fake backend.
+    """
+    timeout = httpx.Timeout(arguments.timeout)
+    if arguments.url:
+        async with httpx.AsyncClient(base_url=arguments.url, timeout=timeout) as client:
+            yield client
+        return
+
+    configure(arguments)
+    import main as service
+
+    # Le service tourne dans ce processus : son cycle de vie (modèles de prompt, tâches de fond) est démarré ici.
+    async with service.lifespan(service.app):
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=timeout) as client:
+            yield client
+
+
+async def main(arguments) -> list:
+    scenarios = select(arguments.routes)
+    headers = {"cache-control": "no-cache"} if arguments.no_cache else {}
+    rows = []
+    async with open_client(arguments) as client:
+        for scenario in scenarios:
+            rows.append(await drive(client, scenario, arguments.rps, arguments.duration, arguments.distinct, headers))
+    return rows
+
+
+def add_target_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the options of the target of a load test: running server, or fake backend in this process.
+    """
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache (Cache-Control: no-cache).")
+    parser.add_argument("--url", help="Base URL of a running server; by default the API runs in this process with the fake backend.")
+    parser.add_argument("--latency", default="lognormal:0.5,0.3", help="Latency distribution of the fake backend, see recommendations.backends.parse_latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of the fake model calls failing with a 529 error.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the fake backend.")
+    parser.add_argument("--concurrency", type=int, help="Maximum number of concurrent model calls (admission controller).")
+    parser.add_argument("--timeout", type=float, default=330.0, help="Client timeout of a request, in seconds.")
+    parser.add_argument("--json", help="Also writes the report to this JSON file.")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Fixed-rate load test of the /api/v1 recommendation routes.")
+    parser.add_argument("--rps", type=float, default=10.0, help="Requests per second sent to each scenario.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Duration of each scenario, in seconds.")
+    parser.add_argument("--routes", help="Comma-separated scenarios (default: all), e.g. strengths,goals_stream,full.")
+    parser.add_argument("--distinct", type=int, default=1_000_000, help="Number of distinct request bodies (lower it to measure the cache and the coalescing).")
+    add_target_arguments(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    rows = asyncio.run(main(arguments))
+    print_report(rows, in_process=not arguments.url)
+    if arguments.json:
+        with open(arguments.json, "w", encoding="utf-8") as file:
+            json.dump({"arguments": vars(arguments), "results": rows}, file, indent=2)
+    sys.exit(0 if all(row["ok"] for row in rows) else 1)
@@ -0,0 +1,78 @@
+"""
+Requests sent by the load tests to every recommendation route of /api/v1.
+"""
+# Requêtes envoyées par les tests de charge à chaque route de recommandation de /api/v1.
+from typing import Optional
+
+
+class Scenario:
+    """
+    A route of the API and the way to build its request body.
+
+    :param name: The name of the scenario, used in the report and by `--routes`.
+    :param path: The path of the route.
+    :param kind: "json" for a JSON body, "form" for a multipart form.
+    :param stream: Whether the route answers with Server-Sent Events.
+    :param body: The request body; the `{variant}` of its strings is replaced by the scenario name and the number of the variant.
+    """
+
+    def __init__(self, name: str, path: str, kind: str, body: dict, stream: bool = False):
+        self.name = name
+        self.path = path
+        self.kind = kind
+        self.body = body
+        self.stream = stream
+
+    def build(self, variant: int) -> dict:
+        """
+        Returns the keyword arguments of the HTTP request for a variant of the body.
+        Distinct variants are distinct requests for the response cache and the coalescing; the name of the scenario
+        is part of the variant, so that a scenario is not served from the cache filled by the previous one.
+        """
+        def render(value):
+            if isinstance(value, str):
+                return value.replace("{variant}", f"{self.name} {variant}")
+            if isinstance(value, list):
+                return [render(entry) for entry in value]
+            return value
+
+        body = {key: render(value) for key, value in self.body.items()}
+        return {"json": body} if self.kind == "json" else {"data": body}
+
+
+_STRENGTHS = {"age": 14, "description": "Enjoys team work and listens carefully in class (student {variant})."}
+_CHALLENGES = {"age": 14, "description": "Struggles with time management and is anxious before exams (student {variant})."}
+_GOALS = {"age": 14, "gender": "female", "strengths": ["Good listener"],
+          "challenges": ["Difficulty with time management (student {variant})"], "needs": ["Study planning"]}
+_MEANS = {"age": 14, "gender": "female", "challenges": ["Difficulty with time management"],
+          "goals": ["Build a weekly study schedule (student {variant})"]}
+_FULL = {"age": "14", "gender": "female",
+         "description": "Good listener, struggles with time management and is anxious before exams (student {variant})."}
+
+SCENARIOS = [
+    Scenario("strengths", "/api/v1/strengths/", "json", _STRENGTHS),
+    Scenario("strengths_stream", "/api/v1/strengths/stream", "json", _STRENGTHS, stream=True),
+    Scenario("challenges", "/api/v1/challenges/", "json", _CHALLENGES),
+    Scenario("challenges_stream", "/api/v1/challenges/stream", "json", _CHALLENGES, stream=True),
+    Scenario("goals", "/api/v1/goals/", "json", _GOALS),
+    Scenario("goals_stream", "/api/v1/goals/stream", "json", _GOALS, stream=True),
+    Scenario("means", "/api/v1/means/", "json", _MEANS),
+    Scenario("means_stream", "/api/v1/means/stream", "json", _MEANS, stream=True),
+    Scenario("full", "/api/v1/profile/full/", "form", _FULL),
+    Scenario("full_pipeline", "/api/v1/profile/full/", "form", {**_FULL, "pipeline": "true"}),
+    Scenario("full_stream", "/api/v1/profile/full/stream", "form", _FULL, stream=True),
+]
+
+
+def select(names: Optional[str]) -> list:
+    """
+    Returns the scenarios named in a comma-separated list, or all of them.
+    :raises ValueError: If a name is unknown.
+    """
+    if not names:
+        return list(SCENARIOS)
+    by_name = {scenario.name: scenario for scenario in SCENARIOS}
+    unknown = [name for name in names.split(",") if name not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown scenarios {unknown}; available: {sorted(by_name)}")
+    return [by_name[name] for name in names.split(",")]
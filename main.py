@@ -1,9 +1,16 @@
 from fastapi import FastAPI, APIRouter
 from contextlib import asynccontextmanager
-from routers import strengths_router, challenges_router, goals_router, means_router, full_router
+from routers import strengths_router, challenges_router, goals_router, means_router, full_router, jobs_router, plans_router, status_router, batch_router, metrics_router
 from utils.logging_setup import setup_logger
-from recommendations.generate_full import FullRecommendation # Importez l'orchestrateur
-from concurrent.futures import ThreadPoolExecutor
+import recommendations.init
+from recommendations.prompt_registry import prompt_registry
+import utils.variables as variables
+import asyncio
+from utils.uploads import BodySizeLimitMiddleware, janitor
+from recommendations.extraction import shutdown_pool
+from recommendations.jobs import job_workers
+from utils.metrics import MetricsMiddleware
+from utils.load_shedding import LoadSheddingMiddleware, load_shedder
 
 # Configuration du logger principal
 main_logger = setup_logger("main")
@@ -14,14 +21,28 @@ async def lifespan(app: FastAPI):
     Gestionnaire de contexte pour le cycle de vie de l'application (startup et shutdown).
     """
     main_logger.info("Application starting up...")
-    # Démarrage de l'executor et autres ressources si nécessaire
-    FullRecommendation.executor = ThreadPoolExecutor(max_workers=5)
-    main_logger.info("Thread pool executor for full_recommender started.")
+    # Chargement et validation des modèles de prompt ; le démarrage échoue si un modèle est invalide.
+    prompt_registry.load()
+    watcher = None
+    if variables.prompts_hot_reload:
+        watcher = asyncio.create_task(prompt_registry.watch(variables.prompts_reload_interval))
+        main_logger.info("Prompt templates hot reload enabled.")
+    # Nettoyage périodique des fichiers envoyés laissés par un worker arrêté brutalement
+    upload_janitor = asyncio.create_task(janitor(variables.upload_janitor_interval, main_logger))
+    # Workers de la file d'attente durable des tâches de profil complet (reprise des tâches laissées par un arrêt)
+    job_workers.start()
     yield
+    # Les tâches en cours sont remises dans la file, pour un autre worker ou le prochain démarrage
+    await job_workers.stop()
+    upload_janitor.cancel()
+    if watcher is not None:
+        watcher.cancel()
     main_logger.info("Application shutting down...")
-    # Arrêt de l'executor et nettoyage des ressources
-    FullRecommendation.executor.shutdown(wait=True)
-    main_logger.info("Thread pool executor for full_recommender shut down.")
+    # Arrêt des processus d'extraction de texte des fichiers envoyés
+    shutdown_pool()
+    # Fermeture du pool de connexions HTTP partagé vers Claude
+    await recommendations.init.close_clients()
+    main_logger.info("Claude HTTP connection pools closed.")
 
 # Créez une instance de FastAPI
 app = FastAPI(
@@ -35,6 +56,26 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Rejet (413) des corps de requête trop grands, avant leur lecture complète
+app.add_middleware(BodySizeLimitMiddleware, limits={"/api/v1/profile/full": variables.upload_max_bytes + variables.upload_form_allowance})
+# Délestage (503) des requêtes dont l'attente estimée dépasse le timeout de leur route, avant la lecture de leur corps
+if variables.load_shedding:
+    app.add_middleware(LoadSheddingMiddleware, shedder=load_shedder, routes={
+        "/api/v1/strengths": ("light", 60.0),
+        "/api/v1/strengths/stream": ("light", 60.0),
+        "/api/v1/challenges": ("light", 60.0),
+        "/api/v1/challenges/stream": ("light", 60.0),
+        "/api/v1/goals": ("light", 60.0),
+        "/api/v1/goals/stream": ("light", 60.0),
+        "/api/v1/means": ("light", 60.0),
+        "/api/v1/means/stream": ("light", 60.0),
+        "/api/v1/plans/*": ("light", variables.plan_session_timeout),
+        "/api/v1/profile/full": ("full", 60.0),
+        "/api/v1/profile/full/stream": ("full", 300.0),
+    })
+# Durée des requêtes par route, y compris les rejets du middleware précédent
+app.add_middleware(MetricsMiddleware)
+
 # Créez le routeur principal pour regrouper tous les autres
 api_router = APIRouter(prefix="/api/v1")
 
@@ -44,10 +85,17 @@ api_router.include_router(challenges_router.router)
 api_router.include_router(goals_router.router)
 api_router.include_router(means_router.router)
 api_router.include_router(full_router.router)
+api_router.include_router(jobs_router.router)
+api_router.include_router(plans_router.router)
+api_router.include_router(batch_router.router)
+api_router.include_router(status_router.router)
 
 # Inclure le routeur principal dans l'application
 app.include_router(api_router)
 
+# Métriques Prometheus, à la racine comme le veut la convention des collecteurs
+app.include_router(metrics_router.router)
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Student Recommendation API! Access the documentation at /documentation"}
\ No newline at end of file
@@ -0,0 +1,69 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List, Literal, Any
+
+
+class BatchRequest(BaseModel):
+    """
+    Data model for the submission of a batch of recommendation queries.
+    """
+    # Modèle de données pour la soumission d'un lot de requêtes de recommandation.
+    type: Literal["strengths", "challenges", "needs", "goals", "means", "full"] = Field(
+        ...,
+        description="The type of recommendation to generate for every item of the batch.",
+        # Le type de recommandation à générer pour chaque élément du lot.
+        example="goals"
+    )
+    items: List[dict] = Field(
+        ...,
+        min_length=1,
+        description="The student profiles. Each item has the same fields as the request body of the corresponding endpoint (the form fields for 'full', 'needs' uses 'age' and 'description').",
+        # Les profils des étudiants. Chaque élément a les mêmes champs que le corps de la requête de l'endpoint correspondant.
+        example=[{"age": 21.5, "gender": "female", "challenges": ["Difficulty with time management"], "needs": []}]
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "type": "goals",
+                "items": [
+                    {"age": 21.5, "gender": "female", "challenges": ["Difficulty with time management"], "needs": []},
+                    {"age": 12, "gender": "male", "challenges": ["Anxiety before exams"], "needs": ["Stress management techniques"]}
+                ]
+            }
+        }
+
+
+class BatchJob(BaseModel):
+    """
+    Data model for the state of a batch job.
+    """
+    # Modèle de données pour l'état d'une tâche par lot.
+    id: str = Field(..., description="Identifier of the batch job.", example="4f1c2b7e-7d1a-4a8e-9b55-0b1f3c2d4e5f")
+    type: str = Field(..., description="The type of recommendation generated by the job.", example="goals")
+    status: Literal["submitted", "in_progress", "ended", "failed"] = Field(..., description="The state of the job.", example="in_progress")
+    total: int = Field(..., description="Number of items in the batch.", example=2)
+    succeeded: int = Field(0, description="Number of items whose recommendations are available.", example=0)
+    failed: int = Field(0, description="Number of items that could not be processed.", example=0)
+    created_at: float = Field(..., description="Submission time, as a UNIX timestamp.", example=1754556000.0)
+    message: Optional[str] = Field(None, description="Error message when the job failed.", example=None)
+
+
+class BatchItemResult(BaseModel):
+    """
+    Data model for the result of one item of a batch job.
+    """
+    # Modèle de données pour le résultat d'un élément d'une tâche par lot.
+    index: int = Field(..., description="Position of the item in the submitted batch.", example=0)
+    error: bool = Field(..., description="Indicates whether the item failed (True) or not (False).", example=False)
+    data: Optional[Any] = Field(None, description="The recommendations of the item, in the same format as the corresponding endpoint.")
+    message: Optional[str] = Field(None, description="Error message of the item.", example=None)
+
+
+class BatchResultsResponse(BaseModel):
+    """
+    Data model for a page of results of a batch job.
+    """
+    # Modèle de données pour une page de résultats d'une tâche par lot.
+    job: BatchJob
+    results: List[BatchItemResult] = Field(default_factory=list)
+    next_offset: Optional[int] = Field(None, description="Offset of the next page, or null when there is no more result.", example=None)
@@ -43,6 +43,7 @@ class Goal(BaseModel):
 class Mean(BaseModel):
     id: str = Field(..., example="f5e4d3c2-b1a0-9876-5432-10fedcba9876")
     description: str = Field(..., example="Use the Pomodoro Technique to structure study sessions.")
+    goal_id: Optional[str] = Field(None, description="Identifier of the goal served by this mean, when known.", example="a1b2c3d4-e5f6-7890-1234-567890abcdef")
 
 class FullResponseData(BaseModel):
     """
@@ -0,0 +1,26 @@
+from pydantic import BaseModel, Field
+from typing import Optional, Literal
+
+from models.full_models import FullResponseData
+
+
+class FullJob(BaseModel):
+    """
+    Data model for the state of a full profile job.
+    """
+    # Modèle de données pour l'état d'une tâche de profil complet.
+    id: str = Field(..., description="Identifier of the job.", example="4f1c2b7e-7d1a-4a8e-9b55-0b1f3c2d4e5f")
+    type: str = Field("full", description="The type of recommendation generated by the job.", example="full")
+    status: Literal["queued", "running", "succeeded", "failed"] = Field(..., description="The state of the job.", example="queued")
+    attempts: int = Field(0, description="Number of times a worker started the job (it is started again after a worker restart, or when the model API is unavailable).", example=0)
+    created_at: float = Field(..., description="Submission time, as a UNIX timestamp.", example=1754556000.0)
+    started_at: Optional[float] = Field(None, description="Start time of the last attempt, as a UNIX timestamp.", example=None)
+    finished_at: Optional[float] = Field(None, description="End time of the job, as a UNIX timestamp.", example=None)
+    data: Optional[FullResponseData] = Field(
+        None,
+        description="The full student profile, once the job has succeeded.",
+        # Le profil complet de l'étudiant, une fois la tâche réussie.
+    )
+    message: Optional[str] = Field(None, description="Error message when the job failed, or the sections that could not be generated.", example=None)
+    callback_url: Optional[str] = Field(None, description="URL receiving the job by POST once it is finished.", example=None)
+    callback_status: Optional[Literal["pending", "delivered", "failed"]] = Field(None, description="Delivery state of the callback.", example=None)
@@ -43,6 +43,18 @@ class MeansRequest(BaseModel):
         # Une liste des objectifs de l'étudiant pour lesquels des moyens doivent être recommandés. Ce champ est obligatoire.
         example=["Develop a weekly study schedule", "Learn relaxation techniques"]
     )
+    goal_ids: Optional[List[str]] = Field(
+        None,
+        description="The identifiers of the goals, in the order of 'goals'. This field is optional; with the fan-out mode, each mean is tagged with the identifier of the goal it serves.",
+        # Les identifiants des objectifs, dans l'ordre de 'goals'. Ce champ est facultatif ; en mode éclaté, chaque moyen porte l'identifiant de l'objectif qu'il sert.
+        example=["a1b2c3d4-e5f6-7890-1234-567890abcdef", "f5e4d3c2-b1a0-9876-5432-10fedcba9876"]
+    )
+    fan_out: Optional[bool] = Field(
+        None,
+        description="Generates the means of each goal with its own query, all goals concurrently, instead of a single query for all goals. Defaults to the ELSIA_MEANS_FAN_OUT setting of the server.",
+        # Génère les moyens de chaque objectif par une requête distincte, tous les objectifs en parallèle, au lieu d'une seule requête pour tous les objectifs.
+        example=True
+    )
     
     class Config:
         json_schema_extra = {
@@ -56,6 +68,15 @@ class MeansRequest(BaseModel):
             }
         }
 
+    @model_validator(mode='after')
+    def validate_goal_ids(cls, values):
+        """
+        Validates that 'goal_ids', when provided, has one identifier per goal.
+        """
+        if values.goal_ids is not None and len(values.goal_ids) != len(values.goals):
+            raise ValueError("'goal_ids' must have one identifier per goal.")
+        return values
+
 class Mean(BaseModel):
     """
     Data model for a single recommended mean.
@@ -74,6 +95,18 @@ class Mean(BaseModel):
         example="Use the Pomodoro Technique to structure study sessions."
         # Utiliser la Technique Pomodoro pour structurer les sessions d'étude.
     )
+    goal_id: Optional[str] = Field(
+        None,
+        description="Identifier of the goal served by this mean, when the goal identifiers are provided (fan-out mode).",
+        # Identifiant de l'objectif servi par ce moyen, lorsque les identifiants des objectifs sont fournis (mode éclaté).
+        example="a1b2c3d4-e5f6-7890-1234-567890abcdef"
+    )
+    goal: Optional[str] = Field(
+        None,
+        description="The goal served by this mean (fan-out mode).",
+        # L'objectif servi par ce moyen (mode éclaté).
+        example="Develop a weekly study schedule"
+    )
 
 class MeansResponse(BaseModel):
     """
@@ -97,8 +130,8 @@ class MeansResponse(BaseModel):
     )
     message: Optional[str] = Field(
         None, 
-        description="Detailed error message in case of a problem. This field is only present if 'error' is True.",
-        # Message d'erreur détaillé en cas de problème. Ce champ est présent uniquement si 'error' est True.
+        description="Detailed error message in case of a problem. With 'error' False, it lists the goals whose means could not be generated.",
+        # Message d'erreur détaillé en cas de problème. Si 'error' est False, il liste les objectifs dont les moyens n'ont pu être générés.
         example=None
     )
     
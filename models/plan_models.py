@@ -0,0 +1,123 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, List, Literal
+
+from models.goals_models import Goal
+from models.means_models import Mean
+
+
+class PlanGoal(BaseModel):
+    """
+    Data model for a goal of an intervention plan, as edited by the professional.
+    """
+    # Modèle de données pour un objectif d'un plan d'intervention, tel que modifié par le professionnel.
+    id: Optional[str] = Field(
+        None,
+        description="Identifier of the goal. Keep the identifier returned for an existing goal; a new goal may omit it.",
+        # Identifiant de l'objectif. Conserver l'identifiant retourné pour un objectif existant ; un nouvel objectif peut l'omettre.
+        example="a1b2c3d4-e5f6-7890-1234-567890abcdef"
+    )
+    description: str = Field(
+        ...,
+        min_length=1,
+        description="The description of the goal.",
+        # La description de l'objectif.
+        example="Develop a weekly study schedule to improve time management."
+    )
+
+
+class PlanRequest(BaseModel):
+    """
+    Data model for the submission of an intervention plan.
+    """
+    # Modèle de données pour la soumission d'un plan d'intervention.
+    age: Optional[float] = Field(
+        None,
+        description="The student's age in years. This field is optional.",
+        # L'âge de l'étudiant en années. Ce champ est facultatif.
+        example=21.5
+    )
+    gender: Literal["male", "female", "other", "undefined"] = Field(
+        "undefined",
+        description="The student's gender. Must be one of: 'male', 'female', 'other', or 'undefined'.",
+        # Le sexe de l'étudiant. Doit être l'un des suivants : 'male', 'female', 'other', ou 'undefined'.
+        example="female"
+    )
+    strengths: Optional[List[str]] = Field(
+        None,
+        description="A list of the student's strengths. This field is optional.",
+        # Une liste des forces de l'étudiant. Ce champ est facultatif.
+        example=["Strong teamwork skills"]
+    )
+    challenges: Optional[List[str]] = Field(
+        None,
+        description="A list of the student's challenges. At least one of 'challenges' or 'needs' must be provided.",
+        # Une liste des défis de l'étudiant. Au moins un des champs 'challenges' ou 'needs' doit être fourni.
+        example=["Difficulty with time management", "Anxiety before exams"]
+    )
+    needs: Optional[List[str]] = Field(
+        None,
+        description="A list of the student's needs. At least one of 'challenges' or 'needs' must be provided.",
+        # Une liste des besoins de l'étudiant. Au moins un des champs 'challenges' ou 'needs' doit être fourni.
+        example=["Stress management techniques"]
+    )
+    goals: Optional[List[PlanGoal]] = Field(
+        None,
+        description="The goals of the plan, as edited by the professional. When omitted, the goals are recommended from the profile, and recommended again only when the profile changes.",
+        # Les objectifs du plan, tels que modifiés par le professionnel. S'ils sont omis, les objectifs sont recommandés à partir du profil, et recommandés à nouveau seulement lorsque le profil change.
+        example=[{"id": "a1b2c3d4-e5f6-7890-1234-567890abcdef", "description": "Develop a weekly study schedule to improve time management."}]
+    )
+
+    @model_validator(mode='after')
+    def validate_challenges_or_needs(cls, values):
+        """
+        Validates that at least one of 'challenges' or 'needs' is provided.
+        """
+        if not (values.challenges or values.needs):
+            raise ValueError("At least one of 'challenges' or 'needs' must be provided.")
+        return values
+
+
+class PlanChanges(BaseModel):
+    """
+    Data model for the stages recomputed by a submission of a plan.
+    """
+    # Modèle de données pour les étapes recalculées lors d'une soumission d'un plan.
+    goals: bool = Field(..., description="Whether the goals were recommended again.", example=False)
+    means_goal_ids: List[str] = Field(..., description="Identifiers of the goals whose means were generated again; the means of the other goals were kept.", example=["a1b2c3d4-e5f6-7890-1234-567890abcdef"])
+    removed_goal_ids: List[str] = Field(..., description="Identifiers of the goals removed since the previous submission, with their means.", example=[])
+
+
+class PlanData(BaseModel):
+    """
+    Data model for the recommendations of an intervention plan.
+    """
+    # Modèle de données pour les recommandations d'un plan d'intervention.
+    plan_id: str = Field(..., description="Identifier of the plan.", example="plan-42")
+    goals: List[Goal] = Field(..., description="The goals of the plan.")
+    means: List[Mean] = Field(..., description="The means of the goals, each tagged with the `goal_id` it serves.")
+    recomputed: Optional[PlanChanges] = Field(None, description="The stages recomputed by the last submission.")
+    updated_at: Optional[float] = Field(None, description="Time of the last submission, as a UNIX timestamp.", example=1754556000.0)
+
+
+class PlanResponse(BaseModel):
+    """
+    Data model for the intervention plan response.
+    """
+    # Modèle de données pour la réponse d'un plan d'intervention.
+    data: Optional[PlanData] = Field(
+        None,
+        description="The recommendations of the plan. This field is present in case of success.",
+        # Les recommandations du plan. Ce champ est présent en cas de succès.
+    )
+    error: bool = Field(
+        ...,
+        description="Indicates whether an internal error occurred (True) or not (False).",
+        # Indique si une erreur interne est survenue (True) ou non (False).
+        example=False
+    )
+    message: Optional[str] = Field(
+        None,
+        description="Detailed error message, or the goals whose means could not be generated.",
+        # Message d'erreur détaillé, ou les objectifs dont les moyens n'ont pas pu être générés.
+        example=None
+    )
@@ -0,0 +1,218 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+
+from recommendations.resilience import UpstreamUnavailableError, remaining_time
+
+import utils.variables as variables
+
+
+# Priority classes of the model calls: the lowest value is admitted first.
+# Classes de priorité des appels au modèle : la plus petite valeur est admise en premier.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_FULL = 1
+PRIORITY_BATCH = 2
+
+request_priority: contextvars.ContextVar[int] = contextvars.ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+
+class AdmissionRejectedError(UpstreamUnavailableError):
+    """
+    Raised when a model call is shed because the admission queue of its priority class is full.
+    """
+    # Levée lorsqu'un appel au modèle est rejeté parce que la file d'attente de sa classe de priorité est pleine.
+
+
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    """
+    Converts an RFC 3339 `anthropic-ratelimit-*-reset` header into a number of seconds from now.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() - time.time())
+    except ValueError:
+        return None
+
+
+class AdmissionController:
+    """
+    Process-wide admission controller for the calls to the Claude API.
+    The concurrency limit is sized from the `anthropic-ratelimit-*-remaining` response headers (requests,
+    input tokens, output tokens); calls wait in a priority queue while the budget is exhausted, and are shed
+    when the queue of their priority class is full. It must only be used from the event loop of the worker.
+    """
+    # Contrôleur d'admission des appels à l'API Claude, partagé par tout le processus.
+
+    def __init__(self, max_concurrency: int = 32, min_concurrency: int = 1, max_queue: int = 200):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_queue = max_queue
+        self.limit = max_concurrency
+        self._in_flight = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._remaining = {"requests": None, "input_tokens": None, "output_tokens": None}
+        self._average_input_tokens = 2000.0
+        self._average_output_tokens = 1000.0
+        self._counters = {"admitted": 0, "waited": 0, "shed": 0, "rate_limited": 0}
+
+    def _queue_limit(self, priority: int) -> int:
+        # Les classes moins prioritaires sont rejetées plus tôt.
+        return max(1, self.max_queue >> priority)
+
+    def _can_admit(self) -> bool:
+        if time.monotonic() < self._paused_until:
+            return False
+        return self._in_flight < self.limit
+
+    def _dispatch(self) -> None:
+        while self._waiters and self._can_admit():
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._in_flight += 1
+            self._counters["admitted"] += 1
+            future.set_result(None)
+        if self._waiters and self._wakeup is None and time.monotonic() < self._paused_until:
+            loop = asyncio.get_running_loop()
+            self._wakeup = loop.call_later(self._paused_until - time.monotonic(), self._on_wakeup)
+
+    def _on_wakeup(self) -> None:
+        self._wakeup = None
+        self._dispatch()
+
+    async def acquire(self, priority: int) -> None:
+        """
+        Waits for a slot for a model call of the given priority class.
+        :raises AdmissionRejectedError: If the queue of the priority class is full.
+        :raises asyncio.TimeoutError: If the deadline of the request expires while waiting.
+        """
+        if not self._waiters and self._can_admit():
+            self._in_flight += 1
+            self._counters["admitted"] += 1
+            return
+
+        # Seuls les appels de même priorité ou plus urgents passent avant celui-ci.
+        queued = sum(1 for waiter in self._waiters if waiter[0] <= priority and not waiter[2].done())
+        if queued >= self._queue_limit(priority):
+            self._counters["shed"] += 1
+            raise AdmissionRejectedError("The recommendation service is overloaded, please retry later.", retry_after=self._retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._counters["waited"] += 1
+        self._dispatch()
+        try:
+            timeout = remaining_time()
+            await asyncio.wait_for(asyncio.shield(future), timeout=max(0.0, timeout) if timeout is not None else None)
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Le créneau a été accordé pendant l'annulation : il est rendu.
+                self.release()
+            else:
+                future.cancel()
+            raise
+
+    def release(self) -> None:
+        """
+        Frees the slot of a finished model call.
+        """
+        self._in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[int] = None, input_tokens: Optional[int] = None):
+        """
+        Holds a slot for the duration of a model call.
+        :param priority: The priority class of the call, by default the one of the current request.
+        :param input_tokens: The estimated number of input tokens of the call.
+        """
+        if input_tokens:
+            self._average_input_tokens = 0.9 * self._average_input_tokens + 0.1 * input_tokens
+        await self.acquire(request_priority.get() if priority is None else priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def record_output_tokens(self, output_tokens: int) -> None:
+        """
+        Updates the average number of output tokens of a call, used to size the limit from the token budget.
+        """
+        self._average_output_tokens = 0.9 * self._average_output_tokens + 0.1 * output_tokens
+
+    def update_from_headers(self, headers) -> None:
+        """
+        Resizes the concurrency limit from the `anthropic-ratelimit-*` headers of a response.
+        When a budget is exhausted, admissions are paused until it resets.
+        """
+        if not headers:
+            return
+        capacity = None
+        resets = []
+        for name, average in (("requests", 1.0), ("input_tokens", self._average_input_tokens), ("output_tokens", self._average_output_tokens)):
+            value = headers.get(f"anthropic-ratelimit-{name.replace('_', '-')}-remaining")
+            if value is None:
+                continue
+            try:
+                remaining = int(value)
+            except ValueError:
+                continue
+            self._remaining[name] = remaining
+            allowed = remaining / max(average, 1.0)
+            capacity = allowed if capacity is None else min(capacity, allowed)
+            reset = _parse_reset(headers.get(f"anthropic-ratelimit-{name.replace('_', '-')}-reset"))
+            if allowed < 1 and reset is not None:
+                resets.append(reset)
+
+        if capacity is None:
+            return
+        if capacity < 1:
+            self._paused_until = max(self._paused_until, time.monotonic() + (min(resets) if resets else 1.0))
+            self.limit = self.min_concurrency
+        else:
+            self.limit = int(max(self.min_concurrency, min(self.max_concurrency, capacity)))
+        self._dispatch()
+
+    def on_rate_limited(self, retry_after: Optional[float]) -> None:
+        """
+        Halves the concurrency limit and pauses the admissions after a 429 response.
+        """
+        self._counters["rate_limited"] += 1
+        self.limit = max(self.min_concurrency, self.limit // 2)
+        self._paused_until = max(self._paused_until, time.monotonic() + (retry_after if retry_after is not None else 1.0))
+
+    def _retry_after(self) -> float:
+        return max(1.0, self._paused_until - time.monotonic())
+
+    def status(self) -> dict:
+        """
+        Returns the limit, the in-flight and queued calls, the last known budgets and the counters of the controller.
+        """
+        queued = {}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                queued[priority] = queued.get(priority, 0) + 1
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "queued": {"interactive": queued.get(PRIORITY_INTERACTIVE, 0), "full": queued.get(PRIORITY_FULL, 0), "batch": queued.get(PRIORITY_BATCH, 0)},
+            "paused_for": max(0.0, self._paused_until - time.monotonic()),
+            "remaining": dict(self._remaining),
+            **self._counters,
+        }
+
+
+admission = AdmissionController(
+    max_concurrency=variables.admission_max_concurrency,
+    min_concurrency=variables.admission_min_concurrency,
+    max_queue=variables.admission_max_queue,
+)
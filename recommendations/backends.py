@@ -0,0 +1,290 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Optional
+
+import anthropic
+import httpx
+from anthropic.types.beta import BetaMessage, BetaTextBlock, BetaToolUseBlock, BetaUsage
+
+import utils.variables as variables
+
+
+class AnthropicBackend:
+    """
+    Calls the Anthropic API. The clients are created on first use, so that importing the service
+    does not read `./api_key.json` when another backend is configured.
+    """
+    # Appelle l'API d'Anthropic ; les clients sont créés à la première utilisation.
+
+    name = "anthropic"
+
+    def __init__(self, api_key_path: str = "./api_key.json"):
+        self.api_key_path = api_key_path
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def _load_api_key(self) -> None:
+        # La variable d'environnement ANTHROPIC_API_KEY est utilisée lorsque le fichier est absent.
+        if not os.path.exists(self.api_key_path) and os.getenv("ANTHROPIC_API_KEY"):
+            return
+        with open(self.api_key_path, 'r', encoding="utf-8") as file:
+            os.environ['ANTHROPIC_API_KEY'] = json.load(file)['Claude']
+
+    @property
+    def client(self) -> anthropic.Anthropic:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._load_api_key()
+                    # Retries are handled by recommendations.resilience (backoff, deadline, circuit breaker), not by the SDK.
+                    # Les relances sont gérées par recommendations.resilience (backoff, échéance, disjoncteur), et non par le SDK.
+                    self._client = anthropic.Anthropic(max_retries=0)
+        return self._client
+
+    @property
+    def async_client(self) -> anthropic.AsyncAnthropic:
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._load_api_key()
+                    # Shared asynchronous client: a single connection pool with keep-alive for every router.
+                    # Client asynchrone partagé : un seul pool de connexions (keep-alive) pour tous les routeurs.
+                    self._async_client = anthropic.AsyncAnthropic(
+                        http_client=anthropic.DefaultAsyncHttpxClient(
+                            limits=httpx.Limits(
+                                max_connections=variables.llm_max_connections,
+                                max_keepalive_connections=variables.llm_max_keepalive_connections,
+                                keepalive_expiry=variables.llm_keepalive_expiry,
+                            ),
+                        ),
+                        max_retries=0,
+                    )
+        return self._async_client
+
+    def create(self, request: dict, timeout: Optional[float] = None):
+        """
+        Performs a blocking call to the Messages API and returns the message.
+        """
+        return self.client.beta.messages.create(**request, timeout=timeout)
+
+    async def create_async(self, request: dict, timeout: Optional[float] = None, stream: bool = False) -> tuple:
+        """
+        Performs a call to the Messages API.
+        :return: A tuple (message, or event stream when `stream` is True; HTTP headers of the response).
+        """
+        kwargs = {"stream": True} if stream else {}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        raw = await self.async_client.beta.messages.with_raw_response.create(**request, **kwargs)
+        return await raw.parse(), raw.headers
+
+    async def upload_file(self, filename: str, data: bytes, media_type: str, timeout: Optional[float] = None) -> str:
+        """
+        Uploads a document to the Files API and returns its `file_id`.
+        """
+        metadata = await self.async_client.beta.files.upload(file=(filename, data, media_type), betas=["files-api-2025-04-14"], timeout=timeout)
+        return metadata.id
+
+    async def close(self) -> None:
+        """
+        Closes the HTTP connection pools of the clients that were created.
+        """
+        if self._async_client is not None:
+            await self._async_client.close()
+        if self._client is not None:
+            self._client.close()
+
+
+def parse_latency(specification: str):
+    """
+    Parses a latency distribution, in seconds: "fixed:0.5", "uniform:0.2,1.0",
+    "lognormal:0.5,0.4" (median, sigma) or "exponential:0.5" (mean).
+    :return: A function drawing a latency from a `random.Random`.
+    :raises ValueError: If the specification is invalid.
+    """
+    kind, _, arguments = specification.partition(":")
+    values = [float(value) for value in arguments.split(",") if value.strip()]
+    if kind == "fixed" and len(values) == 1:
+        return lambda generator: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda generator: generator.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        return lambda generator: generator.lognormvariate(math.log(values[0]), values[1])
+    if kind == "exponential" and len(values) == 1:
+        return lambda generator: generator.expovariate(1.0 / values[0])
+    raise ValueError(f"Invalid latency distribution: {specification!r}")
+
+
+class _FakeStream:
+    """
+    Event stream of the fake backend, with the events of the streaming Messages API read by `stream_query`.
+    """
+
+    def __init__(self, message: BetaMessage, first_token_delay: float, chunk_delay: float, chunk_size: int):
+        self.message = message
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        usage = self.message.usage
+        yield SimpleNamespace(type="message_start", message=SimpleNamespace(usage=usage.model_copy(update={"output_tokens": 0})))
+        await asyncio.sleep(self.first_token_delay)
+        text = self.message.content[0].text
+        for start in range(0, len(text), self.chunk_size):
+            if start:
+                await asyncio.sleep(self.chunk_delay)
+            yield SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(type="text_delta", text=text[start:start + self.chunk_size]))
+        yield SimpleNamespace(type="message_delta", usage=SimpleNamespace(output_tokens=usage.output_tokens))
+        yield SimpleNamespace(type="message_stop")
+
+
+class FakeBackend:
+    """
+    Deterministic stand-in for the Anthropic API, for load tests and local runs without API credit.
+    The answers depend only on the query: valid `<output>` payloads (a dictionary of the five sections for the
+    full profile, a list otherwise). The latency follows a configurable distribution, a fraction of the calls
+    fail with a retryable 529 error, and the streamed calls send their text in chunks.
+    """
+    # Remplaçant déterministe de l'API d'Anthropic, pour les tests de charge sans crédit d'API.
+
+    name = "fake"
+
+    def __init__(self, latency: str = "lognormal:0.5,0.3", error_rate: float = 0.0, chunk_delay: float = 0.02,
+                 chunk_size: int = 16, seed: int = 0, items: int = 3):
+        self.draw_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.items = items
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self) -> tuple:
+        with self._lock:
+            return max(0.0, self.draw_latency(self._random)), self._random.random() < self.error_rate
+
+    def payload(self, request: dict):
+        """
+        Returns the deterministic output of a query: a dictionary of the five sections for the full profile, a list otherwise.
+        """
+        messages = request.get("messages") or []
+        prompt = json.dumps(messages, sort_keys=True, ensure_ascii=False)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        items = [f"Recommendation {digest}-{index}" for index in range(self.items)]
+        content = messages[-1].get("content") if messages else None
+        documents = sum(1 for block in content if block.get("type") == "document") if isinstance(content, list) else 0
+        # La requête du profil complet est la seule à joindre plusieurs documents de référence.
+        if documents > 1:
+            return {key: items for key in ("strengths", "challenges", "needs", "goals", "means")}
+        return items
+
+    def answer(self, request: dict) -> str:
+        """
+        Returns the deterministic answer of a query, in the format expected by `process_response`.
+        """
+        return "<output>" + json.dumps(self.payload(request)) + "</output>"
+
+    def _message(self, request: dict) -> BetaMessage:
+        tool_choice = request.get("tool_choice") or {}
+        if tool_choice.get("type") == "tool":
+            # Sortie structurée : l'entrée de l'outil imposé porte la réponse.
+            payload = self.payload(request)
+            tool_input = payload if isinstance(payload, dict) else {"items": payload}
+            text = json.dumps(tool_input)
+            content = [BetaToolUseBlock(type="tool_use", id=f"toolu_fake_{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}",
+                                        name=tool_choice["name"], input=tool_input)]
+            stop_reason = "tool_use"
+        else:
+            text = self.answer(request)
+            content = [BetaTextBlock(type="text", text=text)]
+            stop_reason = "end_turn"
+        return BetaMessage(
+            id=f"msg_fake_{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}",
+            type="message",
+            role="assistant",
+            model=request.get("model", "fake"),
+            content=content,
+            stop_reason=stop_reason,
+            stop_sequence=None,
+            usage=BetaUsage(input_tokens=len(json.dumps(request.get("messages"))) // 4, output_tokens=len(text) // 4,
+                            cache_creation_input_tokens=0, cache_read_input_tokens=0),
+        )
+
+    def _generation_time(self, message: BetaMessage) -> float:
+        return self.chunk_delay * max(0, math.ceil(message.usage.output_tokens * 4 / self.chunk_size) - 1)
+
+    @staticmethod
+    def _overloaded() -> anthropic.APIStatusError:
+        request = httpx.Request("POST", "https://fake.invalid/v1/messages")
+        return anthropic.InternalServerError("Overloaded (fake backend).", response=httpx.Response(529, request=request), body=None)
+
+    @staticmethod
+    def _timed_out() -> anthropic.APITimeoutError:
+        return anthropic.APITimeoutError(request=httpx.Request("POST", "https://fake.invalid/v1/messages"))
+
+    def create(self, request: dict, timeout: Optional[float] = None):
+        latency, failed = self._draw()
+        message = self._message(request)
+        delay = latency + self._generation_time(message)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise self._timed_out()
+        time.sleep(delay)
+        if failed:
+            raise self._overloaded()
+        return message
+
+    async def create_async(self, request: dict, timeout: Optional[float] = None, stream: bool = False) -> tuple:
+        latency, failed = self._draw()
+        message = self._message(request)
+        if stream:
+            # Le délai avant le premier token est tiré de la distribution ; le texte suit au rythme des morceaux.
+            if failed:
+                await asyncio.sleep(min(latency, timeout) if timeout is not None else latency)
+                raise self._overloaded()
+            return _FakeStream(message, latency, self.chunk_delay, self.chunk_size), {}
+        delay = latency + self._generation_time(message)
+        if timeout is not None and delay > timeout:
+            await asyncio.sleep(timeout)
+            raise self._timed_out()
+        await asyncio.sleep(delay)
+        if failed:
+            raise self._overloaded()
+        return message, {}
+
+    async def upload_file(self, filename: str, data: bytes, media_type: str, timeout: Optional[float] = None) -> str:
+        return f"file_fake_{hashlib.sha256(data).hexdigest()[:24]}"
+
+    async def close(self) -> None:
+        return None
+
+
+def make_backend():
+    """
+    Builds the model backend configured by `ELSIA_LLM_BACKEND` ("anthropic" or "fake").
+    """
+    if variables.llm_backend == "fake":
+        return FakeBackend(
+            latency=variables.fake_llm_latency,
+            error_rate=variables.fake_llm_error_rate,
+            chunk_delay=variables.fake_llm_chunk_delay,
+            seed=variables.fake_llm_seed,
+        )
+    if variables.llm_backend == "anthropic":
+        return AnthropicBackend()
+    raise ValueError(f"Unknown model backend: {variables.llm_backend!r}")
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from typing import List, Optional
+
+import recommendations.init
+from recommendations.admission import PRIORITY_BATCH, admission
+from recommendations.prompt_registry import prompt_registry
+from models.challenges_models import ChallengesRequest
+from models.full_models import FullRequestBaseModel
+from models.goals_models import GoalsRequest
+from models.means_models import MeansRequest
+from models.strengths_models import StrengthsRequest
+from recommendations.generate_challenges import ChallengesRecommendation
+from recommendations.generate_full import FullRecommendation
+from recommendations.generate_goals import GoalsRecommendation
+from recommendations.generate_means import MeansRecommendation
+from recommendations.generate_needs import NeedRecommendation
+from recommendations.generate_strengths import StrengthsRecommendation
+
+import utils.variables as variables
+
+
+# For every type: the request model of an item, the recommendation class and the builder of the query parameters.
+# Pour chaque type : le modèle de requête d'un élément, la classe de recommandation et la construction des paramètres.
+BATCH_TYPES = {
+    "strengths": (StrengthsRequest, StrengthsRecommendation,
+                  lambda recommender, item, n: recommender.build_batch_request(item.age, item.description, n)),
+    "challenges": (ChallengesRequest, ChallengesRecommendation,
+                   lambda recommender, item, n: recommender.build_batch_request(item.age, item.description, n)),
+    "needs": (ChallengesRequest, NeedRecommendation,
+              lambda recommender, item, n: recommender.build_batch_request(item.age, item.description, n)),
+    "goals": (GoalsRequest, GoalsRecommendation,
+              lambda recommender, item, n: recommender.build_batch_request(item.age, item.gender, item.strengths, item.challenges, item.needs, n)),
+    "means": (MeansRequest, MeansRecommendation,
+              lambda recommender, item, n: recommender.build_batch_request(item.age, item.gender, item.strengths, item.challenges, item.needs, item.goals, n)),
+    "full": (FullRequestBaseModel, FullRecommendation,
+             lambda recommender, item, n: recommender.build_batch_request(item.age, item.gender, item.description or "", n)),
+}
+
+
+class BatchJobStore:
+    """
+    SQLite persistence of the batch jobs and of their results, shared by all the uvicorn workers.
+    """
+    # Persistance SQLite des tâches par lot et de leurs résultats, partagée par tous les workers uvicorn.
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS batch_jobs ("
+                "id TEXT PRIMARY KEY, type TEXT NOT NULL, batch_id TEXT, status TEXT NOT NULL, total INTEGER NOT NULL, "
+                "succeeded INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, message TEXT)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS batch_results ("
+                "job_id TEXT NOT NULL, item_index INTEGER NOT NULL, error INTEGER NOT NULL, data TEXT, message TEXT, "
+                "PRIMARY KEY (job_id, item_index))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=10.0)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def create_job(self, job_type: str, total: int) -> dict:
+        job = {"id": str(uuid.uuid4()), "type": job_type, "batch_id": None, "status": "submitted", "total": total,
+               "succeeded": 0, "failed": 0, "created_at": time.time(), "message": None}
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT INTO batch_jobs (id, type, batch_id, status, total, succeeded, failed, created_at, message) "
+                "VALUES (:id, :type, :batch_id, :status, :total, :succeeded, :failed, :created_at, :message)",
+                job,
+            )
+        return job
+
+    def update_job(self, job_id: str, **fields) -> None:
+        assignments = ", ".join(f"{name} = :{name}" for name in fields)
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.execute(f"UPDATE batch_jobs SET {assignments} WHERE id = :id", {**fields, "id": job_id})
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        with closing(self._connect()) as connection, connection:
+            row = connection.execute("SELECT * FROM batch_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def save_results(self, job_id: str, results: List[dict]) -> None:
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO batch_results (job_id, item_index, error, data, message) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, result["index"], int(result["error"]), json.dumps(result.get("data"), ensure_ascii=False), result.get("message"))
+                 for result in results],
+            )
+
+    def get_results(self, job_id: str, offset: int = 0, limit: int = 100) -> List[dict]:
+        with closing(self._connect()) as connection, connection:
+            rows = connection.execute(
+                "SELECT item_index, error, data, message FROM batch_results WHERE job_id = ? ORDER BY item_index LIMIT ? OFFSET ?",
+                (job_id, limit, offset),
+            ).fetchall()
+        return [{"index": row["item_index"], "error": bool(row["error"]), "data": json.loads(row["data"]) if row["data"] else None,
+                 "message": row["message"]} for row in rows]
+
+
+batch_store = BatchJobStore(variables.batch_store_path)
+
+
+def validate_items(job_type: str, items: List[dict]) -> list:
+    """
+    Validates the items of a batch with the request model of their type.
+    :raises ValueError: If an item is not valid, with the position of the item in the message.
+    """
+    request_model = BATCH_TYPES[job_type][0]
+    validated = []
+    for index, item in enumerate(items):
+        try:
+            validated.append(request_model(**item))
+        except Exception as e:
+            raise ValueError(f"Item {index} is not a valid '{job_type}' request: {e}")
+    return validated
+
+
+async def submit_batch(job_type: str, items: List[dict], number_items: int = 10) -> dict:
+    """
+    Submits the items as a single Message Batch and records the job.
+    :param job_type: The type of recommendation to generate.
+    :param items: The request bodies of the items.
+    :param number_items: The number of recommendations per item.
+    :return: The recorded job.
+    """
+    _, recommender_class, build = BATCH_TYPES[job_type]
+    validated = validate_items(job_type, items)
+    recommender = prompt_registry.recommender(recommender_class)
+
+    requests = []
+    betas = None
+    for index, item in enumerate(validated):
+        params = build(recommender, item, number_items)
+        betas = params.pop("betas", None)
+        requests.append({"custom_id": f"item-{index}", "params": params})
+
+    job = await asyncio.to_thread(batch_store.create_job, job_type, len(requests))
+    try:
+        async with admission.slot(PRIORITY_BATCH):
+            batch = await recommendations.init.get_async_client().beta.messages.batches.create(requests=requests, betas=betas)
+    except Exception as e:
+        await asyncio.to_thread(batch_store.update_job, job["id"], status="failed", message=str(e))
+        raise
+    await asyncio.to_thread(batch_store.update_job, job["id"], batch_id=batch.id, status="in_progress")
+    return await asyncio.to_thread(batch_store.get_job, job["id"])
+
+
+async def refresh_job(job_id: str) -> Optional[dict]:
+    """
+    Polls the Message Batch of a job, and stores the post-processed results once the batch has ended.
+    :param job_id: The identifier of the job.
+    :return: The up-to-date job, or None if it does not exist.
+    """
+    job = await asyncio.to_thread(batch_store.get_job, job_id)
+    if job is None or job["status"] != "in_progress":
+        return job
+
+    batch = await recommendations.init.get_async_client().beta.messages.batches.retrieve(job["batch_id"])
+    if batch.processing_status != "ended":
+        counts = batch.request_counts
+        await asyncio.to_thread(batch_store.update_job, job_id, succeeded=counts.succeeded, failed=counts.errored + counts.canceled + counts.expired)
+        return await asyncio.to_thread(batch_store.get_job, job_id)
+
+    recommender = prompt_registry.recommender(BATCH_TYPES[job["type"]][1])
+    results = []
+    async for entry in await recommendations.init.get_async_client().beta.messages.batches.results(job["batch_id"]):
+        index = int(entry.custom_id.split("-", 1)[1])
+        if entry.result.type == "succeeded":
+            recommendations.init.record_usage(entry.result.message.usage)
+            result = recommender.format_batch_result(recommendations.init.extract_text(entry.result.message))
+        else:
+            result = {"error": True, "data": None, "message": f"Batch item {entry.result.type}."}
+        results.append({"index": index, **result})
+        if len(results) >= 500:
+            await asyncio.to_thread(batch_store.save_results, job_id, results)
+            results = []
+    await asyncio.to_thread(batch_store.save_results, job_id, results)
+
+    stored = await asyncio.to_thread(batch_store.get_results, job_id, 0, job["total"])
+    succeeded = len([result for result in stored if not result["error"]])
+    await asyncio.to_thread(batch_store.update_job, job_id, status="ended", succeeded=succeeded, failed=job["total"] - succeeded)
+    return await asyncio.to_thread(batch_store.get_job, job_id)
@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Optional
+
+import utils.variables as variables
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of the Claude responses.
+    An in-memory LRU tier with TTL, optionally backed by a SQLite file shared by all the uvicorn workers.
+    """
+    # Cache des réponses de Claude adressé par contenu : un niveau LRU en mémoire avec TTL,
+    # et optionnellement un fichier SQLite partagé par tous les workers uvicorn.
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400.0, sqlite_path: Optional[str] = None):
+        """
+        Initializes the cache.
+        :param max_entries: Maximum number of responses kept in memory.
+        :param ttl_seconds: Lifetime of a cached response, in seconds.
+        :param sqlite_path: Path of the SQLite database of the shared tier, disabled if None.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.sqlite_path = sqlite_path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "bypasses": 0}
+
+        if self.sqlite_path:
+            directory = os.path.dirname(self.sqlite_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with closing(self._connect()) as connection, connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.sqlite_path, timeout=5.0)
+
+    @staticmethod
+    def make_key(request: dict) -> str:
+        """
+        Computes the key of a request to the Claude model.
+        The rendered prompt and the document file_ids are part of the messages, so they are covered by the hash.
+        :param request: The parameters of the Messages API call.
+        :return: The SHA-256 hex digest identifying the request.
+        """
+        payload = json.dumps(
+            {"model": request.get("model"), "max_tokens": request.get("max_tokens"), "messages": request.get("messages")},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _get_memory(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return value
+                del self._entries[key]
+        return None
+
+    def _get_disk(self, key: str, now: float) -> Optional[str]:
+        """
+        Reads the SQLite tier, then counts the disk hit or the miss. Blocking: called off the event loop by `get_async`.
+        """
+        if self.sqlite_path:
+            with closing(self._connect()) as connection:
+                row = connection.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] <= self.ttl_seconds:
+                self._remember(key, row[0], row[1])
+                with self._lock:
+                    self._counters["disk_hits"] += 1
+                return row[0]
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the cached response for the key, or None when it is missing or expired.
+        """
+        now = time.time()
+        value = self._get_memory(key, now)
+        return value if value is not None else self._get_disk(key, now)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """
+        Same as `get`, with the SQLite tier read in a worker thread, off the event loop.
+        """
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        if not self.sqlite_path:
+            return self._get_disk(key, now)
+        return await asyncio.to_thread(self._get_disk, key, now)
+
+    def _set_memory(self, key: str, value: str) -> tuple:
+        created_at = time.time()
+        self._remember(key, value, created_at)
+        with self._lock:
+            self._counters["stores"] += 1
+            prune = self._counters["stores"] % 100 == 0
+        return created_at, prune
+
+    def _set_disk(self, key: str, value: str, created_at: float, prune: bool) -> None:
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, created_at),
+            )
+            # Purge régulière des entrées expirées du fichier partagé
+            if prune:
+                connection.execute("DELETE FROM responses WHERE created_at < ?", (created_at - self.ttl_seconds,))
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Stores a response in every tier of the cache.
+        """
+        created_at, prune = self._set_memory(key, value)
+        if self.sqlite_path:
+            self._set_disk(key, value, created_at, prune)
+
+    async def set_async(self, key: str, value: str) -> None:
+        """
+        Same as `set`, with the SQLite tier written in a worker thread, off the event loop.
+        """
+        created_at, prune = self._set_memory(key, value)
+        if self.sqlite_path:
+            await asyncio.to_thread(self._set_disk, key, value, created_at, prune)
+
+    def _remember(self, key: str, value: str, created_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, created_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_bypass(self) -> None:
+        """
+        Counts a request that explicitly skipped the cache.
+        """
+        with self._lock:
+            self._counters["bypasses"] += 1
+
+    def clear(self) -> None:
+        """
+        Removes every entry from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+        if self.sqlite_path:
+            with closing(self._connect()) as connection, connection:
+                connection.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters of the cache.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._entries)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["enabled"] = variables.cache_enabled
+        stats["persistent"] = bool(self.sqlite_path)
+        return stats
+
+
+def bypass_requested(cache_control: Optional[str]) -> bool:
+    """
+    Tells whether the client asked to skip the cache with a `Cache-Control: no-cache` (or `no-store`) header.
+    """
+    if not cache_control:
+        return False
+    directives = {directive.strip().lower() for directive in cache_control.split(",")}
+    return bool(directives & {"no-cache", "no-store"})
+
+
+response_cache = ResponseCache(
+    max_entries=variables.cache_max_entries,
+    ttl_seconds=variables.cache_ttl_seconds,
+    sqlite_path=variables.cache_sqlite_path or None,
+)
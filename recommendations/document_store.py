@@ -0,0 +1,240 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Optional
+
+import recommendations.init
+from recommendations.extraction import CHARACTERS_PER_TOKEN, extract_text
+
+import utils.variables as variables
+
+
+class SqliteDocumentStore:
+    """
+    Content-addressed store of the uploaded documents in a SQLite file shared by all the uvicorn workers.
+    Every document is identified by the SHA-256 of its bytes and holds its extracted text and, optionally,
+    its Anthropic Files API `file_id`. The least recently used documents are evicted beyond `max_bytes` of text.
+    """
+    # Stockage des documents envoyés, adressé par leur SHA-256, dans un fichier SQLite partagé par les workers.
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "sha256 TEXT PRIMARY KEY, text TEXT, max_tokens INTEGER, truncated INTEGER NOT NULL DEFAULT 0, "
+                "file_id TEXT, size INTEGER NOT NULL DEFAULT 0, last_used_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=10.0)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def get(self, sha256: str) -> Optional[dict]:
+        """
+        Returns the record of a document (text, max_tokens, truncated, file_id), or None if it is unknown.
+        """
+        with self._lock, closing(self._connect()) as connection, connection:
+            row = connection.execute("SELECT text, max_tokens, truncated, file_id FROM documents WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            connection.execute("UPDATE documents SET last_used_at = ? WHERE sha256 = ?", (time.time(), sha256))
+        self._counters["hits"] += 1
+        return {"text": row["text"], "max_tokens": row["max_tokens"], "truncated": bool(row["truncated"]), "file_id": row["file_id"]}
+
+    def put_text(self, sha256: str, text: str, max_tokens: int, truncated: bool) -> None:
+        """
+        Stores the extracted text of a document, keeping its `file_id` if it is already known.
+        """
+        size = len(text.encode("utf-8"))
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT INTO documents (sha256, text, max_tokens, truncated, size, last_used_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(sha256) DO UPDATE SET text = excluded.text, max_tokens = excluded.max_tokens, "
+                "truncated = excluded.truncated, size = excluded.size, last_used_at = excluded.last_used_at",
+                (sha256, text, max_tokens, int(truncated), size, time.time()),
+            )
+            self._counters["stores"] += 1
+            self._evict(connection)
+
+    def set_file_id(self, sha256: str, file_id: str) -> None:
+        """
+        Records the Files API `file_id` of a document.
+        """
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT INTO documents (sha256, file_id, size, last_used_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(sha256) DO UPDATE SET file_id = excluded.file_id, last_used_at = excluded.last_used_at",
+                (sha256, file_id, len(file_id), time.time()),
+            )
+            self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in connection.execute("SELECT sha256, size FROM documents ORDER BY last_used_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute("DELETE FROM documents WHERE sha256 = ?", (row["sha256"],))
+            total -= row["size"]
+            self._counters["evictions"] += 1
+
+    def stats(self) -> dict:
+        with closing(self._connect()) as connection, connection:
+            documents, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents").fetchone()
+        return {"backend": "sqlite", "documents": documents, "bytes": size, "max_bytes": self.max_bytes, **self._counters}
+
+
+class DirectoryDocumentStore:
+    """
+    Same store as `SqliteDocumentStore`, as one JSON file per document in a local directory.
+    The modification time of a file is its last use; the files are replaced atomically, so several workers can share the directory.
+    """
+    # Même stockage, sous la forme d'un fichier JSON par document dans un dossier local.
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.directory, f"{sha256}.json")
+
+    def _read(self, sha256: str) -> Optional[dict]:
+        try:
+            with open(self._path(sha256), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, sha256: str, record: dict) -> None:
+        temporary = f"{self._path(sha256)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(record, file, ensure_ascii=False)
+        os.replace(temporary, self._path(sha256))
+
+    def get(self, sha256: str) -> Optional[dict]:
+        record = self._read(sha256)
+        if record is None:
+            self._counters["misses"] += 1
+            return None
+        try:
+            os.utime(self._path(sha256))
+        except FileNotFoundError:
+            pass
+        self._counters["hits"] += 1
+        return record
+
+    def put_text(self, sha256: str, text: str, max_tokens: int, truncated: bool) -> None:
+        record = self._read(sha256) or {}
+        record.update({"text": text, "max_tokens": max_tokens, "truncated": truncated, "file_id": record.get("file_id")})
+        self._write(sha256, record)
+        self._counters["stores"] += 1
+        self._evict()
+
+    def set_file_id(self, sha256: str, file_id: str) -> None:
+        record = self._read(sha256) or {"text": None, "max_tokens": None, "truncated": False}
+        record["file_id"] = file_id
+        self._write(sha256, record)
+        self._evict()
+
+    def _entries(self) -> list:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self) -> None:
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self._counters["evictions"] += 1
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {"backend": "directory", "documents": len(entries), "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes, **self._counters}
+
+
+def make_document_store():
+    """
+    Builds the document store configured by `ELSIA_DOCUMENT_STORE` ("sqlite", "directory" or "none").
+    """
+    if variables.document_store_backend == "sqlite":
+        return SqliteDocumentStore(variables.document_store_path, variables.document_store_max_bytes)
+    if variables.document_store_backend == "directory":
+        return DirectoryDocumentStore(variables.document_store_path, variables.document_store_max_bytes)
+    return None
+
+
+document_store = make_document_store()
+
+
+# MIME types of the documents accepted by the Files API in a `document` block.
+# Types MIME des documents acceptés par la Files API dans un bloc `document`.
+FILES_API_MEDIA_TYPES = {".pdf": "application/pdf", ".txt": "text/plain"}
+
+
+async def document_text(upload, max_tokens: int = variables.extraction_max_tokens) -> str:
+    """
+    Returns the extracted text of an uploaded file, from the store when the same content was already parsed.
+    :param upload: The uploaded file (`utils.uploads.StoredUpload`).
+    :param max_tokens: The maximum number of tokens of the text.
+    :raises DocumentExtractionError: If the text cannot be extracted.
+    """
+    if document_store is not None:
+        record = await asyncio.to_thread(document_store.get, upload.sha256)
+        # Un texte extrait avec un budget plus petit, et tronqué, ne suffit pas : le fichier est relu.
+        if record is not None and record["text"] is not None and (not record["truncated"] or record["max_tokens"] >= max_tokens):
+            return record["text"][:max_tokens * CHARACTERS_PER_TOKEN]
+    extracted = await extract_text(upload, max_tokens)
+    if document_store is not None:
+        await asyncio.to_thread(document_store.put_text, upload.sha256, extracted["text"], max_tokens, extracted["truncated"])
+    return extracted["text"]
+
+
+async def document_file_id(upload) -> Optional[str]:
+    """
+    Returns the Files API `file_id` of an uploaded file, uploading it only if the same content was never uploaded.
+    :param upload: The uploaded file (`utils.uploads.StoredUpload`).
+    :return: The `file_id`, or None if the Files API cannot read this type of file.
+    """
+    media_type = FILES_API_MEDIA_TYPES.get(upload.extension)
+    if media_type is None:
+        return None
+    if document_store is not None:
+        record = await asyncio.to_thread(document_store.get, upload.sha256)
+        if record is not None and record["file_id"]:
+            return record["file_id"]
+    data = await asyncio.to_thread(upload.read_bytes)
+    file_id = await recommendations.init.upload_file_async(upload.filename, data, media_type)
+    if document_store is not None:
+        await asyncio.to_thread(document_store.set_file_id, upload.sha256, file_id)
+    return file_id
@@ -0,0 +1,167 @@
+import asyncio
+import codecs
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import utils.variables as variables
+
+# Optional dependencies: without them the corresponding file type cannot be read.
+# Dépendances optionnelles : sans elles, le type de fichier correspondant ne peut pas être lu.
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+try:
+    import docx
+except ImportError:
+    docx = None
+
+
+# About 4 characters per token.
+# Environ 4 caractères par token.
+CHARACTERS_PER_TOKEN = 4
+
+
+class DocumentExtractionError(ValueError):
+    """
+    Raised when the text of an uploaded file cannot be extracted.
+    """
+    # Levée lorsque le texte d'un fichier envoyé ne peut pas être extrait.
+
+
+def _open_source(data: Optional[bytes], path: Optional[str]):
+    return io.BytesIO(data) if data is not None else open(path, "rb")
+
+
+def _extract_pdf(source, max_characters: int) -> dict:
+    if pypdf is None:
+        raise DocumentExtractionError("PDF files cannot be read: the optional 'pypdf' package is not installed.")
+    reader = pypdf.PdfReader(source)
+    parts = []
+    length = 0
+    pages = 0
+    # Page par page : la lecture s'arrête dès que le budget est atteint, sans analyser le reste du document.
+    for page in reader.pages:
+        text = (page.extract_text() or "").strip()
+        pages += 1
+        if not text:
+            continue
+        parts.append(text)
+        length += len(text) + 2
+        if length >= max_characters:
+            break
+    return {"text": "\n\n".join(parts), "pages": pages, "total_pages": len(reader.pages)}
+
+
+def _extract_docx(source, max_characters: int) -> dict:
+    if docx is None:
+        raise DocumentExtractionError("DOCX files cannot be read: the optional 'python-docx' package is not installed.")
+    document = docx.Document(source)
+    parts = []
+    length = 0
+    for paragraph in document.paragraphs:
+        text = paragraph.text.strip()
+        if not text:
+            continue
+        parts.append(text)
+        length += len(text) + 1
+        if length >= max_characters:
+            break
+    return {"text": "\n".join(parts), "pages": None, "total_pages": None}
+
+
+def _extract_txt(source, max_characters: int) -> dict:
+    # Lecture bornée : au plus 4 octets par caractère en UTF-8.
+    raw = source.read(max_characters * 4)
+    try:
+        # Décodage incrémental : un caractère coupé par la limite de lecture n'est pas une erreur.
+        text = codecs.getincrementaldecoder("utf-8")().decode(raw, final=False)
+    except UnicodeDecodeError:
+        text = raw.decode("cp1252", errors="replace")
+    return {"text": text.strip(), "pages": None, "total_pages": None}
+
+
+EXTRACTORS = {
+    ".pdf": _extract_pdf,
+    ".docx": _extract_docx,
+    ".txt": _extract_txt,
+}
+
+
+def extract_text_sync(extension: str, data: Optional[bytes], path: Optional[str], max_tokens: int) -> dict:
+    """
+    Extracts the text of a file, stopping once the token budget is reached. Runs in the worker processes.
+
+    :param extension: The extension of the file (".pdf", ".docx" or ".txt").
+    :param data: The content of the file, when it is kept in memory.
+    :param path: The path of the file, when it is spooled to disk.
+    :param max_tokens: The maximum number of tokens of the extracted text.
+    :return: A dictionary with the text, the number of pages read, the total number of pages (PDF only) and whether the text was truncated.
+    :raises DocumentExtractionError: If the file type is not supported or the file cannot be read.
+    """
+    extractor = EXTRACTORS.get(extension)
+    if extractor is None:
+        raise DocumentExtractionError(f"Unsupported file type: {extension}")
+    max_characters = max_tokens * CHARACTERS_PER_TOKEN
+    try:
+        with _open_source(data, path) as source:
+            result = extractor(source, max_characters)
+    except DocumentExtractionError:
+        raise
+    except Exception as e:
+        raise DocumentExtractionError(f"The text of the file could not be extracted: {e}")
+    result["truncated"] = len(result["text"]) > max_characters or (result["pages"] or 0) < (result["total_pages"] or 0)
+    result["text"] = result["text"][:max_characters]
+    return result
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+# Extractions submitted to the pool and not finished yet, running or waiting for a worker process.
+# Extractions soumises au pool et pas encore terminées, en cours ou en attente d'un processus.
+_submitted = 0
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # "spawn": the worker processes do not inherit the event loop and the threads of the API worker.
+        # « spawn » : les processus n'héritent pas de la boucle d'événements ni des threads du worker de l'API.
+        _pool = ProcessPoolExecutor(max_workers=variables.extraction_workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def extract_text(upload, max_tokens: int = variables.extraction_max_tokens) -> dict:
+    """
+    Extracts the text of an uploaded file in the process pool, without blocking the event loop.
+    :param upload: The uploaded file (`utils.uploads.StoredUpload`).
+    :param max_tokens: The maximum number of tokens of the extracted text.
+    :return: See `extract_text_sync`.
+    """
+    global _submitted
+    loop = asyncio.get_running_loop()
+    _submitted += 1
+    try:
+        return await loop.run_in_executor(_get_pool(), extract_text_sync, upload.extension, upload.data, upload.path, max_tokens)
+    finally:
+        _submitted -= 1
+
+
+def pool_status() -> dict:
+    """
+    Returns the number of extractions running in the worker processes and waiting for one.
+    """
+    active = min(_submitted, variables.extraction_workers)
+    return {"workers": variables.extraction_workers, "active": active, "queued": _submitted - active}
+
+
+def shutdown_pool() -> None:
+    """
+    Stops the worker processes of the extraction pool.
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
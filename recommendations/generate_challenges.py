@@ -1,6 +1,13 @@
 from typing import Optional
+from contextlib import aclosing
 
 import recommendations.init
+from recommendations.resilience import UpstreamUnavailableError
+from recommendations.prompt_registry import prompt_registry
+from utils.logging_setup import setup_logger
+
+
+recommendations_logger = setup_logger("recommendations")
 
 
 class ChallengesRecommendation:
@@ -8,57 +15,83 @@ class ChallengesRecommendation:
     Class to recommend challenges based on the student's profile.
     """
     
+    __slots__ = ("_language",)
+
     def __init__(self, language: str = "en"):
         """
         Initializes the ChallengesRecommendation class with the specified language.
         :param language: Language for the recommendations, default is English ("en").
         """
-        self.language = language
-        if self.language == "fr":
-            with open("./prompts/profile_document_template_fr.txt", "r", encoding="utf-8") as file:
-                self.document_context = file.read()
-            with open("./prompts/challenges_template_fr.txt", "r", encoding="utf-8") as file:
-                self.challenges_prompt_template = file.read()
-        else:
-            with open("./prompts/profile_document_template_en.txt", "r", encoding="utf-8") as file:
-                self.document_context = file.read()  
-            with open("./prompts/challenges_template_en.txt", "r", encoding="utf-8") as file:
-                self.challenges_prompt_template = file.read()
-        
-    def __send_query(self, query_text_challenges: str, profile_document_context: str, number_items: int = 10, age:float = None ) -> str:
+        self._language = language
+
+    @property
+    def language(self) -> str:
+        return self._language
+
+    @property
+    def document_context(self) -> str:
+        return prompt_registry.get("profile_document_template", self._language)
+
+    @property
+    def challenges_prompt_template(self) -> str:
+        return prompt_registry.get("challenges_template", self._language)
+
+    def __build_query(self, query_text_challenges: str, profile_document_context: str, number_items: int = 10, age:float = None ) -> list:
         """
-        Sends a query to the Claude model to generate challenge recommendations.
+        Builds the query sent to the Claude model to generate challenge recommendations.
         
         :param query_text_challenges: The text of the query for generating challenges.
         :param profile_document_context: The context document for the profile.
-        :return: The response from the Claude model.
+        :return: The list of messages to send to the Claude model.
         """
         
         query_text_challenges = self.challenges_prompt_template.format(key_words = query_text_challenges, number_items=number_items)
         
         query = [{
             "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": query_text_challenges
-                },
+            "content": recommendations.init.build_content(query_text_challenges, [
                 {
-                    "type": "document",
-                    "source": {
-                        "type": "file",
-                        "file_id": "file_011CRiWWvDgSCYar39r8XM4t"
-                    },
+                    "file_id": "file_011CRiWWvDgSCYar39r8XM4t",
                     "title": "Challenges recommendations", # Optional
-                    "context": profile_document_context, # Optional  
-                    # "citations": {"enabled": True} # Optional, enables citations
+                    "context": profile_document_context, # Optional
                 }
-            ],
+            ]),
         }]
-        return recommendations.init.send_query(query)    
+        return query    
+    
+    def __format_response(self, response: str) -> dict:
+        """
+            Converts the raw response of the Claude model into the result returned by `recommend`.
+            
+            :param response: The response from the Claude model.
+            :return: A dictionary containing the error status and the generated recommendations.
+        """
+        recommendations_logger.debug("Response from Claude: %s", response)
+        response = response.replace("<output>", "").replace("</output>", "").strip()
+        recommendations_logger.debug("Cleaned response: %s", response)
+        response_dict = recommendations.init.process_response(response)
+        
+        recommendations_logger.debug("Response dict: %s", response_dict)
+
+        if not response_dict['error'] :
+            return {"error": False, "data": response_dict['data']}
+        else:
+            return {"error": True, "data": None, "message": response_dict.get('message', 'Unknown error occurred')}
+    
+    def build_batch_request(self, age: Optional[float], description: str, number_items:Optional[int]=10) -> dict:
+        """
+        Returns the Messages API parameters of a challenges query, for a Message Batch.
+        """
+        return recommendations.init.build_request(self.__build_query(description, self.document_context, number_items=number_items, age=age), output="challenges")
+    
+    def format_batch_result(self, response: str) -> dict:
+        """
+        Converts the response of a Message Batch item into the result returned by `recommend`.
+        """
+        return self.__format_response(response)
     
     # Method for the generation of recommendations for student's challenges.
-    def recommend(self, age: Optional[float], description: str, number_items:Optional[int]=10) -> dict:
+    def recommend(self, age: Optional[float], description: str, number_items:Optional[int]=10, use_cache: bool = True) -> dict:
         """
             Generates challenge recommendations based on the student's age and description.
             :param age: The age of the student.
@@ -67,22 +100,39 @@ class ChallengesRecommendation:
         """
         try:
             # Generate recommendations of challenges for age {age} and the description : {description}
-            response = self.__send_query(description, self.document_context, number_items=number_items, age=age)
-            print(f"Response from Claude: {response}")
-            response = response.replace("<output>", "").replace("</output>", "").strip()
-            print(f"\n\nCleaned response: {response}")
-            response_dict = recommendations.init.process_response(response)
-            
-            print(f"Response dict: {response_dict}")
- 
-            if not response_dict['error'] :
-                return {"error": False, "data": response_dict['data']}
-            else:
-                return {"error": True, "data": None, "message": response_dict.get('message', 'Unknown error occurred')}
+            query = self.__build_query(description, self.document_context, number_items=number_items, age=age)
+            response = recommendations.init.send_query(query, use_cache=use_cache, output="challenges")
+            return self.__format_response(response)
         
+        except (UpstreamUnavailableError, TimeoutError):
+            raise
         except Exception as e:
             # Captures all errors to return them in a structured way
             # Capture toutes les erreurs pour les retourner de manière structurée
             return {"error": True, "data": None, "message": str(e)}
-
-        
\ No newline at end of file
+    
+    async def recommend_async(self, age: Optional[float], description: str, number_items:Optional[int]=10, use_cache: bool = True) -> dict:
+        """
+            Asynchronous version of `recommend`, awaiting the model call on the shared asynchronous client.
+        """
+        try:
+            query = self.__build_query(description, self.document_context, number_items=number_items, age=age)
+            response = await recommendations.init.send_query_async(query, use_cache=use_cache, output="challenges")
+            return self.__format_response(response)
+        
+        except (UpstreamUnavailableError, TimeoutError):
+            raise
+        except Exception as e:
+            # Captures all errors to return them in a structured way
+            # Capture toutes les erreurs pour les retourner de manière structurée
+            return {"error": True, "data": None, "message": str(e)}
+    
+    async def recommend_stream(self, age: Optional[float], description: str, number_items:Optional[int]=10, use_cache: bool = True):
+        """
+            Streams the challenges recommendations, yielding each item as soon as it is complete in the model response.
+        """
+        query = self.__build_query(description, self.document_context, number_items=number_items, age=age)
+        async with aclosing(recommendations.init.stream_items(query, use_cache=use_cache, output="challenges")) as stream:
+            async for _, item in stream:
+                if isinstance(item, str):
+                    yield item.strip()
@@ -1,7 +1,20 @@
-from typing import Dict, List, Optional
+from typing import Dict, Optional
 import uuid
+from contextlib import aclosing
 
 import recommendations.init  # Importing the init module to access the send_query function
+from recommendations.resilience import UpstreamUnavailableError
+from recommendations.prompt_registry import prompt_registry
+from recommendations.extraction import DocumentExtractionError
+from recommendations.document_store import document_file_id, document_text
+from recommendations.generate_strengths import StrengthsRecommendation
+from recommendations.generate_challenges import ChallengesRecommendation
+from recommendations.generate_needs import NeedRecommendation
+from recommendations.generate_goals import GoalsRecommendation
+from recommendations.generate_means import MeansRecommendation
+from recommendations.pipeline import Stage, run_pipeline
+
+import utils.variables as variables
 
 
 class FullRecommendation:
@@ -9,136 +22,232 @@ class FullRecommendation:
     Class to orchestrate the generation of a full student profile.
     """
     # Classe pour orchestrer la génération d'un profil étudiant complet.
+    __slots__ = ("_language",)
+
     def __init__(self, language: str = "en"):
-        # Initialise les classes de recommandation pour chaque domaine
-        
-        self.language = language
-        if self.language == "fr":
-            with open("./prompts/profile_goals_means_template_fr.txt", "r", encoding="utf-8") as file:
-                self.full_recommend_prompt_template = file.read()
-        else:
-            with open("./prompts/profile_goals_means_template_en.txt", "r", encoding="utf-8") as file:
-                self.full_recommend_prompt_template = file.read() 
-        
-        
-        if self.language == "fr":
-            with open("./prompts/goals_document_template_fr.txt", "r", encoding="utf-8") as file:
-                self.goals_document_context = file.read()
-        else:
-            with open("./prompts/goals_document_template_en.txt", "r", encoding="utf-8") as file:
-                self.goals_document_context = file.read()  
-        
-        if self.language == "fr":
-            with open("./prompts/profile_document_template_fr.txt", "r", encoding="utf-8") as file:
-                self.profile_document_context = file.read()
-        else:
-            with open("./prompts/profile_document_template_en.txt", "r", encoding="utf-8") as file:
-                self.profile_document_context = file.read()  
-        
-        if self.language == "fr":
-            with open("./prompts/means_document_template_fr.txt", "r", encoding="utf-8") as file:
-                self.means_document_context = file.read()
-        else:
-            with open("./prompts/means_document_template_en.txt", "r", encoding="utf-8") as file:
-                self.means_document_context = file.read()  
-            
-    
-        
-            
+        self._language = language
+
+    @property
+    def language(self) -> str:
+        return self._language
 
-    def __send_query(self, query_text_full_profile:str, profile_document_context: str, goals_document_context:str, means_document_context:str) -> str:
+    @property
+    def full_recommend_prompt_template(self) -> str:
+        return prompt_registry.get("profile_goals_means_template", self._language)
+
+    @property
+    def goals_document_context(self) -> str:
+        return prompt_registry.get("goals_document_template", self._language)
+
+    @property
+    def profile_document_context(self) -> str:
+        return prompt_registry.get("profile_document_template", self._language)
+
+    @property
+    def means_document_context(self) -> str:
+        return prompt_registry.get("means_document_template", self._language)
+
+    def __build_query(self, query_text_full_profile:str, profile_document_context: str, goals_document_context:str, means_document_context:str, attachments: Optional[list] = None) -> list:
         """
-        Sends a query to the Claude model to generate challenge recommendations.
+        Builds the query sent to the Claude model to generate the full profile recommendations.
         
-        :param query_text_challenges: The text of the query for generating challenges.
+        :param query_text_full_profile: The text of the query for generating the full profile.
         :param profile_document_context: The context document for the profile.
-        :return: The response from the Claude model.
+        :param goals_document_context: The context document for the goals.
+        :param means_document_context: The context document for the means.
+        :param attachments: The documents uploaded with the request, see `recommendations.init.build_content`.
+        :return: The list of messages to send to the Claude model.
         """
         
         
         
         query = [{
             "role": "user",
-            "content": [
+            "content": recommendations.init.build_content(query_text_full_profile, [
                 {
-                    "type": "text",
-                    "text": query_text_full_profile
-                },
-                {
-                    "type": "document",
-                    "source": {
-                        "type": "file",
-                        "file_id": "file_011CRiWWvDgSCYar39r8XM4t"
-                    },
+                    "file_id": "file_011CRiWWvDgSCYar39r8XM4t",
                     "title": "Instruction creation profile", # Optional
-                    "context": profile_document_context, # Optional  
-                    # "citations": {"enabled": True} # Optional, enables citations
+                    "context": profile_document_context, # Optional
                 },
                 {
-                    "type": "document",
-                    "source": {
-                        "type": "file",
-                        "file_id": "file_011CRskFjFdCHud4pXMs6oWr"
-                    },
+                    "file_id": "file_011CRskFjFdCHud4pXMs6oWr",
                     "title": "Instruction creation d'objectifs", # Optional
-                    "context": goals_document_context, # Optional  
-                    # "citations": {"enabled": True} # Optional, enables citations
+                    "context": goals_document_context, # Optional
                 },
                 {
-                    "type": "document",
-                    "source": {
-                        "type": "file",
-                        "file_id": "file_011CRskJiRMBcCwWsJAFjCm3"
-                    },
+                    "file_id": "file_011CRskJiRMBcCwWsJAFjCm3",
                     "title": "Instruction creation moyens", # Optional
-                    "context": means_document_context, # Optional  
-                    # "citations": {"enabled": True} # Optional, enables citations
+                    "context": means_document_context, # Optional
                 }
-            ],
+            ], attachments),
         }]
-        return recommendations.init.send_query(query) 
+        return query
     
-    async def recommend(self, age: Optional[float], gender: str, description: str, file: Optional[object], number_items:int=10) -> dict:
+    def __format_section(self, key: str, value: list) -> tuple:
+        """
+        Converts one section of the model response into the section of the full profile it belongs to.
+        
+        :param key: The key of the section in the model response.
+        :param value: The list of items of the section.
+        :return: A tuple (section name, formatted items); the section name is None for unknown keys.
+        """
+        if key in ["strengths", "challenges", "needs"]:
+            return key, list(value)
+        elif key in ["goals", "objectives"]:
+            return "goals", [{"id": str(uuid.uuid4()), "description": c_value} for c_value in value]
+        elif key == "means":
+            return "means", [{"id": str(uuid.uuid4()), "description": c_value} for c_value in value]
+        return None, []
+    
+    def __format_response(self, response: str) -> dict:
+        """
+        Converts the raw response of the Claude model into the result returned by `recommend`.
+        
+        :param response: The response from the Claude model.
+        :return: A dictionary containing the error status and the full profile.
+        """
+        response_dict = recommendations.init.process_response(response)
+        
+        full_data = {
+            "strengths": [],
+            "challenges": [],
+            "needs": [],
+            "goals": [],
+            "means": []
+        }
+        
+        if not response_dict['error'] :
+            for key, value in response_dict['data'].items():
+                section, items = self.__format_section(key, value)
+                if section is not None:
+                    full_data[section].extend(items)
+            return {"error": False, "data": full_data}
+        else:
+            return {"error": True, "data": None, "message": response_dict.get('message', 'Unknown error occurred')}
+    
+    async def __describe(self, description: str, file: Optional[object], attach: bool = True) -> tuple:
+        """
+        Returns the description followed by the text extracted from the uploaded file, if any.
+        With `ELSIA_DOCUMENT_FILES_API`, a PDF or TXT file is attached to the query by its Files API `file_id` instead.
+        The text and the `file_id` come from the document store when the same content was already uploaded.
+        
+        :param description: The free-text description of the student.
+        :param file: The uploaded file (`utils.uploads.StoredUpload`), or None.
+        :param attach: Whether the file may be attached to the query, rather than inserted in the description.
+        :return: A tuple (description to insert in the `{description}` of the prompt, attached documents).
+        """
+        if file is None:
+            return description, []
+        label = "Contenu du fichier joint" if self.language == "fr" else "Content of the attached file"
+        if attach and variables.document_files_api:
+            file_id = await document_file_id(file)
+            if file_id is not None:
+                return description, [{"file_id": file_id, "title": file.filename, "context": label}]
+        text = await document_text(file)
+        if not text:
+            return description, []
+        return f"{description}\n\n{label} ({file.filename}):\n{text}", []
+
+    def build_batch_request(self, age: Optional[float], gender: str, description: str, number_items:int=10) -> dict:
+        """
+        Returns the Messages API parameters of a full profile query, for a Message Batch.
+        """
+        return recommendations.init.build_request(self.__build_query(
+            self.full_recommend_prompt_template.format(age = age, gender=gender,  description=description, number_items=number_items),
+            self.profile_document_context, self.goals_document_context, self.means_document_context
+        ), output="full")
+    
+    def format_batch_result(self, response: str) -> dict:
+        """
+        Converts the response of a Message Batch item into the result returned by `recommend`.
+        """
+        return self.__format_response(response)
+    
+    async def recommend(self, age: Optional[float], gender: str, description: str, file: Optional[object], number_items:int=10, use_cache: bool = True) -> dict:
         """
         Generates a full profile including strengths, challenges, needs, goals, and means.
         This function orchestrates the calls to all other recommendation modules.
         """
         try:
+            description, attachments = await self.__describe(description, file)
             query_full = self.full_recommend_prompt_template.format(age = age, gender=gender,  description=description, number_items=number_items)
             
-            response:str = self.__send_query(query_full, self.profile_document_context, self.goals_document_context, self.means_document_context)
+            query = self.__build_query(query_full, self.profile_document_context, self.goals_document_context, self.means_document_context, attachments)
+            response:str = await recommendations.init.send_query_async(query, use_cache=use_cache, output="full")
 
-            response_dict = recommendations.init.process_response(response)
-            
-            full_data = {
-                "strengths": [],
-                "challenges": [],
-                "needs": [],
-                "goals": [],
-                "means": []
-            }
-            
-            if not response_dict['error'] :
-                for key, value in response_dict['data'].items():
-                    for c_value in value:
-                        if key == "strengths":
-                            full_data["strengths"].append(c_value)
-                        elif key == "challenges":
-                            full_data["challenges"].append(c_value)
-                        elif key == "needs":
-                            full_data["needs"].append(c_value)
-                        elif key in ["goals", "objectives"]:
-                            full_data["goals"].append({
-                                "id": str(uuid.uuid4()),
-                                "description": c_value
-                            })
-                        elif key == "means":
-                            full_data["means"].append({
-                                "id": str(uuid.uuid4()),
-                                "description": c_value
-                            })
-                return {"error": False, "data": full_data}
-            else:
-                return {"error": True, "data": None, "message": response_dict.get('message', 'Unknown error occurred')}
+            return self.__format_response(response)
+        except (UpstreamUnavailableError, TimeoutError, DocumentExtractionError):
+            raise
+        except Exception as e:
+            return {"error": True, "data": None, "message": str(e)}
+
+    async def recommend_stream(self, age: Optional[float], gender: str, description: str, file: Optional[object], number_items:int=10, use_cache: bool = True):
+        """
+        Streams the full profile, yielding each section (strengths, challenges, needs, goals, means)
+        as soon as it is complete in the model response.
+        """
+        description, attachments = await self.__describe(description, file)
+        query_full = self.full_recommend_prompt_template.format(age = age, gender=gender,  description=description, number_items=number_items)
+        query = self.__build_query(query_full, self.profile_document_context, self.goals_document_context, self.means_document_context, attachments)
+        async with aclosing(recommendations.init.stream_items(query, use_cache=use_cache, output="full")) as stream:
+            async for key, value in stream:
+                if isinstance(value, list):
+                    section, items = self.__format_section(key, value)
+                    if section is not None:
+                        yield {"section": section, "data": items}
+
+    async def recommend_pipelined(self, age: Optional[float], gender: str, description: str, file: Optional[object], number_items:int=10, use_cache: bool = True) -> dict:
+        """
+        Generates a full profile with the per-domain recommendation classes, run as a dependency graph.
+        Strengths, challenges and needs are extracted concurrently, goals start as soon as challenges and needs
+        are ready, and means are generated per goal. Each stage has its own timeout and is retried on its own.
+        """
+        # Génère un profil complet à l'aide des classes de recommandation par domaine, exécutées en graphe de dépendances.
+        # Les classes par domaine ne reçoivent que du texte : le fichier est toujours inséré dans la description.
+        description, _ = await self.__describe(description, file, attach=False)
+        strengths_recommender = prompt_registry.recommender(StrengthsRecommendation, self.language)
+        challenges_recommender = prompt_registry.recommender(ChallengesRecommendation, self.language)
+        needs_recommender = prompt_registry.recommender(NeedRecommendation, self.language)
+        goals_recommender = prompt_registry.recommender(GoalsRecommendation, self.language)
+        means_recommender = prompt_registry.recommender(MeansRecommendation, self.language)
+
+        async def strengths_stage(inputs: Dict[str, dict]) -> dict:
+            return await strengths_recommender.recommend_async(age, description, number_items, use_cache=use_cache)
+
+        async def challenges_stage(inputs: Dict[str, dict]) -> dict:
+            return await challenges_recommender.recommend_async(age, description, number_items, use_cache=use_cache)
+
+        async def needs_stage(inputs: Dict[str, dict]) -> dict:
+            return await needs_recommender.recommend_async(age, description, number_items, use_cache=use_cache)
+
+        async def goals_stage(inputs: Dict[str, dict]) -> dict:
+            return await goals_recommender.recommend_async(age, gender, None, inputs["challenges"]["data"], inputs["needs"]["data"], number_items, use_cache=use_cache)
+
+        async def means_stage(inputs: Dict[str, dict]) -> dict:
+            challenges = inputs["challenges"]["data"]
+            needs = inputs["needs"]["data"]
+            goals = inputs["goals"]["data"]
+            return await means_recommender.recommend_fan_out(age, gender, None, challenges, needs, [goal["description"] for goal in goals],
+                                                             variables.means_per_goal, use_cache=use_cache, goal_ids=[goal["id"] for goal in goals])
+
+        timeout = variables.pipeline_stage_timeout
+        retries = variables.pipeline_stage_retries
+        try:
+            results = await run_pipeline([
+                Stage("strengths", strengths_stage, timeout=timeout, retries=retries),
+                Stage("challenges", challenges_stage, timeout=timeout, retries=retries),
+                Stage("needs", needs_stage, timeout=timeout, retries=retries),
+                Stage("goals", goals_stage, depends_on=("challenges", "needs"), timeout=timeout, retries=retries),
+                Stage("means", means_stage, depends_on=("challenges", "needs", "goals"), timeout=timeout, retries=retries),
+            ])
+        except (UpstreamUnavailableError, TimeoutError):
+            raise
         except Exception as e:
             return {"error": True, "data": None, "message": str(e)}
+
+        full_data = {name: (result["data"] if not result["error"] else []) for name, result in results.items()}
+        failed = [f"{name}: {result.get('message')}" for name, result in results.items() if result["error"]]
+        if len(failed) == len(results):
+            return {"error": True, "data": None, "message": "; ".join(failed)}
+        # Les étapes réussies sont conservées même si d'autres ont échoué.
+        return {"error": False, "data": full_data, "message": "; ".join(failed) if failed else None}
@@ -1,60 +1,103 @@
 from typing import Optional, List
 import uuid
+from contextlib import aclosing
 
 import recommendations.init  # Importing the init module to access the send_query function
+from recommendations.resilience import UpstreamUnavailableError
+from recommendations.prompt_registry import prompt_registry
+from utils.logging_setup import setup_logger
+
+
+recommendations_logger = setup_logger("recommendations")
 
 
 class GoalsRecommendation:
     """Class generating student goal recommendations based on profile information."""
     
+    __slots__ = ("_language",)
+
     def __init__(self, language: str = "en"):
         """
         Initializes the GoalsRecommandation class with the specified language.
         :param language: Language for the recommendations, default is English ("en").
         """
-        self.language = language
-        if self.language == "fr":
-            with open("./prompts/goals_document_template_fr.txt", "r", encoding="utf-8") as file:
-                self.document_context = file.read()
-            with open("./prompts/goals_template_fr.txt", "r", encoding="utf-8") as file:
-                self.goals_prompt_template = file.read()
-        else:
-            with open("./prompts/goals_document_template_en.txt", "r", encoding="utf-8") as file:
-                self.document_context = file.read()  
-            with open("./prompts/goals_template_en.txt", "r", encoding="utf-8") as file:
-                self.goals_prompt_template = file.read()
-    
-    def __send_query(self, query_text_goals: str, goals_document_context: str) -> str:
+        self._language = language
+
+    @property
+    def language(self) -> str:
+        return self._language
+
+    @property
+    def document_context(self) -> str:
+        return prompt_registry.get("goals_document_template", self._language)
+
+    @property
+    def goals_prompt_template(self) -> str:
+        return prompt_registry.get("goals_template", self._language)
+
+    def __build_query(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], number_items:int=10) -> list:
         """
-        Sends a query to the Claude model to generate goal recommendations.
+        Builds the query sent to the Claude model to generate goal recommendations.
         
-        :param query_text_goals: The text of the query for generating goals.
-        :param profile_document_context: The context document for the profile.
-        :return: The response from the Claude model.
+        :param age: The age of the student.
+        :param gender: The gender of the student.
+        :param strengths: List of strengths of the student.
+        :param challenges: List of challenges faced by the student. 
+        :param needs: List of needs of the student.
+        :param number_items: Number of goals to generate.
+        :return: The list of messages to send to the Claude model.
         """
         
+        strengths = ',\n '.join(strengths) if strengths else ''
+        challenges = ',\n '.join(challenges) if challenges else ''
+        needs = ',\n '.join(needs) if needs else ''
+        query_text_goals = self.goals_prompt_template.format(age=age, sex=gender, strengths = strengths, challenges = challenges, needs=needs, number_items=number_items)
+        
         query_goals = [{
             "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": query_text_goals
-                },
+            "content": recommendations.init.build_content(query_text_goals, [
                 {
-                    "type": "document",
-                    "source": {
-                        "type": "file",
-                        "file_id": "file_011CRskFjFdCHud4pXMs6oWr"
-                    },
+                    "file_id": "file_011CRskFjFdCHud4pXMs6oWr",
                     "title": "Goals recommendations", # Optional
-                    "context": goals_document_context, # Optional  
-                    # "citations": {"enabled": True} # Optional, enables citations
+                    "context": self.document_context, # Optional
                 }
-            ],
+            ]),
         }]
-        return recommendations.init.send_query(query_goals)
+        return query_goals
+    
+    def __format_response(self, response: str) -> dict:
+        """
+        Converts the raw response of the Claude model into the result returned by `recommend`.
+        
+        :param response: The response from the Claude model.
+        :return: A dictionary containing the error status and the generated recommendations.
+        """
+        response_dict = recommendations.init.process_response(response)
+
+        goals = []
+        if not response_dict['error'] :
+            for item in response_dict['data']:
+                goals.append({
+                    "id": str(uuid.uuid4()),
+                    "description": item
+                })
+            return {"error": False, "data": goals}
+        else:
+            return {"error": True, "data": None, "message": response_dict.get('message', 'Unknown error occurred')}
 
-    def recommend(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], number_items:int=10) -> dict:
+    def build_batch_request(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], number_items:int=10) -> dict:
+        """
+        Returns the Messages API parameters of a goals query, for a Message Batch.
+        """
+        return recommendations.init.build_request(self.__build_query(age, gender, strengths, challenges, needs, number_items), output="goals")
+    
+    def format_batch_result(self, response: str) -> dict:
+        """
+        Converts the response of a Message Batch item into the result returned by `recommend`.
+        """
+        return self.__format_response(response)
+    
+    def recommend(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], number_items:int=10, use_cache: bool = True) -> dict:
         """
             Generate goals based on the provided profile information age : {age}, sex : {sex}, strengths : {strengths}, challenges : {challenges}, needs : {needs}.
             :param age: The age of the student.
@@ -67,28 +110,42 @@ class GoalsRecommendation:
         """
 
         try:
-            print(f"Generating goals for age: {age}, gender: {gender}, strengths: {strengths}, challenges: {challenges}, needs: {needs}")
-            strengths = ',\n '.join(strengths) if strengths else ''
-            challenges = ',\n '.join(challenges) if challenges else ''
-            needs = ',\n '.join(needs) if needs else ''
-            query_text_goals = self.goals_prompt_template.format(age=age, sex=gender, strengths = strengths, challenges = challenges, needs=needs, number_items=number_items)
-            
-            response = self.__send_query(query_text_goals, self.document_context)
-            response_dict = recommendations.init.process_response(response)
- 
-            goals = []
-            if not response_dict['error'] :
-                for item in response_dict['data']:
-                    goals.append({
-                        "id": str(uuid.uuid4()),
-                        "description": item
-                    })
-                return {"error": False, "data": goals}
-            else:
-                return {"error": True, "data": None, "message": response_dict.get('message', 'Unknown error occurred')}
+            recommendations_logger.debug("Generating goals for age: %s, gender: %s, strengths: %s, challenges: %s, needs: %s", age, gender, strengths, challenges, needs)
+            query = self.__build_query(age, gender, strengths, challenges, needs, number_items)
+            response = recommendations.init.send_query(query, use_cache=use_cache, output="goals")
+            return self.__format_response(response)
         
+        except (UpstreamUnavailableError, TimeoutError):
+            raise
         except Exception as e:
             # Captures all errors to return them in a structured way
             # Capture toutes les erreurs pour les retourner de manière structurée
             return {"error": True, "data": None, "message": str(e)}
 
+    async def recommend_async(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], number_items:int=10, use_cache: bool = True) -> dict:
+        """
+            Asynchronous version of `recommend`, awaiting the model call on the shared asynchronous client.
+        """
+
+        try:
+            recommendations_logger.debug("Generating goals for age: %s, gender: %s, strengths: %s, challenges: %s, needs: %s", age, gender, strengths, challenges, needs)
+            query = self.__build_query(age, gender, strengths, challenges, needs, number_items)
+            response = await recommendations.init.send_query_async(query, use_cache=use_cache, output="goals")
+            return self.__format_response(response)
+        
+        except (UpstreamUnavailableError, TimeoutError):
+            raise
+        except Exception as e:
+            # Captures all errors to return them in a structured way
+            # Capture toutes les erreurs pour les retourner de manière structurée
+            return {"error": True, "data": None, "message": str(e)}
+
+    async def recommend_stream(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], number_items:int=10, use_cache: bool = True):
+        """
+            Streams the goal recommendations, yielding each goal as soon as it is complete in the model response.
+        """
+        query = self.__build_query(age, gender, strengths, challenges, needs, number_items)
+        async with aclosing(recommendations.init.stream_items(query, use_cache=use_cache, output="goals")) as stream:
+            async for _, item in stream:
+                if isinstance(item, str):
+                    yield {"id": str(uuid.uuid4()), "description": item}
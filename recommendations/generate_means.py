@@ -1,62 +1,113 @@
 from typing import Optional, List, Dict
+import asyncio
 import uuid
+from contextlib import aclosing
 
 import recommendations.init  # Importing the init module to access the send_query function
+from recommendations.resilience import UpstreamUnavailableError
+from recommendations.prompt_registry import prompt_registry
+from utils.logging_setup import setup_logger
+
+
+recommendations_logger = setup_logger("recommendations")
 
 
 class MeansRecommendation:
     """
         Class to generate means recommendations based on the student's profile and goals.
     """
+    __slots__ = ("_language",)
+
     def __init__(self, language: str = "en"):
         """
         Initializes the MeansRecommandation class with the specified language.
         :param language: Language for the recommendations, default is English ("en").
         """
-        self.language = language
-        if self.language == "fr":
-            with open("./prompts/means_document_template_fr.txt", "r", encoding="utf-8") as file:
-                self.document_context = file.read()
-            with open("./prompts/means_template_fr.txt", "r", encoding="utf-8") as file:
-                self.means_prompt_template = file.read()
-        else:
-            with open("./prompts/means_document_template_en.txt", "r", encoding="utf-8") as file:
-                self.document_context = file.read()  
-            with open("./prompts/means_template_en.txt", "r", encoding="utf-8") as file:
-                self.means_prompt_template = file.read()
-    
-    def __send_query(self, query_text_means: str, means_document_context: str) -> str:
+        self._language = language
+
+    @property
+    def language(self) -> str:
+        return self._language
+
+    @property
+    def document_context(self) -> str:
+        return prompt_registry.get("means_document_template", self._language)
+
+    @property
+    def means_prompt_template(self) -> str:
+        return prompt_registry.get("means_template", self._language)
+
+    def __build_query(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], goals: List[str], number_items:int=10) -> list:
         """
-        Sends a query to the Claude model to generate means recommendations.
+        Builds the query sent to the Claude model to generate means recommendations.
         
-        :param query_text_means: The text of the query for generating means.
-        :param means_document_context: The context document for the profile.
-        :return: The response from the Claude model.
+        :param age: The age of the student.
+        :param gender: The gender of the student.
+        :param strengths: List of strengths of the student.
+        :param challenges: List of challenges faced by the student.
+        :param needs: List of needs of the student.
+        :param goals: List of goals set by the student.
+        :param number_items: Number of means to generate.
+        :return: The list of messages to send to the Claude model.
         """
         
+        strengths = ',\n '.join(strengths) if strengths else ''
+        challenges = ',\n '.join(challenges) if challenges else ''
+        needs = ',\n '.join(needs) if needs else ''
+        goals = ',\n '.join(goals) if goals else ''
+        
+        query_text_means = self.means_prompt_template.format(age=age, sex=gender, strengths = strengths, challenges = challenges, needs=needs, goals = goals, number_items=number_items)
+        
+        recommendations_logger.debug("Query text for means: %s", query_text_means)
+        
         query_means = [{
             "role": "user",
-            "content": [
+            "content": recommendations.init.build_content(query_text_means, [
                 {
-                    "type": "text",
-                    "text": query_text_means
-                },
-                {
-                    "type": "document",
-                    "source": {
-                        "type": "file",
-                        "file_id": "file_011CRskJiRMBcCwWsJAFjCm3"
-                    },
+                    "file_id": "file_011CRskJiRMBcCwWsJAFjCm3",
                     "title": "Means recommendations", # Optional
-                    "context": means_document_context, # Optional  
-                    # "citations": {"enabled": True} # Optional, enables citations
+                    "context": self.document_context, # Optional
                 }
-            ],
+            ]),
         }]
         
-        return recommendations.init.send_query(query_means)  
+        return query_means
+    
+    def __format_response(self, response: str) -> dict:
+        """
+        Converts the raw response of the Claude model into the result returned by `recommend`.
+        
+        :param response: The response from the Claude model.
+        :return: A dictionary containing the error status and the generated recommendations.
+        """
+        recommendations_logger.debug("Response from Claude: %s", response)
+        
+        response_dict = recommendations.init.process_response(response)
+        
+        means:List[Dict] = []
+        if not response_dict['error'] :
+            for item in response_dict['data']:
+                means.append({
+                    "id": str(uuid.uuid4()),
+                    "description": item
+                })
+            return {"error": False, "data": means}
+        else:
+            return {"error": True, "data": None, "message": response_dict.get('message', 'Unknown error occurred')}
+    
+    def build_batch_request(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], goals: List[str], number_items:int=10) -> dict:
+        """
+        Returns the Messages API parameters of a means query, for a Message Batch.
+        """
+        return recommendations.init.build_request(self.__build_query(age, gender, strengths, challenges, needs, goals, number_items), output="means")
     
-    def recommend(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], goals: List[str], number_items:int=10) -> dict:
+    def format_batch_result(self, response: str) -> dict:
+        """
+        Converts the response of a Message Batch item into the result returned by `recommend`.
+        """
+        return self.__format_response(response)
+    
+    def recommend(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], goals: List[str], number_items:int=10, use_cache: bool = True) -> dict:
         """
             Generate means based on the provided profile information age : {age}, gender:{gender}, strengths : {strengths}, challenges : {challenges}, needs : {needs} and goals : {goals}.
             
@@ -71,34 +122,110 @@ class MeansRecommendation:
         """
 
         try:
-            print(f"Generating means for age: {age}")
-            strengths = ',\n '.join(strengths)
-            challenges = ',\n '.join(challenges)
-            needs = ',\n '.join(needs)
-            goals = ',\n '.join(goals)
-            
-            query_text_means = self.means_prompt_template.format(age=age, sex=gender, strengths = strengths, challenges = challenges, needs=needs, goals = goals, number_items=number_items)
-            
-            print(f"Query text for means: {query_text_means}")
-            
-            response = self.__send_query(query_text_means, self.document_context)
-            
-            print(f"Response from Claude: {response}aaa")
-            
-            response_dict = recommendations.init.process_response(response)
-            
-            means:List[Dict] = []
-            if not response_dict['error'] :
-                for item in response_dict['data']:
-                    means.append({
-                        "id": str(uuid.uuid4()),
-                        "description": item
-                    })
-                return {"error": False, "data": means}
-            else:
-                return {"error": True, "data": None, "message": response_dict.get('message', 'Unknown error occurred')}
+            recommendations_logger.debug("Generating means for age: %s", age)
+            query = self.__build_query(age, gender, strengths, challenges, needs, goals, number_items)
+            response = recommendations.init.send_query(query, use_cache=use_cache, output="means")
+            return self.__format_response(response)
         
+        except (UpstreamUnavailableError, TimeoutError):
+            raise
         except Exception as e:
             # Captures all errors to return them in a structured way
             # Capture toutes les erreurs pour les retourner de manière structurée
-            return {"error": True, "data": None, "message": str(e)}
\ No newline at end of file
+            return {"error": True, "data": None, "message": str(e)}
+    
+    async def recommend_async(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], goals: List[str], number_items:int=10, use_cache: bool = True) -> dict:
+        """
+            Asynchronous version of `recommend`, awaiting the model call on the shared asynchronous client.
+        """
+
+        try:
+            recommendations_logger.debug("Generating means for age: %s", age)
+            query = self.__build_query(age, gender, strengths, challenges, needs, goals, number_items)
+            response = await recommendations.init.send_query_async(query, use_cache=use_cache, output="means")
+            return self.__format_response(response)
+        
+        except (UpstreamUnavailableError, TimeoutError):
+            raise
+        except Exception as e:
+            # Captures all errors to return them in a structured way
+            # Capture toutes les erreurs pour les retourner de manière structurée
+            return {"error": True, "data": None, "message": str(e)}
+
+    async def recommend_stream(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], goals: List[str], number_items:int=10, use_cache: bool = True):
+        """
+            Streams the means recommendations, yielding each mean as soon as it is complete in the model response.
+        """
+        query = self.__build_query(age, gender, strengths, challenges, needs, goals, number_items)
+        async with aclosing(recommendations.init.stream_items(query, use_cache=use_cache, output="means")) as stream:
+            async for _, item in stream:
+                if isinstance(item, str):
+                    yield {"id": str(uuid.uuid4()), "description": item}
+
+    async def __recommend_goal(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], goal: str, goal_id: Optional[str], number_items: int, use_cache: bool) -> dict:
+        """
+            Generates the means of a single goal, each mean being tagged with the goal it serves.
+        """
+        result = await self.recommend_async(age, gender, strengths, challenges, needs, [goal], number_items, use_cache=use_cache)
+        if not result["error"]:
+            for mean in result["data"]:
+                mean["goal_id"] = goal_id
+                mean["goal"] = goal
+        return result
+
+    def __fan_out(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], goals: List[str], goal_ids: Optional[List[str]], number_items: int, use_cache: bool) -> list:
+        """
+            Starts one means query per goal; the queries run concurrently, within the limits of the admission controller.
+        """
+        goal_ids = goal_ids or [None] * len(goals)
+        return [
+            asyncio.ensure_future(self.__recommend_goal(age, gender, strengths, challenges, needs, goal, goal_id, number_items, use_cache))
+            for goal, goal_id in zip(goals, goal_ids)
+        ]
+
+    async def recommend_fan_out(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], goals: List[str], number_items:int=3, use_cache: bool = True, goal_ids: Optional[List[str]] = None) -> dict:
+        """
+            Generates the means with one query per goal, all goals concurrently, so that the latency is the one of
+            the slowest goal rather than growing with the number of goals.
+            The means of the goals that failed are missing; the result is an error only when every goal failed.
+            
+            :param goals: List of goals set by the student.
+            :param number_items: Number of means to generate per goal.
+            :param goal_ids: The identifiers of the goals, in the order of `goals`, set in the `goal_id` of their means.
+            :return: A dictionary containing the error status and the means of all the goals, tagged with their goal.
+        """
+        # Une requête de moyens par objectif, toutes en parallèle : la latence est celle de l'objectif le plus lent.
+        tasks = self.__fan_out(age, gender, strengths, challenges, needs, goals, goal_ids, number_items, use_cache)
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        means: List[Dict] = [mean for result in results if not result["error"] for mean in result["data"]]
+        failed = [f"{goal}: {result.get('message')}" for goal, result in zip(goals, results) if result["error"]]
+        if not means:
+            return {"error": True, "data": None, "message": "; ".join(failed) or "No means could be generated for the goals."}
+        return {"error": False, "data": means, "message": "; ".join(failed) if failed else None}
+
+    async def recommend_fan_out_stream(self, age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], goals: List[str], number_items:int=3, use_cache: bool = True, goal_ids: Optional[List[str]] = None):
+        """
+            Streams the means of `recommend_fan_out`, yielding the means of each goal as soon as its query completes.
+        """
+        tasks = self.__fan_out(age, gender, strengths, challenges, needs, goals, goal_ids, number_items, use_cache)
+        yielded = 0
+        failed = []
+        try:
+            for completed in asyncio.as_completed(tasks):
+                result = await completed
+                if result["error"]:
+                    failed.append(result.get("message"))
+                    continue
+                for mean in result["data"]:
+                    yielded += 1
+                    yield mean
+        finally:
+            # Fermeture du flux (client parti, timeout) : les requêtes des objectifs restants sont annulées.
+            for task in tasks:
+                task.cancel()
+        if not yielded:
+            raise ValueError("; ".join(message or "Unknown error occurred" for message in failed) or "No means could be generated for the goals.")
@@ -1,6 +1,9 @@
 from typing import Optional
+from contextlib import aclosing
 
 import recommendations.init  # Importing the init module to access the send_query function
+from recommendations.resilience import UpstreamUnavailableError
+from recommendations.prompt_registry import prompt_registry
 
 
 class NeedRecommendation:
@@ -8,56 +11,80 @@ class NeedRecommendation:
     Class to generate needs recommendations based on the student's profile and goals.
     """
     
+    __slots__ = ("_language",)
+
     def __init__(self, language: str = "en"):
         """
         Initializes the NeedRecommendation class with the specified language.
         :param language: Language for the recommendations, default is English ("en").
         """
-        self.language = language
-        if self.language == "fr":
-            with open("./prompts/profile_document_template_fr.txt", "r", encoding="utf-8") as file:
-                self.document_context = file.read()
-            with open("./prompts/needs_template_fr.txt", "r", encoding="utf-8") as file:
-                self.needs_prompt_template = file.read()
-        else:
-            with open("./prompts/profile_document_template_en.txt", "r", encoding="utf-8") as file:
-                self.document_context = file.read()  
-            with open("./prompts/needs_template_en.txt", "r", encoding="utf-8") as file:
-                self.needs_prompt_template = file.read()
-    
-    def __send_query(self, query_text_needs: str, needs_document_context: str, age:Optional[float], number_items:Optional[int]=10) -> str:       
+        self._language = language
+
+    @property
+    def language(self) -> str:
+        return self._language
+
+    @property
+    def document_context(self) -> str:
+        return prompt_registry.get("profile_document_template", self._language)
+
+    @property
+    def needs_prompt_template(self) -> str:
+        return prompt_registry.get("needs_template", self._language)
+
+    def __build_query(self, query_text_needs: str, needs_document_context: str, age:Optional[float], number_items:Optional[int]=10) -> list:       
         """
-            Sends a query to the Claude model to generate recommendations.
+            Builds the query sent to the Claude model to generate recommendations.
             
             :param query_text_needs: The text of the query for generating needs.
             :param needs_document_context: The context document for the profile.    
-            :return: The response from the Claude model.
+            :return: The list of messages to send to the Claude model.
         """
         query_text_needs = self.needs_prompt_template.format(key_words=query_text_needs)
         
         query = [{
             "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": query_text_needs
-                },
+            # The needs reference document is not attached yet; only the instructions are cached.
+            # Le document de référence des besoins n'est pas encore joint ; seules les instructions sont mises en cache.
+            "content": recommendations.init.build_content(query_text_needs, [
                 # {
-                #     "type": "document",
-                #     "source": {
-                #         "type": "file",
-                #         "file_id": "file_011CRskJiRMBcCwWsJAFjCm3"
-                #     },
+                #     "file_id": "file_011CRskJiRMBcCwWsJAFjCm3",
                 #     "title": "Needs recommendations",  # Optional
-                #     "context": needs_document_context,  # Optional  
-                #     # "citations": {"enabled": True} # Optional, enables citations
+                #     "context": needs_document_context,  # Optional
                 # }
-            ],
+            ]),
         }]
-        return recommendations.init.send_query(query)
+        return query
+    
+    def __format_response(self, response: str) -> dict:
+        """
+            Converts the raw response of the Claude model into the result returned by `recommend`.
+            
+            :param response: The response from the Claude model.
+            :return: A dictionary containing the recommended needs.
+        """
+        # Process the response to extract the data
+        response_dict = recommendations.init.process_response(response)
+
+        if not response_dict['error'] :
+            return {"error": False, "data": response_dict['data']}
+        else:
+            return {"error": True, "data": None, "message": response_dict.get('message', 'Unknown error occurred')}
     
     
-    def recommend(self, age: Optional[float], description: str, number_items: int = 10) -> dict:
+    def build_batch_request(self, age: Optional[float], description: str, number_items: int = 10) -> dict:
+        """
+        Returns the Messages API parameters of a needs query, for a Message Batch.
+        """
+        return recommendations.init.build_request(self.__build_query(description, self.document_context, age=age, number_items=number_items), output="needs")
+    
+    def format_batch_result(self, response: str) -> dict:
+        """
+        Converts the response of a Message Batch item into the result returned by `recommend`.
+        """
+        return self.__format_response(response)
+    
+    def recommend(self, age: Optional[float], description: str, number_items: int = 10, use_cache: bool = True) -> dict:
         """
             Generates needs recommendations based on the student's age and description.
             :param age: The age of the student.
@@ -67,14 +94,35 @@ class NeedRecommendation:
         """
         try:
             # Generate recommendations of strength for age {age} and the description : {description}
-            response = self.__send_query(description, self.document_context, age=age, number_items=number_items)
-            # Process the response to extract the data
-            response_dict = recommendations.init.process_response(response)
- 
-            if not response_dict['error'] :
-                return {"error": False, "data": response_dict['data']}
-            else:
-                return {"error": True, "data": None, "message": response_dict.get('message', 'Unknown error occurred')}
+            query = self.__build_query(description, self.document_context, age=age, number_items=number_items)
+            response = recommendations.init.send_query(query, use_cache=use_cache, output="needs")
+            return self.__format_response(response)
+        except (UpstreamUnavailableError, TimeoutError):
+            raise
+        except Exception as e:
+            # Capture toutes les erreurs pour les retourner de manière structurée
+            return {"error": True, "data": None, "message": str(e)}
+    
+    async def recommend_async(self, age: Optional[float], description: str, number_items: int = 10, use_cache: bool = True) -> dict:
+        """
+            Asynchronous version of `recommend`, awaiting the model call on the shared asynchronous client.
+        """
+        try:
+            query = self.__build_query(description, self.document_context, age=age, number_items=number_items)
+            response = await recommendations.init.send_query_async(query, use_cache=use_cache, output="needs")
+            return self.__format_response(response)
+        except (UpstreamUnavailableError, TimeoutError):
+            raise
         except Exception as e:
             # Capture toutes les erreurs pour les retourner de manière structurée
-            return {"error": True, "data": None, "message": str(e)}
\ No newline at end of file
+            return {"error": True, "data": None, "message": str(e)}
+    
+    async def recommend_stream(self, age: Optional[float], description: str, number_items: int = 10, use_cache: bool = True):
+        """
+            Streams the needs recommendations, yielding each item as soon as it is complete in the model response.
+        """
+        query = self.__build_query(description, self.document_context, age=age, number_items=number_items)
+        async with aclosing(recommendations.init.stream_items(query, use_cache=use_cache, output="needs")) as stream:
+            async for _, item in stream:
+                if isinstance(item, str):
+                    yield item.strip()
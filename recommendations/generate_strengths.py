@@ -1,80 +1,129 @@
 from typing import Optional
+from contextlib import aclosing
 
 import recommendations.init
+from recommendations.resilience import UpstreamUnavailableError
+from recommendations.prompt_registry import prompt_registry
+from utils.logging_setup import setup_logger
+
+
+recommendations_logger = setup_logger("recommendations")
 
 
 class StrengthsRecommendation:
     """    Class to simulate the logic of generating student strengths recommendations.
     """
     
+    __slots__ = ("_language",)
+
     def __init__(self, language: str = "fr"):
         """
         Initializes the StrengthsRecommendation class with the specified language.
         :param language: Language for the recommendations, default is French ("fr").
         """
-        self.language = language
-        if self.language == "fr":
-            with open("./prompts/profile_document_template_fr.txt", "r", encoding="utf-8") as file:
-                self.document_context = file.read()
-            with open("./prompts/strengths_template_fr.txt", "r", encoding="utf-8") as file:
-                self.strengths_prompt_template = file.read()
-        else:
-            with open("./prompts/profile_document_template_en.txt", "r", encoding="utf-8") as file:
-                self.document_context = file.read()  
-            with open("./prompts/strengths_template_en.txt", "r", encoding="utf-8") as file:
-                self.strengths_prompt_template = file.read()
-    
-    def __send_query(self, query_text_strengths: str, profile_document_context: str, number_items: int = 10,  age:float=None) -> str:
+        self._language = language
+
+    @property
+    def language(self) -> str:
+        return self._language
+
+    @property
+    def document_context(self) -> str:
+        return prompt_registry.get("profile_document_template", self._language)
+
+    @property
+    def strengths_prompt_template(self) -> str:
+        return prompt_registry.get("strengths_template", self._language)
+
+    def __build_query(self, query_text_strengths: str, profile_document_context: str, number_items: int = 10,  age:float=None) -> list:
         """
-            Recommends strengths based on the provided profile information.
+            Builds the query used to recommend strengths based on the provided profile information.
             
             :param query_text_strengths: The text of the query for generating strengths.
             :param profile_document_context: The context document for the profile.
             :param number_items: The number of strengths to generate.
             :param age: The age of the student, optional.
-            :return: A dictionary containing the error status and the generated recommendations.
+            :return: The list of messages to send to the Claude model.
         """
         
         query_text_strengths = self.strengths_prompt_template.format(key_words = query_text_strengths, number_items=number_items)
         
         query = [{
             "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": query_text_strengths
-                },
+            "content": recommendations.init.build_content(query_text_strengths, [
                 {
-                    "type": "document",
-                    "source": {
-                        "type": "file",
-                        "file_id": "file_011CRiWWvDgSCYar39r8XM4t"
-                    },
+                    "file_id": "file_011CRiWWvDgSCYar39r8XM4t",
                     "title": "Strengths recommendations", # Optional
-                    "context": profile_document_context, # Optional  
-                    # "citations": {"enabled": True} # Optional, enables citations
+                    "context": profile_document_context, # Optional
                 }
-            ],
+            ]),
         }]
-        return recommendations.init.send_query(query)
+        return query
+    
+    def __format_response(self, response: str) -> dict:
+        """
+            Converts the raw response of the Claude model into the result returned by `recommend`.
+            
+            :param response: The response from the Claude model.
+            :return: A dictionary containing the error status and the generated recommendations.
+        """
+        recommendations_logger.debug("Response from Claude: %s", response)
+        response = response.replace("<output>", "").replace("</output>", "").strip()
+        recommendations_logger.debug("Cleaned response: %s", response)
+        response_dict = recommendations.init.process_response(response)
+
+        if not response_dict['error'] :
+            return {"error": False, "data": response_dict['data']}
+        else:
+            return {"error": True, "data": None, "message": response_dict.get('message', 'Unknown error occurred')}
     
-    def recommend(self, age: Optional[float], description: str, number_items:int=10) -> dict:
+    def build_batch_request(self, age: Optional[float], description: str, number_items:int=10) -> dict:
+        """
+        Returns the Messages API parameters of a strengths query, for a Message Batch.
+        """
+        return recommendations.init.build_request(self.__build_query(description, self.document_context, age=age, number_items=number_items), output="strengths")
+    
+    def format_batch_result(self, response: str) -> dict:
+        """
+        Converts the response of a Message Batch item into the result returned by `recommend`.
+        """
+        return self.__format_response(response)
+    
+    def recommend(self, age: Optional[float], description: str, number_items:int=10, use_cache: bool = True) -> dict:
         """
         Recomamend strengths based on the provided profile information age : {age} and description : {description}
         """
         try:
             # Generate recommendations of strength for age {age} and the description : {description}
-            response = self.__send_query(description, self.document_context, age=age, number_items=number_items)
-            print(f"Response from Claude: {response}")
-            response = response.replace("<output>", "").replace("</output>", "").strip()
-            print(f"\n\nCleaned response: {response}")
-            response_dict = recommendations.init.process_response(response)
- 
-            if not response_dict['error'] :
-                return {"error": False, "data": response_dict['data']}
-            else:
-                return {"error": True, "data": None, "message": response_dict.get('message', 'Unknown error occurred')}
+            query = self.__build_query(description, self.document_context, age=age, number_items=number_items)
+            response = recommendations.init.send_query(query, use_cache=use_cache, output="strengths")
+            return self.__format_response(response)
+        except (UpstreamUnavailableError, TimeoutError):
+            raise
         except Exception as e:
             # Capture toutes les erreurs pour les retourner de manière structurée
             return {"error": True, "data": None, "message": str(e)}
-
+    
+    async def recommend_async(self, age: Optional[float], description: str, number_items:int=10, use_cache: bool = True) -> dict:
+        """
+        Asynchronous version of `recommend`, awaiting the model call on the shared asynchronous client.
+        """
+        try:
+            query = self.__build_query(description, self.document_context, age=age, number_items=number_items)
+            response = await recommendations.init.send_query_async(query, use_cache=use_cache, output="strengths")
+            return self.__format_response(response)
+        except (UpstreamUnavailableError, TimeoutError):
+            raise
+        except Exception as e:
+            # Capture toutes les erreurs pour les retourner de manière structurée
+            return {"error": True, "data": None, "message": str(e)}
+    
+    async def recommend_stream(self, age: Optional[float], description: str, number_items:int=10, use_cache: bool = True):
+        """
+            Streams the strengths recommendations, yielding each item as soon as it is complete in the model response.
+        """
+        query = self.__build_query(description, self.document_context, age=age, number_items=number_items)
+        async with aclosing(recommendations.init.stream_items(query, use_cache=use_cache, output="strengths")) as stream:
+            async for _, item in stream:
+                if isinstance(item, str):
+                    yield item.strip()
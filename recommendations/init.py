@@ -1,35 +1,184 @@
-import os
 import json
+import asyncio
+import time
+from typing import Optional
+from contextlib import aclosing
 import anthropic
 
-### Load Claude
-with open('./api_key.json', 'r', encoding="utf-8") as file:
-    claude3haiku_api_key = json.load(file)['Claude']
-    os.environ['ANTHROPIC_API_KEY'] = claude3haiku_api_key
+import utils.variables as variables
+from recommendations.cache import response_cache
+from recommendations.stream_parser import IncrementalOutputParser
+from recommendations.resilience import call_with_retry, call_with_retry_async, deadline_expired, retry_after, remaining_time
+from recommendations.admission import admission
+from recommendations.backends import AnthropicBackend, make_backend
+from recommendations.structured_output import output_tool, tool_output_text
+from recommendations.json_repair import repair_json
+from utils.metrics import json_reasks, json_repairs, model_call_duration, model_escalations, model_time_to_first_token, model_tokens, parse_failures, parsed_responses, timeouts
+
+# Backend of the model calls (Anthropic API, or the deterministic fake of the load tests), see recommendations.backends.
+# Backend des appels au modèle (API d'Anthropic, ou faux backend déterministe des tests de charge).
+backend = make_backend()
+# Anthropic client of the Message Batches when the model calls go to another backend.
+# Client Anthropic des Message Batches lorsque les appels au modèle passent par un autre backend.
+_batch_backend: Optional[AnthropicBackend] = None
+
+
+def get_async_client() -> anthropic.AsyncAnthropic:
+    """
+        Returns the shared asynchronous Anthropic client, for the APIs not covered by the backends (Message Batches).
+        The client is created, and `./api_key.json` read, on first use.
+    """
     
-client = anthropic.Anthropic()
+    if isinstance(backend, AnthropicBackend):
+        return backend.async_client
+    global _batch_backend
+    if _batch_backend is None:
+        _batch_backend = AnthropicBackend()
+    return _batch_backend.async_client
 
 
-def send_query(query:dict):
-    """    
-        Sends a query to the Claude model and returns the response.
+# Tokens consumed since the worker started, including the prompt cache reads and writes.
+# Tokens consommés depuis le démarrage du worker, y compris les lectures et écritures du cache de prompt.
+usage_totals = {
+    "calls": 0,
+    "input_tokens": 0,
+    "output_tokens": 0,
+    "cache_creation_input_tokens": 0,
+    "cache_read_input_tokens": 0,
+    # Appels abandonnés à l'expiration de l'échéance ou à la déconnexion du client : requête HTTP interrompue.
+    "abandoned_calls": 0,
+}
+
+
+def split_prompt(prompt: str) -> tuple:
+    """
+        Splits a rendered prompt template into its static instructions and its variable part.
+        The variable part starts at the `<input>` block; everything before it is identical between calls.
         
-        :param query: The query to send to the Claude model.
-        :return: The response from the Claude model.
+        :param prompt: The rendered prompt.
+        :return: A tuple (static instructions, variable part).
+    """
+    
+    index = prompt.find("<input>")
+    if index <= 0:
+        return "", prompt
+    return prompt[:index], prompt[index:]
+
+
+def _document_block(document: dict) -> dict:
+    return {
+        "type": "document",
+        "source": {
+            "type": "file",
+            "file_id": document["file_id"]
+        },
+        "title": document.get("title"), # Optional
+        "context": document.get("context"), # Optional
+        # "citations": {"enabled": True} # Optional, enables citations
+    }
+
+
+def build_content(prompt: str, documents: list, attachments: Optional[list] = None) -> list:
+    """
+        Builds the content of a user message so that the static parts form a stable, cached prefix.
+        The reference documents come first, then the instructions of the prompt, marked with `cache_control`,
+        then the documents attached to this request and finally the variable `<input>` block.
+        
+        :param prompt: The rendered prompt.
+        :param documents: The reference documents, as dictionaries with `file_id`, `title` and `context` keys.
+        :param attachments: The documents uploaded with the request, in the same format; they stay after the cache breakpoint.
+        :return: The list of content blocks of the message.
     """
     
-    response = client.beta.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=10000,
-        messages=query,
-        betas=["files-api-2025-04-14"],
-        # max_tokens=16000,
-        # thinking={  #Extended Thinking
+    content = [_document_block(document) for document in documents]
+    
+    instructions, variable_part = split_prompt(prompt)
+    if instructions:
+        content.append({"type": "text", "text": instructions})
+    
+    # The cache breakpoint closes the static prefix (documents + instructions).
+    # Le point de cache ferme le préfixe statique (documents + instructions).
+    if content:
+        content[-1]["cache_control"] = {"type": "ephemeral"}
+    
+    content.extend(_document_block(document) for document in attachments or [])
+    content.append({"type": "text", "text": variable_part})
+    return content
+
+
+def record_usage(usage) -> None:
+    """
+        Adds the token usage of a Claude response, including prompt cache reads and writes, to `usage_totals`.
+        
+        :param usage: The `usage` of the message returned by the Claude model.
+    """
+    
+    if usage is None:
+        return
+    usage_totals["calls"] += 1
+    for field in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+        tokens = getattr(usage, field, None) or 0
+        usage_totals[field] += tokens
+        model_tokens.inc(tokens, type=field.replace("_input_tokens", "").replace("_tokens", ""))
+    if getattr(usage, "output_tokens", None):
+        admission.record_output_tokens(usage.output_tokens)
+
+
+def model_tier(output: Optional[str]) -> str:
+    """
+        Returns the tier of the model answering a recommender ("small" or "large"), see `ELSIA_<RECOMMENDER>_TIER`.
+    """
+    
+    tier = variables.recommender_tiers.get(output, "large")
+    return tier if tier in variables.model_tiers else "large"
+
+
+def build_request(query: list, output: Optional[str] = None, tier: Optional[str] = None, tools: bool = True) -> dict:
+    """
+        Builds the parameters of a Messages API call for the given query.
+        The model and `max_tokens` are those of the tier of the recommender: the keyword extractions
+        (strengths, challenges, needs) go to the small model by default, the generations to the large one.
+        With `ELSIA_STRUCTURED_OUTPUT`, the model is made to answer through the tool of the recommender,
+        whose input follows the JSON schema of its response model (see `recommendations.structured_output`).
+        
+        :param query: The list of messages to send to the Claude model.
+        :param output: The name of the recommender, e.g. "goals" or "full".
+        :param tier: The tier of the model, by default the one of the recommender.
+        :param tools: Whether the tool of the recommender may be used (the streamed queries parse the text).
+        :return: The keyword arguments for `messages.create`.
+    """
+    
+    model = variables.model_tiers[tier or model_tier(output)]
+    request = {
+        "model": model["model"],
+        "max_tokens": model["max_tokens"],
+        "messages": query,
+        "betas": ["files-api-2025-04-14"],
+        # "max_tokens": 16000,
+        # "thinking": {  #Extended Thinking
         #     "type": "enabled",
         #     "budget_tokens": 10000
         # },
-    )
+    }
+    tool = output_tool(output) if tools else None
+    if tool is not None:
+        request["tools"] = [tool]
+        request["tool_choice"] = {"type": "tool", "name": tool["name"]}
+    return request
+
 
+def extract_text(response) -> str:
+    """
+        Returns the first text (or thinking) block of a Claude response.
+        The input of a tool call is returned first, converted into the `<output>` text of the free-text answers.
+        
+        :param response: The message returned by the Claude model.
+        :return: The text of the response.
+    """
+    
+    for block in response.content:
+        if block.type == "tool_use":
+            return tool_output_text(block.input)
     for block in response.content:
         if block.type == "thinking":
             return block.thinking
@@ -38,6 +187,388 @@ def send_query(query:dict):
     return response.content
 
 
+def _cache_key(request: dict, use_cache: bool) -> Optional[str]:
+    """
+        Returns the cache key of the request, or None when the cache is disabled or bypassed for this request.
+    """
+    
+    if not variables.cache_enabled:
+        return None
+    if not use_cache:
+        response_cache.record_bypass()
+        return None
+    return response_cache.make_key(request)
+
+
+def _cache_lookup(request: dict, use_cache: bool):
+    """
+        Returns the cache key of the request and the cached response, if any.
+        The key is None when the cache is disabled or bypassed for this request.
+    """
+    
+    key = _cache_key(request, use_cache)
+    return key, response_cache.get(key) if key is not None else None
+
+
+async def _cache_lookup_async(request: dict, use_cache: bool):
+    """
+        Same as `_cache_lookup`, without blocking the event loop on the SQLite tier of the cache.
+    """
+    
+    key = _cache_key(request, use_cache)
+    return key, await response_cache.get_async(key) if key is not None else None
+
+
+def _cacheable(key, response) -> bool:
+    """
+        Tells whether the response can be cached: only when it can be processed, so that failures are retried on the next call.
+        The outputs truncated by `max_tokens`, whose items were only partly salvaged, are not cached either.
+    """
+    
+    if key is None or not isinstance(response, str):
+        return False
+    result = _parse_response(response)
+    return not result['error'] and result.get('repair') != "truncated"
+
+
+def _cache_store(key, response):
+    """
+        Caches the response when it is `_cacheable`.
+    """
+    
+    if _cacheable(key, response):
+        response_cache.set(key, response)
+
+
+async def _cache_store_async(key, response):
+    """
+        Same as `_cache_store`, without blocking the event loop on the SQLite tier of the cache.
+    """
+    
+    if _cacheable(key, response):
+        await response_cache.set_async(key, response)
+
+
+def _estimate_input_tokens(request: dict) -> int:
+    """
+        Roughly estimates the number of input tokens of a request (about 4 characters per token).
+    """
+    
+    return len(json.dumps(request["messages"], ensure_ascii=False)) // 4
+
+
+def _deadline_timeout():
+    """
+        Returns the HTTP timeout of a call: the time left before the deadline of the request, or None without deadline.
+        
+        :raises TimeoutError: If the deadline has already expired.
+    """
+    
+    remaining = remaining_time()
+    if remaining is None:
+        return None
+    if remaining <= 0:
+        raise TimeoutError("The deadline of the request expired before the call to the model.")
+    return remaining
+
+
+async def _create_async(request: dict, **kwargs):
+    """
+        Performs one call to the Messages API and feeds its `anthropic-ratelimit-*` headers to the admission controller.
+        The HTTP request is bounded by the deadline of the request, and aborted if the caller is cancelled.
+    """
+    
+    timeout = _deadline_timeout()
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    start = time.perf_counter()
+    try:
+        response, headers = await backend.create_async(request, **kwargs)
+    except asyncio.CancelledError:
+        usage_totals["abandoned_calls"] += 1
+        raise
+    except anthropic.APITimeoutError:
+        timeouts.inc(scope="model_call")
+        # L'appel coupé par l'échéance de la requête est abandonné, comme un appel annulé.
+        if deadline_expired():
+            usage_totals["abandoned_calls"] += 1
+        raise
+    except anthropic.APIStatusError as error:
+        admission.update_from_headers(error.response.headers)
+        if error.status_code == 429:
+            admission.on_rate_limited(retry_after(error))
+        raise
+    admission.update_from_headers(headers)
+    if not kwargs.get("stream"):
+        model_call_duration.observe(time.perf_counter() - start, mode="message")
+    return response
+
+
+async def _admitted_create_async(request: dict):
+    """
+        Performs one call to the Messages API while holding a slot of the admission controller.
+    """
+    
+    async with admission.slot(input_tokens=_estimate_input_tokens(request)):
+        return await _create_async(request)
+
+
+async def upload_file_async(filename: str, data: bytes, media_type: str) -> str:
+    """
+        Uploads a document to the Files API, so that it can be referenced by its `file_id` in the queries.
+        
+        :param filename: The name of the file.
+        :param data: The content of the file.
+        :param media_type: The MIME type of the file (e.g. "application/pdf").
+        :return: The `file_id` of the uploaded document.
+    """
+    
+    return await call_with_retry_async(lambda: backend.upload_file(filename, data, media_type, timeout=_deadline_timeout()))
+
+
+# Message sent back with an output that cannot be parsed, even after the local repair.
+# Message renvoyé avec une sortie qui ne peut pas être analysée, même après la réparation locale.
+REASK_PROMPT = (
+    "Your previous answer is not valid JSON. Return exactly the same content as valid JSON, "
+    "between <output> and </output> tags, without any comment."
+)
+
+
+def _reask_request(request: dict, text: str) -> Optional[dict]:
+    """
+        Builds the request correcting an output that cannot be parsed, even after the local repair, or returns None
+        when the output can be parsed (or is empty) or the correction is disabled (`ELSIA_JSON_REASK`).
+        The previous output is sent back as the assistant turn, and the `max_tokens` of the correction is bounded
+        by the length of that output, so that it costs about one rewriting of the output and not a new generation.
+    """
+    
+    if not variables.json_reask or _parse_response(text).get("reason") != "invalid_json":
+        return None
+    return {
+        **request,
+        "max_tokens": min(variables.json_reask_max_tokens, len(text) // 3 + 256),
+        "messages": request["messages"] + [
+            {"role": "assistant", "content": text.strip()},
+            {"role": "user", "content": REASK_PROMPT},
+        ],
+    }
+
+
+def _reask_result(text: str, response) -> str:
+    """
+        Returns the corrected output when it can be parsed, and the original output otherwise.
+    """
+    
+    record_usage(response.usage)
+    corrected = extract_text(response)
+    if _parse_response(corrected)["error"]:
+        json_reasks.inc(outcome="failed")
+        return text
+    json_reasks.inc(outcome="corrected")
+    return corrected
+
+
+def _escalation_tier(tier: str, text: str) -> Optional[str]:
+    """
+        Returns "large" when the output of the small model must be generated again by the large model
+        (`ELSIA_MODEL_ESCALATION`): it cannot be parsed, even after the local repair and the correction,
+        or only the items of an output truncated by the `max_tokens` of the small tier could be salvaged.
+    """
+    
+    if not variables.model_escalation or tier == "large":
+        return None
+    result = _parse_response(text)
+    if (result["error"] and not result.get("api_error")) or result.get("repair") == "truncated":
+        return "large"
+    return None
+
+
+def send_query(query:dict, use_cache: bool = True, output: Optional[str] = None):
+    """    
+        Sends a query to the Claude model and returns the response.
+        
+        :param query: The query to send to the Claude model.
+        :param use_cache: Whether the response cache may be used for this query.
+        :param output: The name of the recommender, see `build_request`.
+        :return: The response from the Claude model.
+    """
+    
+    tier = model_tier(output)
+    request = build_request(query, output, tier)
+    key, cached = _cache_lookup(request, use_cache)
+    if cached is not None:
+        return cached
+    
+    while True:
+        start = time.perf_counter()
+        response = call_with_retry(lambda: backend.create(request, timeout=_deadline_timeout()))
+        model_call_duration.observe(time.perf_counter() - start, mode="message")
+        record_usage(response.usage)
+        text = extract_text(response)
+        reask = _reask_request(request, text)
+        if reask is not None:
+            try:
+                text = _reask_result(text, backend.create(reask, timeout=_deadline_timeout()))
+            except Exception:
+                json_reasks.inc(outcome="error")
+        tier = _escalation_tier(tier, text)
+        if tier is None:
+            break
+        model_escalations.inc(output=output or "unknown")
+        request = build_request(query, output, tier)
+    _cache_store(key, text)
+    return text
+
+
+async def send_query_async(query: list, use_cache: bool = True, output: Optional[str] = None):
+    """
+        Sends a query to the Claude model without blocking the event loop and returns the response.
+        
+        :param query: The query to send to the Claude model.
+        :param use_cache: Whether the response cache may be used for this query.
+        :param output: The name of the recommender, see `build_request`.
+        :return: The response from the Claude model.
+    """
+    
+    tier = model_tier(output)
+    request = build_request(query, output, tier)
+    key, cached = await _cache_lookup_async(request, use_cache)
+    if cached is not None:
+        return cached
+    
+    while True:
+        # The slot is taken for every attempt, so that the backoff between two attempts does not hold it.
+        # Le créneau est pris à chaque tentative : l'attente entre deux tentatives ne l'occupe pas.
+        response = await call_with_retry_async(lambda: _create_async(request), slot=lambda: admission.slot(input_tokens=_estimate_input_tokens(request)))
+        record_usage(response.usage)
+        text = extract_text(response)
+        reask = _reask_request(request, text)
+        if reask is not None:
+            # Une seule tentative, sans relance : en cas d'échec, la réponse d'origine est traitée comme avant.
+            try:
+                text = _reask_result(text, await _admitted_create_async(reask))
+            except Exception:
+                json_reasks.inc(outcome="error")
+        # Sortie du petit modèle toujours invalide : une seule nouvelle génération, par le grand modèle.
+        tier = _escalation_tier(tier, text)
+        if tier is None:
+            break
+        model_escalations.inc(output=output or "unknown")
+        request = build_request(query, output, tier)
+    # La réponse du grand modèle est mise en cache sous la clé de la requête d'origine : elle ne sera plus escaladée.
+    await _cache_store_async(key, text)
+    return text
+
+
+async def stream_query(query: list, use_cache: bool = True, output: Optional[str] = None, tier: Optional[str] = None):
+    """
+        Sends a query to the Claude model with the streaming Messages API and yields the text as it is generated.
+        A cached response is yielded in a single chunk.
+        
+        :param query: The query to send to the Claude model.
+        :param use_cache: Whether the response cache may be used for this query.
+        :param output: The name of the recommender, which gives the tier of the model.
+        :param tier: The tier of the model, by default the one of the recommender.
+        :return: An asynchronous iterator over the chunks of text of the response.
+    """
+    
+    request = build_request(query, output, tier, tools=False)
+    key, cached = await _cache_lookup_async(request, use_cache)
+    if cached is not None:
+        yield cached
+        return
+    
+    # Only the opening of the stream is retried: once text has been sent to the client it cannot be replayed.
+    # Seule l'ouverture du flux est relancée : le texte déjà envoyé au client ne peut pas être rejoué.
+    # The admission slot is held until the end of the stream.
+    # Le créneau d'admission est conservé jusqu'à la fin du flux.
+    # Closing the stream (client gone, timeout) closes the HTTP response of the model.
+    # La fermeture du flux (client parti, timeout) ferme la réponse HTTP du modèle.
+    chunks = []
+    usage = None
+    async with admission.slot(input_tokens=_estimate_input_tokens(request)):
+        start = time.perf_counter()
+        stream = await call_with_retry_async(lambda: _create_async(request, stream=True))
+        try:
+            async with stream:
+                async for event in stream:
+                    if event.type == "message_start":
+                        usage = event.message.usage
+                    elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                        if not chunks:
+                            model_time_to_first_token.observe(time.perf_counter() - start)
+                        chunks.append(event.delta.text)
+                        yield event.delta.text
+                    elif event.type == "message_delta" and usage is not None:
+                        usage.output_tokens = event.usage.output_tokens
+        except (GeneratorExit, asyncio.CancelledError):
+            usage_totals["abandoned_calls"] += 1
+            record_usage(usage)
+            raise
+        except anthropic.APITimeoutError:
+            timeouts.inc(scope="model_call")
+            if deadline_expired():
+                usage_totals["abandoned_calls"] += 1
+            record_usage(usage)
+            raise
+    model_call_duration.observe(time.perf_counter() - start, mode="stream")
+    record_usage(usage)
+    await _cache_store_async(key, "".join(chunks))
+
+
+async def stream_items(query: list, use_cache: bool = True, output: Optional[str] = None):
+    """
+        Streams a query and yields every top-level element of the `<output>` JSON as soon as it is complete.
+        When the small model streamed nothing that can be parsed, the query is streamed again by the large model
+        (`ELSIA_MODEL_ESCALATION`); once items have been sent, the stream cannot be replayed.
+        
+        :param query: The query to send to the Claude model.
+        :param use_cache: Whether the response cache may be used for this query.
+        :param output: The name of the recommender, which gives the tier of the model.
+        :return: An asynchronous iterator over (key, value) tuples; the key is None for the items of a list.
+    """
+    
+    tier = model_tier(output)
+    while True:
+        parser = IncrementalOutputParser()
+        text = []
+        yielded = 0
+        async with aclosing(stream_query(query, use_cache=use_cache, output=output, tier=tier)) as chunks:
+            async for chunk in chunks:
+                text.append(chunk)
+                for key, value in parser.feed(chunk):
+                    if key == "error":
+                        raise ValueError(value)
+                    yielded += 1
+                    yield key, value
+        if yielded:
+            break
+        # Aucun élément JSON valide dans le flux (liste Python, par exemple) : la réponse complète est réparée localement.
+        value, repair = repair_json("".join(text).replace("<output>", "").replace("</output>", ""))
+        if repair is None or not isinstance(value, (list, dict)):
+            parse_failures.inc(reason="invalid_json", output="text")
+            if variables.model_escalation and tier != "large":
+                model_escalations.inc(output=output or "unknown")
+                tier = "large"
+                continue
+            raise ValueError("Failed to decode JSON response.")
+        json_repairs.inc(kind=repair)
+        for key, item in (value.items() if isinstance(value, dict) else ((None, item) for item in value)):
+            yield key, item
+        break
+    parsed_responses.inc(output="text")
+
+
+async def close_clients():
+    """
+        Closes the HTTP connection pools of the Claude clients.
+    """
+    
+    await backend.close()
+    if _batch_backend is not None:
+        await _batch_backend.close()
+
+
 
 """
 HTTP errors from claude API
@@ -82,19 +613,49 @@ Errors are always returned as JSON, with a top-level error object that always in
 def process_response(response: str) -> dict:
     """
         Processes the response from the Claude model and returns it as a dictionary.
+        The responses are counted in `elsia_parsed_responses_total` and those that cannot be parsed in
+        `elsia_parse_failures_total`, by output mode ("tool" or "text"), which gives the failure rate of each mode;
+        the sections of a full profile dropped because they are not lists are counted as "dropped_section" failures.
+        The outputs that `json.loads` rejects are repaired locally when possible (`recommendations.json_repair`),
+        and counted in `elsia_json_repairs_total`.
         
         :param response: The response string from the Claude model.
         :return: A dictionary containing the error status and the processed response.
     """
     
+    result = _parse_response(response)
+    mode = "tool" if variables.structured_output else "text"
+    if result["error"] and not result.get("api_error"):
+        parse_failures.inc(reason=result.get("reason", "no_data"), output=mode)
+    else:
+        parsed_responses.inc(output=mode)
+    if result.get("dropped"):
+        parse_failures.inc(len(result["dropped"]), reason="dropped_section", output=mode)
+    if result.get("repair"):
+        json_repairs.inc(kind=result["repair"])
+    return result
+
+
+def _parse_response(response: str) -> dict:
+    """
+        Parses the response from the Claude model, see `process_response`, without counting the failures.
+    """
+    
     if not response:
-        return {"error": True, "message": "No response from Claude."}
+        return {"error": True, "reason": "empty", "message": "No response from Claude."}
     
     try:
         
         # Clean the response by removing any XML-like tags
         response = response.replace("<output>", "").replace("</output>", "").strip()
-        response = json.loads(response)
+        repair = None
+        try:
+            response = json.loads(response)
+        except json.JSONDecodeError:
+            # Réparation locale (virgules finales, listes Python, blocs de code, sortie tronquée) avant tout nouvel appel.
+            response, repair = repair_json(response)
+            if repair is None:
+                return {"error": True, "api_error":False, "reason": "invalid_json", "message": "Failed to decode JSON response."}
         # Check Claude return error message in response
         if 'error' in response:
             return {"error": True, "api_error":True, "message": response['error']}
@@ -108,17 +669,21 @@ def process_response(response: str) -> dict:
             if len(data) == 0:
                 return {"error": True, "api_error":False, "message": "No data found in the response."}
             else:
-                return {"error": False, "api_error":False, "data": data}
+                return {"error": False, "api_error":False, "data": data, "repair": repair}
         elif isinstance(response, dict):
             data = {}
+            dropped = []
             for key, value in response.items():
                 if isinstance(value, list):
                     data[key] =  value
+                else:
+                    dropped.append(key)
             if len(data) == 0:
                 return {"error": True, "api_error":False, "message": "No data found in the response."}
             else:
-                return {"error": False, "api_error":False, "data": data}
+                # Les sections qui ne sont pas des listes sont écartées, et comptées par `process_response`.
+                return {"error": False, "api_error":False, "data": data, "dropped": dropped, "repair": repair}
         else:
-            return {"error": True, "api_error":False, "message": "Unexpected response format."}
+            return {"error": True, "api_error":False, "reason": "unexpected_format", "message": "Unexpected response format."}
     except json.JSONDecodeError:
-        return {"error": True, "api_error":False, "message": "Failed to decode JSON response."}
+        return {"error": True, "api_error":False, "reason": "invalid_json", "message": "Failed to decode JSON response."}
@@ -0,0 +1,398 @@
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from typing import List, Optional
+
+import httpx
+
+from recommendations.admission import PRIORITY_FULL, request_priority
+from recommendations.generate_full import FullRecommendation
+from recommendations.prompt_registry import prompt_registry
+from recommendations.resilience import UpstreamUnavailableError, set_deadline
+from utils.logging_setup import setup_logger
+from utils.metrics import jobs_finished
+from utils.uploads import StoredUpload
+
+import utils.variables as variables
+
+
+jobs_logger = setup_logger("jobs")
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+_PUBLIC_COLUMNS = ("id", "type", "status", "attempts", "created_at", "started_at", "finished_at", "message", "callback_url", "callback_status")
+
+
+class JobStore:
+    """
+    Durable SQLite queue of the full profile jobs, shared by all the uvicorn workers.
+    A running job holds a lease renewed by its worker: when the worker stops, the lease expires and the job is claimed again.
+    The callback of a finished job is held with a lease the same way, until its delivery is recorded.
+    """
+    # File d'attente SQLite durable des tâches de profil complet, partagée par tous les workers uvicorn.
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, type TEXT NOT NULL, status TEXT NOT NULL, request TEXT NOT NULL, file TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, available_at REAL NOT NULL, lease_until REAL, worker TEXT, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL, data TEXT, message TEXT, "
+                "callback_url TEXT, callback_status TEXT)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=10.0)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    @staticmethod
+    def _public(row: sqlite3.Row) -> dict:
+        job = {column: row[column] for column in _PUBLIC_COLUMNS}
+        job["data"] = json.loads(row["data"]) if row["data"] else None
+        return job
+
+    def create_job(self, job_id: str, request: dict, file: Optional[dict], callback_url: Optional[str]) -> dict:
+        """
+        Queues a job, and deletes the finished jobs older than `ELSIA_JOB_RETENTION` seconds.
+        """
+        now = time.time()
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT INTO jobs (id, type, status, request, file, available_at, created_at, callback_url) VALUES (?, 'full', 'queued', ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(request, ensure_ascii=False), json.dumps(file) if file else None, now, now, callback_url)
+            )
+            connection.execute("DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?", (now - variables.job_retention,))
+        return self.get_job(job_id)
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        with closing(self._connect()) as connection, connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._public(row) if row is not None else None
+
+    def claim(self, worker: str, lease: float, max_attempts: int) -> Optional[dict]:
+        """
+        Takes the oldest queued job, a running job whose lease expired, or a finished job whose callback is still pending, for `worker`.
+        A job whose lease expired `max_attempts` times is failed instead of being started again.
+        A finished job is returned with its status unchanged: only its callback is to be delivered.
+
+        :return: The full row of the claimed job (with its request and file), or None if no job is waiting.
+        """
+        with self._lock:
+            connection = self._connect()
+            connection.isolation_level = None
+            try:
+                # BEGIN IMMEDIATE : un seul processus à la fois sélectionne et prend une tâche.
+                connection.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                while True:
+                    row = connection.execute(
+                        "SELECT * FROM jobs WHERE (status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_until < ?) "
+                        "OR (status IN ('succeeded', 'failed') AND callback_status = 'pending' AND (lease_until IS NULL OR lease_until < ?)) "
+                        "ORDER BY created_at LIMIT 1", (now, now, now)
+                    ).fetchone()
+                    if row is None:
+                        connection.execute("COMMIT")
+                        return None
+                    if row["status"] == "running" and row["attempts"] >= max_attempts:
+                        connection.execute(
+                            "UPDATE jobs SET status = 'failed', finished_at = ?, worker = NULL, message = ?, "
+                            "callback_status = CASE WHEN callback_url IS NULL THEN NULL ELSE 'pending' END WHERE id = ?",
+                            (now, f"The job was interrupted {row['attempts']} times.", row["id"])
+                        )
+                        _remove_file(json.loads(row["file"]) if row["file"] else None)
+                        continue
+                    if row["status"] in TERMINAL_STATUSES:
+                        # Rappel non livré (worker arrêté pendant sa livraison) : seule la livraison est reprise.
+                        connection.execute("UPDATE jobs SET worker = ?, lease_until = ? WHERE id = ?", (worker, now + lease, row["id"]))
+                    else:
+                        connection.execute(
+                            "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_until = ?, started_at = ? WHERE id = ?",
+                            (worker, now + lease, now, row["id"])
+                        )
+                    claimed = connection.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                    connection.execute("COMMIT")
+                    return dict(claimed)
+            except BaseException:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                raise
+            finally:
+                connection.close()
+
+    def renew(self, job_id: str, worker: str, lease: float) -> bool:
+        """
+        Extends the lease of `worker` on a running job or on the pending callback of a finished job.
+        :return: False if the job is no longer held by `worker`.
+        """
+        with self._lock, closing(self._connect()) as connection, connection:
+            return connection.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ?",
+                                      (time.time() + lease, job_id, worker)).rowcount > 0
+
+    def requeue(self, job_id: str, worker: str, delay: float = 0.0, message: Optional[str] = None, count_attempt: bool = True) -> bool:
+        """
+        Puts a running job back in the queue, available in `delay` seconds.
+        """
+        with self._lock, closing(self._connect()) as connection, connection:
+            return connection.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, available_at = ?, message = ?, "
+                "attempts = attempts - ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + delay, message, 0 if count_attempt else 1, job_id, worker)
+            ).rowcount > 0
+
+    def finish(self, job_id: str, worker: str, status: str, data: Optional[dict], message: Optional[str], lease: float) -> Optional[dict]:
+        """
+        Stores the outcome of a job, unless `worker` lost it (its lease expired and another worker claimed it).
+        A job with a callback URL stays held by `worker` for `lease` seconds, the time to deliver its callback.
+        :return: The finished job, or None if the job is no longer held by `worker`.
+        """
+        now = time.time()
+        with self._lock, closing(self._connect()) as connection, connection:
+            updated = connection.execute(
+                "UPDATE jobs SET status = ?, data = ?, message = ?, finished_at = ?, "
+                "worker = CASE WHEN callback_url IS NULL THEN NULL ELSE worker END, "
+                "lease_until = CASE WHEN callback_url IS NULL THEN NULL ELSE ? END, "
+                "callback_status = CASE WHEN callback_url IS NULL THEN NULL ELSE 'pending' END "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (status, json.dumps(data, ensure_ascii=False) if data is not None else None, message, now, now + lease, job_id, worker)
+            ).rowcount
+        return self.get_job(job_id) if updated else None
+
+    def set_callback_status(self, job_id: str, worker: str, callback_status: str) -> None:
+        """
+        Records the outcome of the delivery of a callback, and releases the job held by `worker`.
+        """
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.execute("UPDATE jobs SET callback_status = ?, worker = NULL, lease_until = NULL WHERE id = ? AND worker = ?",
+                               (callback_status, job_id, worker))
+
+    def counts(self) -> dict:
+        """
+        Returns the number of jobs by status.
+        """
+        with closing(self._connect()) as connection, connection:
+            rows = connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in ("queued", "running", *TERMINAL_STATUSES)} | {row[0]: row[1] for row in rows}
+
+
+job_store = JobStore(variables.job_store_path)
+
+
+def _copy_upload(upload: StoredUpload, path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if upload.path is not None:
+        shutil.copyfile(upload.path, path)
+    else:
+        with open(path, "wb") as file:
+            file.write(upload.data)
+
+
+def _remove_file(file: Optional[dict]) -> None:
+    if file:
+        try:
+            os.remove(file["path"])
+        except FileNotFoundError:
+            pass
+
+
+async def submit_job(age: Optional[float], gender: str, description: str, upload: Optional[StoredUpload], pipeline: bool,
+                     use_cache: bool = True, callback_url: Optional[str] = None) -> dict:
+    """
+    Queues the generation of a full profile. The uploaded file is copied next to the queue, so that the job survives
+    the end of the request and the restarts of the workers.
+
+    :return: The queued job.
+    """
+    job_id = str(uuid.uuid4())
+    file = None
+    if upload is not None:
+        path = os.path.join(variables.job_files_directory, f"{job_id}{upload.extension}")
+        await asyncio.to_thread(_copy_upload, upload, path)
+        file = {"filename": upload.filename, "extension": upload.extension, "size": upload.size, "sha256": upload.sha256, "path": path}
+    request = {"age": age, "gender": gender, "description": description, "pipeline": pipeline, "use_cache": use_cache,
+               "number_items": variables.number_of_items}
+    job = await asyncio.to_thread(job_store.create_job, job_id, request, file, callback_url)
+    job_workers.notify()
+    return job
+
+
+async def wait_for_job(job_id: str, wait: float) -> Optional[dict]:
+    """
+    Returns the job once it is finished, or after `wait` seconds (long polling). The queue is read every
+    `ELSIA_JOB_POLL_INTERVAL` seconds, since the job may run in another process.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        job = await asyncio.to_thread(job_store.get_job, job_id)
+        remaining = deadline - time.monotonic()
+        if job is None or job["status"] in TERMINAL_STATUSES or remaining <= 0:
+            return job
+        await asyncio.sleep(min(variables.job_poll_interval, remaining))
+
+
+async def deliver_callback(job: dict) -> str:
+    """
+    Sends the finished job by POST to its callback URL, retrying with an exponential backoff.
+    :return: "delivered" on a 2xx response, "failed" otherwise.
+    """
+    async with httpx.AsyncClient(timeout=variables.job_callback_timeout) as client:
+        for attempt in range(variables.job_callback_attempts):
+            try:
+                response = await client.post(job["callback_url"], json=job)
+                if response.is_success:
+                    return "delivered"
+                jobs_logger.warning(f"Callback of job {job['id']} answered {response.status_code}.")
+            except httpx.HTTPError as e:
+                jobs_logger.warning(f"Callback of job {job['id']} failed: {e!r}")
+            if attempt + 1 < variables.job_callback_attempts:
+                await asyncio.sleep(2 ** attempt)
+    return "failed"
+
+
+class JobWorkerPool:
+    """
+    Bounded pool of asyncio workers processing the queued jobs of this process.
+    """
+    # Pool borné de workers asyncio qui traitent les tâches de la file d'attente.
+
+    def __init__(self, size: int):
+        self.size = size
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._prefix = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work(f"{self._prefix}-{index}")) for index in range(self.size)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """
+        Wakes up the idle workers of this process after a submission.
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _work(self, worker: str) -> None:
+        # Les tâches passent après les requêtes interactives, comme le profil complet synchrone.
+        request_priority.set(PRIORITY_FULL)
+        while True:
+            try:
+                job = await asyncio.to_thread(job_store.claim, worker, variables.job_lease, variables.job_max_attempts)
+            except Exception as e:
+                jobs_logger.error(f"Job queue unavailable: {e!r}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), variables.job_poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            if job["status"] in TERMINAL_STATUSES:
+                await self._deliver(worker, JobStore._public(job))
+            else:
+                await self._run(worker, job)
+
+    async def _heartbeat(self, job_id: str, worker: str, task: asyncio.Future) -> None:
+        while True:
+            await asyncio.sleep(variables.job_lease / 3)
+            if not await asyncio.to_thread(job_store.renew, job_id, worker, variables.job_lease):
+                # Bail perdu (tâche reprise par un autre worker) : le travail en cours est abandonné.
+                jobs_logger.warning(f"Job {job_id} lost the lease of {worker}; its processing is cancelled.")
+                task.cancel()
+                return
+
+    async def _leased(self, job_id: str, worker: str, coroutine) -> tuple:
+        """
+        Runs `coroutine` while the lease of `worker` on the job is renewed, and cancels it as soon as the lease is lost.
+        :return: A tuple (held, result); `held` is False, and the result None, when the lease was lost.
+        """
+        task = asyncio.ensure_future(coroutine)
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, worker, task))
+        try:
+            return True, await task
+        except asyncio.CancelledError:
+            # Seule l'annulation par le heartbeat est absorbée ; l'arrêt du worker est propagé.
+            if asyncio.current_task().cancelling():
+                raise
+            return False, None
+        finally:
+            heartbeat.cancel()
+            task.cancel()
+
+    async def _deliver(self, worker: str, job: dict) -> None:
+        """
+        Delivers the callback of a finished job; if the worker stops before its outcome is recorded,
+        the callback stays pending and is delivered again by the next worker that claims it.
+        """
+        held, outcome = await self._leased(job["id"], worker, deliver_callback(job))
+        if held:
+            await asyncio.to_thread(job_store.set_callback_status, job["id"], worker, outcome)
+
+    async def _run(self, worker: str, job: dict) -> None:
+        request = json.loads(job["request"])
+        file = json.loads(job["file"]) if job["file"] else None
+        upload = StoredUpload(file["filename"], file["extension"], file["size"], file["sha256"], path=file["path"]) if file else None
+        jobs_logger.info(f"Job {job['id']} started by {worker} (attempt {job['attempts']}).")
+
+        recommender = prompt_registry.recommender(FullRecommendation)
+        recommend = recommender.recommend_pipelined if request["pipeline"] else recommender.recommend
+        set_deadline(variables.job_timeout)
+        data, message = None, None
+        try:
+            held, result = await self._leased(job["id"], worker, asyncio.wait_for(
+                recommend(age=request["age"], gender=request["gender"], description=request["description"], file=upload,
+                          number_items=request["number_items"], use_cache=request["use_cache"]),
+                timeout=variables.job_timeout
+            ))
+            if not held:
+                return
+            status = "failed" if result.get("error") else "succeeded"
+            data = None if result.get("error") else result.get("data")
+            message = result.get("message")
+        except asyncio.CancelledError:
+            # Arrêt du processus : la tâche est remise dans la file sans compter cette tentative.
+            await asyncio.to_thread(job_store.requeue, job["id"], worker, 0.0, None, False)
+            raise
+        except asyncio.TimeoutError:
+            status, message = "failed", f"The job took longer than the allowed {variables.job_timeout:g} seconds to process."
+        except UpstreamUnavailableError as e:
+            if job["attempts"] < variables.job_max_attempts:
+                delay = max(1.0, e.retry_after or 1.0)
+                jobs_logger.warning(f"Job {job['id']} requeued in {delay:g} s: {e}")
+                await asyncio.to_thread(job_store.requeue, job["id"], worker, delay, str(e))
+                return
+            status, message = "failed", str(e)
+        except Exception as e:
+            status, message = "failed", f"An unexpected internal error has occurred during processing: {str(e)}"
+
+        finished = await asyncio.to_thread(job_store.finish, job["id"], worker, status, data, message, variables.job_lease)
+        if finished is None:
+            jobs_logger.warning(f"Job {job['id']} was taken over by another worker; its result is discarded.")
+            return
+        await asyncio.to_thread(_remove_file, file)
+        jobs_finished.inc(status=status)
+        jobs_logger.info(f"Job {job['id']} {status}: {message or ''}")
+        if finished["callback_url"]:
+            await self._deliver(worker, finished)
+
+
+job_workers = JobWorkerPool(variables.job_workers)
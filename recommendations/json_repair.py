@@ -0,0 +1,146 @@
+import ast
+import io
+import json
+import re
+import tokenize
+from typing import Optional, Tuple
+
+from recommendations.stream_parser import IncrementalOutputParser
+
+
+_CODE_FENCE = re.compile(r"```[a-zA-Z]*[ \t]*\n?(.*?)(?:```|$)", re.DOTALL)
+
+
+def _strip_wrapping(text: str) -> Tuple[str, str]:
+    """
+    Removes the markdown code fences and the text before the top-level JSON container.
+    :return: A tuple (text up to the last closing bracket, text up to the end): the end of the container
+        is missing when the output was truncated by `max_tokens`.
+    """
+    match = _CODE_FENCE.search(text)
+    if match:
+        text = match.group(1)
+    starts = [index for index in (text.find("["), text.find("{")) if index >= 0]
+    if not starts:
+        return text.strip(), text.strip()
+    text = text[min(starts):].rstrip()
+    end = max(text.rfind("]"), text.rfind("}"))
+    return (text[:end + 1] if end > 0 else text), text
+
+
+def _remove_trailing_commas(text: str) -> str:
+    """
+    Removes the commas followed by the end of a list or an object, outside of the strings.
+    """
+    characters = []
+    in_string = False
+    escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == ",":
+            following = text[index + 1:].lstrip()
+            if following[:1] in ("]", "}"):
+                continue
+        characters.append(char)
+    return "".join(characters)
+
+
+def _complete_items(text: str) -> Tuple[list, IncrementalOutputParser]:
+    """
+    Returns the complete top-level elements of a JSON container, including the last one when the container is not closed.
+    """
+    parser = IncrementalOutputParser()
+    elements = parser.feed(text)
+    pending = parser.pending().strip()
+    if pending and parser.started:
+        try:
+            elements.append((None, json.loads(pending)))
+        except ValueError:
+            pass
+    return elements, parser
+
+
+def _salvage(text: str):
+    """
+    Returns the complete elements of a truncated JSON list, or the complete sections of a truncated JSON object
+    (with the complete items of its last, unfinished section), or None when nothing can be salvaged.
+    """
+    parser = IncrementalOutputParser()
+    elements = parser.feed(text)
+    if not parser.started or parser.finished:
+        # Une sortie complète mais invalide n'est pas tronquée : ses éléments ne sont pas récupérés un à un.
+        return None
+    if text.lstrip().startswith("["):
+        items = [value for _, value in _complete_items(text)[0]]
+        return items or None
+
+    sections = dict(elements)
+    key, separator, value = parser.pending().partition(":")
+    if separator:
+        items, section = _complete_items(value)
+        if items and section.started:
+            try:
+                sections[json.loads(key.strip())] = [item for _, item in items]
+            except ValueError:
+                pass
+    return sections or None
+
+
+def _python_literal(text: str):
+    """
+    Evaluates a Python list or dictionary literal, or returns None.
+    Two adjacent strings (a missing comma) are rejected, rather than concatenated into a single item.
+    """
+    try:
+        previous = None
+        for token in tokenize.generate_tokens(io.StringIO(text).readline):
+            if token.type in (tokenize.NL, tokenize.NEWLINE, tokenize.COMMENT):
+                continue
+            if token.type == tokenize.STRING and previous == tokenize.STRING:
+                return None
+            previous = token.type
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError, MemoryError, RecursionError, tokenize.TokenError):
+        return None
+    return value if isinstance(value, (list, dict)) else None
+
+
+def repair_json(text: str) -> Tuple[Optional[object], Optional[str]]:
+    """
+    Tolerant parsing of a JSON output that `json.loads` rejected. In order:
+    code fences and surrounding text, trailing commas, Python literals (single quotes, `None`),
+    then the complete items of an output truncated by `max_tokens`.
+
+    :param text: The output of the model, without its `<output>` tags.
+    :return: A tuple (parsed value, kind of repair), or (None, None) when the output cannot be repaired.
+    """
+    stripped, head = _strip_wrapping(text)
+    if stripped != text.strip():
+        try:
+            return json.loads(stripped), "extracted"
+        except ValueError:
+            pass
+
+    without_commas = _remove_trailing_commas(stripped)
+    if without_commas != stripped:
+        try:
+            return json.loads(without_commas), "trailing_comma"
+        except ValueError:
+            pass
+
+    value = _python_literal(stripped)
+    if value is not None:
+        return value, "python_literal"
+
+    value = _salvage(_remove_trailing_commas(head))
+    if value is not None:
+        return value, "truncated"
+    return None, None
@@ -0,0 +1,116 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from recommendations.resilience import UpstreamUnavailableError, deadline_expired, remaining_time
+
+
+@dataclass
+class Stage:
+    """
+    A stage of a recommendation pipeline.
+    `run` receives the results of the stages listed in `depends_on` and returns a result dictionary
+    ({"error": ..., "data": ...}) like the `recommend` methods of the recommendation classes.
+    """
+    # Étape d'un pipeline de recommandation.
+    name: str
+    run: Callable[[Dict[str, dict]], Awaitable[dict]]
+    depends_on: Tuple[str, ...] = field(default_factory=tuple)
+    timeout: float = 45.0
+    retries: int = 1
+
+
+def _check_graph(stages: List[Stage]) -> None:
+    """
+    Checks that the stage names are unique, that every dependency exists and that the graph has no cycle.
+    """
+    names = [stage.name for stage in stages]
+    if len(names) != len(set(names)):
+        raise ValueError("Pipeline stage names must be unique.")
+
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for dependency in stage.depends_on:
+            if dependency not in by_name:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dependency}'.")
+
+    visiting, visited = set(), set()
+
+    def visit(name: str) -> None:
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f"Cycle detected in the pipeline at stage '{name}'.")
+        visiting.add(name)
+        for dependency in by_name[name].depends_on:
+            visit(dependency)
+        visiting.discard(name)
+        visited.add(name)
+
+    for name in names:
+        visit(name)
+
+
+async def _run_stage(stage: Stage, inputs: Dict[str, dict]) -> dict:
+    """
+    Runs a stage with its timeout, retrying it on its own when it fails.
+    An unavailable upstream (open circuit breaker, shed call) and the expiry of the deadline of the request
+    are not retried: they are raised, so that the request fails fast with 503 or 504.
+    """
+    result = {"error": True, "data": None, "message": f"Stage '{stage.name}' did not run."}
+    for attempt in range(stage.retries + 1):
+        # Le timeout de l'étape ne dépasse pas l'échéance de la requête : aucune relance n'est lancée après celle-ci.
+        remaining = remaining_time()
+        timeout = stage.timeout if remaining is None else min(stage.timeout, remaining)
+        if timeout <= 0:
+            if attempt == 0:
+                result = {"error": True, "data": None, "message": f"Stage '{stage.name}' did not run: the deadline of the request has expired."}
+            break
+        try:
+            result = await asyncio.wait_for(stage.run(inputs), timeout=timeout)
+        except UpstreamUnavailableError:
+            raise
+        except asyncio.TimeoutError:
+            # Le timeout de l'étape est un résultat ; l'échéance de la requête expirée est levée.
+            if deadline_expired():
+                raise
+            result = {"error": True, "data": None, "message": f"Stage '{stage.name}' timed out after {timeout:.0f} seconds."}
+        except Exception as e:
+            result = {"error": True, "data": None, "message": str(e)}
+        if not result.get("error"):
+            return result
+    return result
+
+
+async def run_pipeline(stages: List[Stage]) -> Dict[str, dict]:
+    """
+    Runs the stages of a dependency graph concurrently.
+    Each stage starts as soon as all its dependencies have succeeded; a stage whose dependency failed is skipped.
+    `UpstreamUnavailableError` and the expiry of the deadline (`TimeoutError`) cancel the other stages and are raised.
+
+    :param stages: The stages of the pipeline.
+    :return: The result dictionary of every stage, by stage name.
+    """
+    # Exécute les étapes d'un graphe de dépendances de manière concurrente.
+    _check_graph(stages)
+    loop = asyncio.get_running_loop()
+    futures: Dict[str, asyncio.Future] = {stage.name: loop.create_future() for stage in stages}
+
+    async def execute(stage: Stage) -> None:
+        inputs = {}
+        for dependency in stage.depends_on:
+            inputs[dependency] = await asyncio.shield(futures[dependency])
+        failed = [name for name, result in inputs.items() if result.get("error")]
+        if failed:
+            result = {"error": True, "data": None, "message": f"Stage '{stage.name}' skipped because {', '.join(failed)} failed."}
+        else:
+            result = await _run_stage(stage, inputs)
+        futures[stage.name].set_result(result)
+
+    tasks = [asyncio.ensure_future(execute(stage)) for stage in stages]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from contextlib import closing
+from typing import Dict, List, Optional
+
+from recommendations.generate_goals import GoalsRecommendation
+from recommendations.generate_means import MeansRecommendation
+from recommendations.prompt_registry import prompt_registry
+from recommendations.single_flight import make_key
+
+import utils.variables as variables
+
+
+class PlanStore:
+    """
+    SQLite persistence of the intervention plans: the last inputs and outputs of every plan, shared by all the uvicorn workers.
+    """
+    # Persistance SQLite des plans d'intervention : dernières entrées et sorties de chaque plan.
+
+    def __init__(self, path: str, max_age: float):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS plans (plan_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS plans_updated_at ON plans (updated_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=10.0)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def get(self, plan_id: str) -> Optional[dict]:
+        with closing(self._connect()) as connection, connection:
+            row = connection.execute("SELECT state FROM plans WHERE plan_id = ?", (plan_id,)).fetchone()
+        return json.loads(row["state"]) if row is not None else None
+
+    def save(self, plan_id: str, state: dict) -> None:
+        """
+        Stores the state of a plan, and deletes the plans not updated for `max_age` seconds.
+        """
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO plans (plan_id, state, updated_at) VALUES (?, ?, ?)",
+                               (plan_id, json.dumps(state, ensure_ascii=False), state["updated_at"]))
+            connection.execute("DELETE FROM plans WHERE updated_at < ?", (time.time() - self.max_age,))
+
+    def delete(self, plan_id: str) -> bool:
+        with self._lock, closing(self._connect()) as connection, connection:
+            return connection.execute("DELETE FROM plans WHERE plan_id = ?", (plan_id,)).rowcount > 0
+
+    def count(self) -> int:
+        with closing(self._connect()) as connection, connection:
+            return connection.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+
+
+plan_store = PlanStore(variables.plan_store_path, variables.plan_session_max_age)
+
+# Submissions of a same plan are processed one after the other in a worker, so that the second one reuses the first.
+# Les soumissions d'un même plan sont traitées l'une après l'autre dans un worker : la seconde réutilise la première.
+_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _plan_lock(plan_id: str) -> asyncio.Lock:
+    lock = _locks.get(plan_id)
+    if lock is None:
+        lock = _locks[plan_id] = asyncio.Lock()
+    return lock
+
+
+def _means_key(profile_key: str, goal: str) -> str:
+    """
+    Fingerprint of the inputs of the means of a goal: the profile and the description of the goal.
+    """
+    return make_key("plan_means", profile=profile_key, goal=goal)
+
+
+def _plan_data(plan_id: str, state: dict) -> dict:
+    return {"plan_id": plan_id, "goals": state["goals"], "means": state["means"], "recomputed": state.get("recomputed"), "updated_at": state["updated_at"]}
+
+
+def get_plan(plan_id: str) -> Optional[dict]:
+    """
+    Returns the recommendations of a plan, as stored by its last submission, or None for an unknown plan.
+    """
+    state = plan_store.get(plan_id)
+    return _plan_data(plan_id, state) if state is not None else None
+
+
+async def update_plan(plan_id: str, request: dict, number_items: int = 10, use_cache: bool = True) -> dict:
+    """
+    Recommends the goals and means of a plan, recomputing only the stages whose inputs changed since its previous submission:
+        - the goals are recommended again only when the profile (age, gender, strengths, challenges, needs) changed,
+          unless the goals are sent with the submission;
+        - the means of a goal are generated again only when the profile or the description of the goal changed;
+          the means of the other goals are kept, even if the goal was moved or got a new identifier.
+
+    :param plan_id: The identifier of the plan.
+    :param request: The submission, see `models.plan_models.PlanRequest`.
+    :param number_items: Number of goals to recommend.
+    :param use_cache: Whether the response cache may be used for the model calls.
+    :return: A dictionary containing the error status and the recommendations of the plan (`PlanData`).
+    """
+    goals_recommender = prompt_registry.recommender(GoalsRecommendation)
+    means_recommender = prompt_registry.recommender(MeansRecommendation)
+    age, gender = request["age"], request["gender"]
+    strengths, challenges, needs = request["strengths"], request["challenges"], request["needs"]
+    profile_key = make_key("plan_profile", language=means_recommender.language, goals_language=goals_recommender.language,
+                           age=age, gender=gender, strengths=strengths, challenges=challenges, needs=needs)
+
+    async with _plan_lock(plan_id):
+        previous = await asyncio.to_thread(plan_store.get, plan_id) or {}
+
+        # Étape des objectifs : objectifs envoyés, objectifs précédents (profil inchangé) ou nouvelle recommandation.
+        goals_recomputed = False
+        if request.get("goals") is not None:
+            goals = [{"id": goal.get("id") or str(uuid.uuid4()), "description": goal["description"].strip()} for goal in request["goals"]]
+            goals_source = "provided"
+        elif previous.get("profile_key") == profile_key and previous.get("goals_source") == "recommended":
+            goals = previous["goals"]
+            goals_source = "recommended"
+        else:
+            result = await goals_recommender.recommend_async(age, gender, strengths, challenges, needs, number_items, use_cache=use_cache)
+            if result["error"]:
+                return result
+            goals = result["data"]
+            goals_source = "recommended"
+            goals_recomputed = True
+
+        # Étape des moyens : ceux d'un objectif dont les entrées n'ont pas changé sont repris, les autres générés en parallèle.
+        previous_means: Dict[str, List[dict]] = {}
+        for goal_id, key in (previous.get("means_keys") or {}).items():
+            previous_means[key] = [mean for mean in previous.get("means", []) if mean.get("goal_id") == goal_id]
+
+        means_by_goal: Dict[str, List[dict]] = {}
+        means_keys: Dict[str, str] = {}
+        stale = []
+        for goal in goals:
+            key = _means_key(profile_key, goal["description"])
+            if key in previous_means:
+                means_by_goal[goal["id"]] = [{**mean, "goal_id": goal["id"], "goal": goal["description"]} for mean in previous_means[key]]
+                means_keys[goal["id"]] = key
+            else:
+                stale.append(goal)
+
+        message = None
+        if stale:
+            result = await means_recommender.recommend_fan_out(age, gender, strengths, challenges, needs, [goal["description"] for goal in stale],
+                                                               variables.means_per_goal, use_cache=use_cache, goal_ids=[goal["id"] for goal in stale])
+            if result["error"] and not means_by_goal:
+                return result
+            message = result.get("message")
+            for mean in result["data"] or []:
+                means_by_goal.setdefault(mean["goal_id"], []).append(mean)
+            # Les objectifs sans moyens ne sont pas marqués : leurs moyens seront demandés à nouveau à la prochaine soumission.
+            for goal in stale:
+                if goal["id"] in means_by_goal:
+                    means_keys[goal["id"]] = _means_key(profile_key, goal["description"])
+
+        goal_ids = {goal["id"] for goal in goals}
+        state = {
+            "inputs": {"age": age, "gender": gender, "strengths": strengths, "challenges": challenges, "needs": needs},
+            "profile_key": profile_key,
+            "goals_source": goals_source,
+            "goals": goals,
+            "means": [mean for goal in goals for mean in means_by_goal.get(goal["id"], [])],
+            "means_keys": means_keys,
+            "recomputed": {
+                "goals": goals_recomputed,
+                "means_goal_ids": [goal["id"] for goal in stale],
+                "removed_goal_ids": [goal["id"] for goal in previous.get("goals", []) if goal["id"] not in goal_ids],
+            },
+            "updated_at": time.time(),
+        }
+        await asyncio.to_thread(plan_store.save, plan_id, state)
+    return {"error": False, "data": _plan_data(plan_id, state), "message": message}
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import string
+import threading
+from typing import Dict, Optional
+
+from utils.logging_setup import setup_logger
+
+import utils.variables as variables
+
+
+# The prompt templates and the placeholders that every one of them must contain.
+# Les modèles de prompt et les paramètres que chacun d'eux doit contenir.
+TEMPLATES = {
+    "strengths_template": {"key_words", "number_items"},
+    "challenges_template": {"key_words", "number_items"},
+    "needs_template": {"key_words"},
+    "goals_template": {"age", "sex", "strengths", "challenges", "needs", "number_items"},
+    "means_template": {"age", "sex", "strengths", "challenges", "needs", "goals"},
+    "profile_goals_means_template": {"age", "gender", "description", "number_items"},
+    "profile_document_template": set(),
+    "goals_document_template": set(),
+    "means_document_template": set(),
+}
+LANGUAGES = ("en", "fr")
+
+prompts_logger = setup_logger("prompts")
+
+
+class PromptTemplateError(ValueError):
+    """
+    Raised when a prompt template is missing or its placeholders do not match the expected ones.
+    """
+    # Levée lorsqu'un modèle de prompt est absent ou que ses paramètres ne correspondent pas à ceux attendus.
+
+
+def _read_template(path: str, expected: set) -> str:
+    """
+    Reads a prompt template and checks that its `{placeholders}` are exactly the expected ones.
+    :raises PromptTemplateError: If the file cannot be read or parsed, or if a placeholder is missing or unknown.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            template = file.read()
+        placeholders = {name for _, name, _, _ in string.Formatter().parse(template) if name is not None}
+    except (OSError, ValueError) as e:
+        raise PromptTemplateError(f"Invalid prompt template {path}: {e}")
+    if placeholders != expected:
+        missing = sorted(expected - placeholders)
+        unknown = sorted(placeholders - expected)
+        raise PromptTemplateError(f"Invalid prompt template {path}: missing placeholders {missing}, unknown placeholders {unknown}")
+    return template
+
+
+class PromptRegistry:
+    """
+    Prompt templates of both languages, read and validated once, and shared recommendation instances.
+    The recommendation classes read their templates from the registry at every call, so a reload
+    is seen by the shared instances without rebuilding them.
+    """
+    # Modèles de prompt des deux langues, lus et validés une seule fois, et instances de recommandation partagées.
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._templates: Dict[tuple, str] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name: str, language: str) -> str:
+        return os.path.join(self.directory, f"{name}_{language}.txt")
+
+    def load(self) -> None:
+        """
+        Reads and validates all the templates.
+        :raises PromptTemplateError: If a template is missing or invalid; the templates already loaded are kept.
+        """
+        templates = {}
+        mtimes = {}
+        for name, expected in TEMPLATES.items():
+            for language in LANGUAGES:
+                path = self._path(name, language)
+                templates[(name, language)] = _read_template(path, expected)
+                mtimes[path] = os.path.getmtime(path)
+        with self._lock:
+            self._templates = templates
+            self._mtimes = mtimes
+        prompts_logger.info(f"{len(templates)} prompt templates loaded from {self.directory}")
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reloads the templates whose file was modified since they were read. An invalid edit is logged and ignored.
+        :return: True if a template was reloaded.
+        """
+        templates = dict(self._templates)
+        mtimes = dict(self._mtimes)
+        changed = False
+        for name, expected in TEMPLATES.items():
+            for language in LANGUAGES:
+                path = self._path(name, language)
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                if mtime == mtimes.get(path):
+                    continue
+                mtimes[path] = mtime
+                try:
+                    templates[(name, language)] = _read_template(path, expected)
+                except PromptTemplateError as e:
+                    prompts_logger.error(f"Prompt template not reloaded: {e}")
+                    continue
+                prompts_logger.info(f"Prompt template reloaded: {path}")
+                changed = True
+        with self._lock:
+            self._templates = templates
+            self._mtimes = mtimes
+        return changed
+
+    async def watch(self, interval: float) -> None:
+        """
+        Checks the modification times of the templates every `interval` seconds, off the event loop, until cancelled.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.reload_if_changed)
+            except Exception as e:
+                prompts_logger.error(f"Prompt templates could not be checked: {e}")
+
+    def get(self, name: str, language: str) -> str:
+        """
+        Returns a template; any language other than French uses the English templates.
+        The templates are loaded on first use when `load` was not called at startup (e.g. in scripts).
+        """
+        if not self._templates:
+            with self._lock:
+                loaded = bool(self._templates)
+            if not loaded:
+                self.load()
+        return self._templates[(name, "fr" if language == "fr" else "en")]
+
+    def recommender(self, recommender_class, language: Optional[str] = None):
+        """
+        Returns the shared instance of a recommendation class for a language.
+        :param recommender_class: The recommendation class, e.g. GoalsRecommendation.
+        :param language: The language of the recommendations, by default the one of the class.
+        """
+        key = (recommender_class, language)
+        instance = self._instances.get(key)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(key)
+                if instance is None:
+                    instance = recommender_class() if language is None else recommender_class(language)
+                    self._instances[key] = instance
+        return instance
+
+
+prompt_registry = PromptRegistry(variables.prompts_directory)
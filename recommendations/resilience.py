@@ -0,0 +1,271 @@
+import asyncio
+import contextlib
+import contextvars
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import AsyncContextManager, Awaitable, Callable, Optional
+
+import anthropic
+
+import utils.variables as variables
+
+
+# Absolute deadline (time.monotonic()) of the request being processed, set by the routers.
+# Échéance absolue (time.monotonic()) de la requête en cours de traitement, définie par les routeurs.
+request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+class UpstreamUnavailableError(Exception):
+    """
+    Raised when the Claude API is considered unhealthy: the circuit breaker is open,
+    or the transient errors persisted until the deadline of the request.
+    """
+    # Levée lorsque l'API Claude est considérée comme indisponible.
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker shared by all the calls to the Claude API of a worker.
+    After `failure_threshold` consecutive transient failures the circuit opens and calls fail fast;
+    after `reset_timeout` seconds a single probe call is let through (half-open) to test the upstream.
+    """
+    # Disjoncteur partagé par tous les appels à l'API Claude d'un worker.
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._counters = {"successes": 0, "failures": 0, "rejected": 0, "retries": 0, "opened": 0}
+
+    def before_call(self) -> None:
+        """
+        Lets a call through, or raises `UpstreamUnavailableError` while the circuit is open.
+        """
+        with self._lock:
+            if self._state == "open":
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    self._counters["rejected"] += 1
+                    raise UpstreamUnavailableError("The recommendation service is temporarily unavailable (upstream model API unhealthy).", retry_after=remaining)
+                self._state = "half_open"
+                self._probe_in_flight = False
+            if self._state == "half_open":
+                if self._probe_in_flight:
+                    self._counters["rejected"] += 1
+                    raise UpstreamUnavailableError("The recommendation service is temporarily unavailable (upstream model API unhealthy).", retry_after=1.0)
+                self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._counters["successes"] += 1
+            self._failures = 0
+            self._state = "closed"
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._counters["failures"] += 1
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    self._counters["opened"] += 1
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self._counters["retries"] += 1
+
+    def release(self) -> None:
+        """
+        Releases the probe slot of a call that ended without a verdict (e.g. a non-retryable client error).
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def status(self) -> dict:
+        """
+        Returns the state and the counters of the circuit breaker.
+        """
+        with self._lock:
+            status = {"state": self._state, "consecutive_failures": self._failures, **self._counters}
+            if self._state == "open":
+                status["retry_after"] = max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+        return status
+
+
+breaker = CircuitBreaker(variables.breaker_failure_threshold, variables.breaker_reset_timeout)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Tells whether an error of the Claude API is transient: 408, 409, 429, 5xx (including 529 overloaded), or a connection error.
+    """
+    if isinstance(error, (anthropic.APIConnectionError, anthropic.APITimeoutError)):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """
+    Returns the delay requested by the `retry-after-ms` or `retry-after` header of an error response, in seconds.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def next_delay(attempt: int, error: Exception) -> float:
+    """
+    Returns the delay before the next attempt: exponential backoff with full jitter, never shorter than `retry-after`.
+    """
+    backoff = random.uniform(0, min(variables.retry_max_delay, variables.retry_base_delay * (2 ** attempt)))
+    requested = retry_after(error)
+    return max(backoff, requested) if requested is not None else backoff
+
+
+def remaining_time() -> Optional[float]:
+    """
+    Returns the time left before the deadline of the current request, or None if there is no deadline.
+    """
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def deadline_expired() -> bool:
+    """
+    Tells whether the deadline of the current request has expired.
+    """
+    remaining = remaining_time()
+    return remaining is not None and remaining <= 0
+
+
+def _give_up(attempt: int, error: Exception, delay: float) -> bool:
+    if attempt + 1 >= variables.retry_max_attempts:
+        return True
+    remaining = remaining_time()
+    return remaining is not None and remaining <= delay
+
+
+def _exhausted(error: Exception) -> Exception:
+    """
+    Returns the error raised when the retries stop: a timeout if the deadline of the request has expired,
+    otherwise `UpstreamUnavailableError`.
+    """
+    if deadline_expired():
+        return TimeoutError(f"The deadline of the request expired while calling the model: {error}")
+    return UpstreamUnavailableError(f"The upstream model API is unavailable: {error}", retry_after=retry_after(error))
+
+
+def _cut_by_deadline(error: Exception) -> bool:
+    """
+    Tells whether a call timed out because the HTTP timeout, set to the time left before the deadline, ran out:
+    the upstream is not at fault, so the failure is not counted by the circuit breaker.
+    """
+    return isinstance(error, anthropic.APITimeoutError) and deadline_expired()
+
+
+def call_with_retry(call: Callable[[], object]):
+    """
+    Calls the Claude API through the circuit breaker, retrying transient errors until the deadline of the request.
+    :param call: A function performing one call to the Claude API.
+    :return: The result of the call.
+    """
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            result = call()
+        except Exception as error:
+            if not is_retryable(error):
+                breaker.release()
+                raise
+            if _cut_by_deadline(error):
+                breaker.release()
+                raise _exhausted(error) from error
+            breaker.record_failure()
+            delay = next_delay(attempt, error)
+            if _give_up(attempt, error, delay):
+                raise _exhausted(error) from error
+            breaker.record_retry()
+            time.sleep(delay)
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
+
+
+async def call_with_retry_async(call: Callable[[], Awaitable[object]], slot: Optional[Callable[[], AsyncContextManager]] = None):
+    """
+    Asynchronous version of `call_with_retry`.
+    The circuit breaker is only asked once the `slot` is held, so that a call queued for admission does not hold
+    the probe of a half-open circuit; the slot is released during the backoff between two attempts.
+    :param call: A function returning the coroutine of one call to the Claude API.
+    :param slot: A function returning the context held during each attempt (e.g. a slot of the admission controller), or None.
+    :return: The result of the call.
+    """
+    attempt = 0
+    while True:
+        async with slot() if slot is not None else contextlib.nullcontext():
+            breaker.before_call()
+            try:
+                result = await call()
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as error:
+                if not is_retryable(error):
+                    breaker.release()
+                    raise
+                if _cut_by_deadline(error):
+                    # Appel coupé par notre propre échéance : ce n'est pas une panne de l'API.
+                    breaker.release()
+                    raise _exhausted(error) from error
+                breaker.record_failure()
+                failure = error
+            else:
+                breaker.record_success()
+                return result
+        delay = next_delay(attempt, failure)
+        if _give_up(attempt, failure, delay):
+            raise _exhausted(failure) from failure
+        breaker.record_retry()
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def set_deadline(timeout: float) -> contextvars.Token:
+    """
+    Sets the deadline of the current request, `timeout` seconds from now.
+    """
+    return request_deadline.set(time.monotonic() + timeout)
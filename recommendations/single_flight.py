@@ -0,0 +1,109 @@
+import asyncio
+import copy
+import hashlib
+import json
+from typing import Awaitable, Callable
+
+from utils.metrics import single_flight_requests
+
+
+def _normalize(value):
+    """
+    Normalizes a value of a request payload: surrounding whitespace and empty list entries are ignored,
+    and an empty list is the same as a missing one.
+    """
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (list, tuple)):
+        entries = [_normalize(entry) for entry in value if not (isinstance(entry, str) and not entry.strip())]
+        # Une liste vide équivaut à une liste absente.
+        return entries or None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def make_key(endpoint: str, **payload) -> str:
+    """
+    Builds the coalescing key of a request from its endpoint and its normalized payload.
+    :param endpoint: The name of the endpoint (e.g. "goals").
+    :param payload: The parameters of the recommendation (age, gender, lists, description, language, number_items...).
+    :return: The SHA-256 of the normalized payload.
+    """
+    normalized = {name: _normalize(value) for name, value in payload.items()}
+    serialized = json.dumps({"endpoint": endpoint, **normalized}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """
+    A shared in-flight call and the number of requests awaiting it.
+    """
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    In-process coalescing of identical in-flight recommendations.
+    The first request of a key (the leader) starts the work in a task; the duplicates received while it runs
+    await the same task and receive a copy of its result (or its exception). The task is cancelled, and its
+    model call aborted, when every request awaiting it has gone (timeout, disconnection). It must only be used from the event loop.
+    """
+    # Regroupement, dans le processus, des recommandations identiques en cours de traitement.
+
+    def __init__(self):
+        self._in_flight = {}
+        self._counters = {"leaders": 0, "coalesced": 0, "abandoned": 0}
+
+    async def run(self, key: str, work: Callable[[], Awaitable[object]]):
+        """
+        Runs `work` once for all the concurrent calls with the same key.
+        :param key: The coalescing key of the request, see `make_key`.
+        :param work: A function returning the coroutine that computes the result.
+        :return: The result of the shared call.
+        """
+        flight = self._in_flight.get(key)
+        leader = flight is None
+        if leader:
+            self._counters["leaders"] += 1
+            single_flight_requests.inc(role="leader")
+            flight = _Flight(asyncio.ensure_future(work()))
+            self._in_flight[key] = flight
+            flight.task.add_done_callback(lambda done: self._forget(key, flight))
+        else:
+            self._counters["coalesced"] += 1
+            single_flight_requests.inc(role="coalesced")
+
+        flight.waiters += 1
+        try:
+            # The task is shielded: the timeout of one request must not cancel the call awaited by the others.
+            # La tâche est protégée : le timeout d'une requête ne doit pas annuler l'appel attendu par les autres.
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Plus personne n'attend le résultat : l'appel est annulé.
+                self._counters["abandoned"] += 1
+                single_flight_requests.inc(role="abandoned")
+                self._forget(key, flight)
+                flight.task.cancel()
+        return result if leader else copy.deepcopy(result)
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+        if flight.task.done() and not flight.task.cancelled():
+            # Marque l'exception comme récupérée, même si tous les appelants ont abandonné.
+            flight.task.exception()
+
+    def stats(self) -> dict:
+        """
+        Returns the number of leader, coalesced and abandoned requests since the worker started, and the keys in flight.
+        """
+        return {**self._counters, "in_flight": len(self._in_flight)}
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,96 @@
+import json
+from typing import List, Optional, Tuple
+
+
+class IncrementalOutputParser:
+    """
+    Incremental parser for the `<output>[...]</output>` (or `<output>{...}</output>`) responses of the Claude model.
+    Text chunks are fed as they arrive from the token stream, and every top-level element of the JSON list
+    (or every top-level key of the JSON object) is returned as soon as it is complete.
+    """
+    # Analyseur incrémental des réponses `<output>[...]</output>` du modèle Claude : chaque élément de premier
+    # niveau est retourné dès qu'il est complet dans le flux de tokens.
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._container: Optional[str] = None  # "[" or "{" once the top-level container is found
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._element_start: Optional[int] = None
+        self.finished = False
+
+    @property
+    def started(self) -> bool:
+        """
+        Tells whether the top-level JSON container has been found in the response.
+        """
+        return self._container is not None
+
+    def feed(self, chunk: str) -> List[Tuple[Optional[str], object]]:
+        """
+        Adds a chunk of text and returns the elements completed by it.
+        :param chunk: The next piece of the model response.
+        :return: A list of (key, value) tuples; the key is None for the elements of a list.
+        """
+        self._buffer += chunk
+        elements = []
+        while self._position < len(self._buffer) and not self.finished:
+            char = self._buffer[self._position]
+            index = self._position
+            self._position += 1
+
+            if self._container is None:
+                if char in "[{":
+                    self._container = char
+                    self._depth = 1
+                    self._element_start = self._position
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    element = self._parse_element(self._buffer[self._element_start:index])
+                    if element is not None:
+                        elements.append(element)
+                    self.finished = True
+            elif char == "," and self._depth == 1:
+                element = self._parse_element(self._buffer[self._element_start:index])
+                if element is not None:
+                    elements.append(element)
+                self._element_start = self._position
+        return elements
+
+    def pending(self) -> str:
+        """
+        Returns the text of the top-level element in progress, i.e. not completed by the text fed so far.
+        """
+        if self._element_start is None or self.finished:
+            return ""
+        return self._buffer[self._element_start:]
+
+    def _parse_element(self, text: str) -> Optional[Tuple[Optional[str], object]]:
+        text = text.strip()
+        if not text:
+            return None
+        try:
+            if self._container == "{":
+                key, value = next(iter(json.loads("{" + text + "}").items()))
+                return key, value
+            return None, json.loads(text)
+        except (json.JSONDecodeError, StopIteration):
+            return None
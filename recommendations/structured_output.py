@@ -0,0 +1,106 @@
+import json
+import typing
+from typing import Optional
+
+from pydantic import BaseModel
+from pydantic.fields import FieldInfo
+
+import utils.variables as variables
+from models.strengths_models import StrengthsResponse
+from models.challenges_models import ChallengesResponse
+from models.goals_models import GoalsResponse
+from models.means_models import MeansResponse
+from models.full_models import FullResponseData
+
+
+# Field of the response models describing the items of each section.
+# Champ des modèles de réponse qui décrit les éléments de chaque section.
+SECTION_FIELDS = {
+    "strengths": StrengthsResponse.model_fields["data"],
+    "challenges": ChallengesResponse.model_fields["data"],
+    "needs": FullResponseData.model_fields["needs"],
+    "goals": GoalsResponse.model_fields["data"],
+    "means": MeansResponse.model_fields["data"],
+}
+
+
+def _item_type(annotation):
+    """
+    Returns the type of the items of an `Optional[List[...]]` annotation.
+    """
+    for argument in typing.get_args(annotation) or (annotation,):
+        if argument is not type(None):
+            items = typing.get_args(argument)
+            return items[0] if items else str
+    return str
+
+
+def _array_schema(section: str) -> dict:
+    """
+    Returns the JSON schema of the items of a section: a list of strings.
+    The goals and means are models with an `id`, assigned by the service; the model only writes their description.
+    """
+    field: FieldInfo = SECTION_FIELDS[section]
+    item = _item_type(field.annotation)
+    if isinstance(item, type) and issubclass(item, BaseModel):
+        description = item.model_fields["description"].description
+    else:
+        description = field.description or f"The {section} of the student."
+    return {"type": "array", "description": description, "items": {"type": "string"}, "minItems": 1}
+
+
+def output_schema(output: str) -> dict:
+    """
+    Returns the JSON schema of the tool input of a recommender.
+    The full profile has one list per field of `FullResponseData`; the other recommenders a single `items` list,
+    as the input of a tool must be an object.
+
+    :param output: The name of the recommender ("strengths", "challenges", "needs", "goals", "means" or "full").
+    """
+    if output == "full":
+        properties = {section: _array_schema(section) for section in FullResponseData.model_fields}
+    else:
+        properties = {"items": _array_schema(output)}
+    return {"type": "object", "properties": properties, "required": list(properties)}
+
+
+_TOOLS = {
+    output: {
+        "name": f"record_{output}",
+        "description": f"Records the {'sections of the full profile' if output == 'full' else output} recommended for the student.",
+        "input_schema": output_schema(output),
+    }
+    for output in (*SECTION_FIELDS, "full")
+}
+
+
+def output_tool(output: Optional[str]) -> Optional[dict]:
+    """
+    Returns the tool through which a recommender receives its output, or None when the structured output is
+    disabled (`ELSIA_STRUCTURED_OUTPUT`) or the recommender is unknown.
+    """
+    if not variables.structured_output or output is None:
+        return None
+    return _TOOLS.get(output)
+
+
+def tool_output_text(tool_input: dict) -> str:
+    """
+    Converts the input of a tool call into the `<output>` text read by `process_response`, so that the cache,
+    the batches and the formatting of the responses are the same in both modes.
+
+    :param tool_input: The parsed input of the `tool_use` block.
+    :return: The JSON list of the items (or the dictionary of the sections of the full profile) in `<output>` tags.
+    """
+    # Il arrive qu'une liste soit renvoyée sous forme de chaîne JSON : elle est décodée ici.
+    output = {}
+    for key, value in (tool_input or {}).items():
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        output[key] = value
+    if set(output) == {"items"}:
+        output = output["items"]
+    return "<output>" + json.dumps(output, ensure_ascii=False) + "</output>"
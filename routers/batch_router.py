@@ -0,0 +1,80 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Query, status
+
+from models.batch_models import BatchRequest, BatchJob, BatchResultsResponse
+from recommendations.batch import batch_store, submit_batch, refresh_job
+from recommendations.resilience import UpstreamUnavailableError
+from utils.logging_setup import setup_logger
+
+import utils.variables as variables
+
+
+router = APIRouter(prefix="/batch", tags=["Batch"])
+batch_logger = setup_logger("batch")
+
+
+@router.post("/",
+             response_model=BatchJob,
+             status_code=status.HTTP_202_ACCEPTED,
+             summary="Submits the profiles of many students as a single batch job.",
+             # Soumet les profils de nombreux étudiants dans une seule tâche par lot.
+             description="Takes a recommendation type and a list of student profiles and submits them as one Message Batch. The job is returned immediately; its state and results are available with `GET /batch/{job_id}` and `GET /batch/{job_id}/results`.",
+             responses={
+                 status.HTTP_422_UNPROCESSABLE_ENTITY: {"description": "Validation Error: an item does not match the request body of its type."},
+                 status.HTTP_502_BAD_GATEWAY: {"description": "The batch could not be submitted to the model provider."},
+                 status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "The service is overloaded; retry after the delay of the `Retry-After` header."},
+             })
+async def create_batch(request: BatchRequest):
+    batch_logger.info(f"Batch received (fr: Lot reçu): type={request.type}, items={len(request.items)}")
+    try:
+        job = await submit_batch(request.type, request.items, variables.number_of_items)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={"error": True, "message": str(e)})
+    except UpstreamUnavailableError as e:
+        batch_logger.error(f"Upstream unavailable: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail={"error": True, "message": str(e)},
+                            headers={"Retry-After": str(max(1, int(e.retry_after or 1)))})
+    except Exception as e:
+        error_message = f"The batch could not be submitted: {str(e)}"
+        # Le lot n'a pas pu être soumis
+        batch_logger.error(error_message)
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail={"error": True, "message": error_message})
+    batch_logger.info(f"Batch job created: {job}")
+    return BatchJob(**job)
+
+
+async def get_refreshed_job(job_id: str) -> dict:
+    try:
+        job = await refresh_job(job_id)
+    except Exception as e:
+        error_message = f"The state of the batch could not be retrieved: {str(e)}"
+        # L'état du lot n'a pas pu être récupéré
+        batch_logger.error(error_message)
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail={"error": True, "message": error_message})
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"error": True, "message": f"Unknown batch job: {job_id}"})
+    return job
+
+
+@router.get("/{job_id}",
+            response_model=BatchJob,
+            status_code=status.HTTP_200_OK,
+            summary="Returns the state of a batch job.",
+            # Retourne l'état d'une tâche par lot.
+            description="Polls the Message Batch of the job. Once the batch has ended, the results are post-processed and stored.")
+async def get_batch(job_id: str):
+    return BatchJob(**await get_refreshed_job(job_id))
+
+
+@router.get("/{job_id}/results",
+            response_model=BatchResultsResponse,
+            status_code=status.HTTP_200_OK,
+            summary="Pages through the results of a batch job.",
+            # Parcourt les résultats d'une tâche par lot, page par page.
+            description="Returns the results of the job, ordered by the position of the items in the submitted batch, in the same format as the corresponding endpoint.")
+async def get_batch_results(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    job = await get_refreshed_job(job_id)
+    results = await asyncio.to_thread(batch_store.get_results, job_id, offset, limit)
+    next_offset = offset + len(results) if len(results) == limit else None
+    return BatchResultsResponse(job=BatchJob(**job), results=results, next_offset=next_offset)
@@ -1,21 +1,27 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, status
+from typing import Optional
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Header, status
+from fastapi.responses import StreamingResponse
 import asyncio
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from models.challenges_models import ChallengesRequest, ChallengesResponse
 from recommendations.generate_challenges import ChallengesRecommendation
+from recommendations.cache import bypass_requested
+from recommendations.prompt_registry import prompt_registry
+from recommendations.single_flight import single_flight, make_key
+from recommendations.resilience import UpstreamUnavailableError, set_deadline
 from utils.logging_setup import setup_logger
+from utils.sse import sse_response
 
 import utils.variables as variables
 
 router = APIRouter(prefix="/challenges", tags=["Challenges"]) # Le tag change
 challenges_logger = setup_logger("challenges") # Le nom du logger est spécifique
-executor = ThreadPoolExecutor(max_workers=5)
 
-def get_recommendations_sync(age: float, description: str, number_of_items: int=10):
-    """Synchronous function for generating recommendations."""
-    # Fonction synchrone pour la génération des recommandations.
-    recommender = ChallengesRecommendation()
-    return recommender.recommend(age, description, number_of_items)
+async def get_recommendations(age: float, description: str, number_of_items: int=10, use_cache: bool = True):
+    """Asynchronous function for generating recommendations."""
+    # Fonction asynchrone pour la génération des recommandations.
+    recommender = prompt_registry.recommender(ChallengesRecommendation)
+    key = make_key("challenges", language=recommender.language, age=age, description=description, number_items=number_of_items, use_cache=use_cache)
+    return await single_flight.run(key, lambda: recommender.recommend_async(age, description, number_of_items, use_cache=use_cache))
 
 # Exemples pour la documentation
 success_example = ChallengesResponse(data=["Difficulty with time management", "Stress before exams"], error=False)
@@ -61,16 +67,13 @@ timeout_error_example = ChallengesResponse(error=True, message="The request took
                      }
                  }
              })
-async def get_challenges_recommendation(request: ChallengesRequest, background_tasks: BackgroundTasks = BackgroundTasks()):
+async def get_challenges_recommendation(request: ChallengesRequest, background_tasks: BackgroundTasks = BackgroundTasks(), cache_control: Optional[str] = Header(None)):
     challenges_logger.info(f"Request received (fr: Requête reçue): {request.model_dump_json()}")
     
+    set_deadline(60.0)
     try:
-        loop = asyncio.get_running_loop()
-        future = loop.run_in_executor(executor, get_recommendations_sync, request.age, request.description, variables.number_of_items)
-
-        # future = executor.submit(get_recommendations_sync, request.age, request.description)
-        result_dict = await asyncio.wait_for(future, timeout=60.0)
-    except TimeoutError as exc:
+        result_dict = await asyncio.wait_for(get_recommendations(request.age, request.description, variables.number_of_items, use_cache=not bypass_requested(cache_control)), timeout=60.0)
+    except asyncio.TimeoutError as exc:
         error_message = "The request took longer than the allowed 1 minute to process."
         # Le traitement de la requête a dépassé le délai autorisé de 1 minute.
         challenges_logger.error("Timeout: %s", error_message)
@@ -81,6 +84,16 @@ async def get_challenges_recommendation(request: ChallengesRequest, background_t
             detail={"error": True, "message": error_message}
         ) from exc
         
+    except UpstreamUnavailableError as e:
+        error_message = str(e)
+        # Le service de recommandation est temporairement indisponible.
+        challenges_logger.error(f"Upstream unavailable: {error_message}")
+        background_tasks.add_task(challenges_logger.info, f"Response (error): {error_message}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"error": True, "message": error_message},
+            headers={"Retry-After": str(max(1, int(e.retry_after or 1)))}
+        )
     except Exception as e:
         error_message = f"An unexpected internal error has occurred.: {str(e)}"
         # Une erreur interne inattendue est survenue
@@ -103,4 +116,18 @@ async def get_challenges_recommendation(request: ChallengesRequest, background_t
             # Erreur interne de l'algorithme de recommandation.
         )
     
-    return ChallengesResponse(data=result_dict.get("data"), error=False)
\ No newline at end of file
+    return ChallengesResponse(data=result_dict.get("data"), error=False)
+
+
+@router.post("/stream",
+             status_code=status.HTTP_200_OK,
+             summary="Streams a student's challenges recommended from a free description.",
+             # Diffuse en continu les défis recommandés d'un étudiant à partir d'une description libre.
+             description="Same as the challenges endpoint, but returns a `text/event-stream` response: each challenge is sent as an `item` event as soon as it is generated, followed by a `done` event (or an `error` event). A timeout of 1 minute is applied.",
+             response_class=StreamingResponse)
+async def stream_challenges_recommendation(request: ChallengesRequest, cache_control: Optional[str] = Header(None)):
+    challenges_logger.info(f"Stream request received (fr: Requête reçue en continu): {request.model_dump_json()}")
+    recommender = prompt_registry.recommender(ChallengesRecommendation)
+    set_deadline(60.0)
+    items = recommender.recommend_stream(request.age, request.description, variables.number_of_items, use_cache=not bypass_requested(cache_control))
+    return sse_response(items, "item", 60.0, challenges_logger)
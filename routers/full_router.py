@@ -1,23 +1,30 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, status, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Header, status, UploadFile, File, Form, Response
+from fastapi.responses import StreamingResponse
 from typing import Optional, List, Literal
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
 import asyncio
-import os
 import uuid
-import shutil
 import mimetypes
 
 from models.full_models import FullResponse, FullResponseData
+from models.job_models import FullJob
 from recommendations.generate_full import FullRecommendation
+from recommendations.extraction import DocumentExtractionError
+from recommendations.cache import bypass_requested
+from recommendations.prompt_registry import prompt_registry
+from recommendations.single_flight import single_flight, make_key
+from recommendations.resilience import UpstreamUnavailableError, set_deadline
+from recommendations.admission import PRIORITY_FULL, request_priority
+from recommendations.jobs import submit_job
 from utils.logging_setup import setup_logger
+from utils.sse import sse_response
+from utils.uploads import StoredUpload, UploadTooLargeError, ingest_upload
 
 import utils.variables as variables
 
 
 router = APIRouter(prefix="/profile/full", tags=["Full Profile"])
 full_logger = setup_logger("full")
-executor = ThreadPoolExecutor(max_workers=5)
-full_recommender = FullRecommendation()
+full_recommender = prompt_registry.recommender(FullRecommendation)
 
 # Définition des types de fichiers supportés
 SUPPORTED_FILE_TYPES = {
@@ -26,23 +33,56 @@ SUPPORTED_FILE_TYPES = {
     'application/vnd.openxmlformats-officedocument.wordprocessingml.document': '.docx'
 }
 
-# Créez un dossier temporaire pour les fichiers
-TEMP_FILE_UPLOAD_DIR = "temp_uploads"
-os.makedirs(TEMP_FILE_UPLOAD_DIR, exist_ok=True)
+async def read_upload(file: Optional[UploadFile]) -> Optional[StoredUpload]:
+    """
+    Checks the type of the uploaded file and reads it chunk by chunk, off the event loop, up to the maximum size.
+    """
+    if not file:
+        return None
+    file_extension = mimetypes.guess_extension(file.content_type)
+    if file_extension not in SUPPORTED_FILE_TYPES.values():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported file type: {file_extension}. Supported types are: {', '.join(SUPPORTED_FILE_TYPES.values())}"
+        )
 
-def get_recommendations_sync(age: float, gender: str, description: str, file_path: Optional[str], number_items: int = 10):
+    # Lecture du fichier par morceaux, hors de la boucle d'événements, avec une taille maximale
+    try:
+        upload = await ingest_upload(file, file_extension)
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail={"error": True, "message": str(e)}
+        )
+
+    full_logger.info(f"File received: {upload}")
+    return upload
+
+async def get_recommendations(age: float, gender: str, description: str, upload: Optional[StoredUpload], number_items: int = 10, use_cache: bool = True, pipeline: bool = False):
     """
-    Fonction synchrone qui appelle l'orchestrateur de recommandation.
+    Fonction asynchrone qui appelle l'orchestrateur de recommandation.
     """
-    # Ici, nous transmettons le chemin du fichier (s'il existe) à la logique de génération.
-    return asyncio.run(full_recommender.recommend(
+    # Ici, nous transmettons le fichier envoyé (s'il existe) à la logique de génération.
+    recommend = full_recommender.recommend_pipelined if pipeline else full_recommender.recommend
+    key = make_key("full", language=full_recommender.language, age=age, gender=gender, description=description, file=upload.sha256 if upload else None,
+                   number_items=number_items, use_cache=use_cache, pipeline=pipeline)
+
+    def work():
+        task = asyncio.ensure_future(recommend(
                 age=age,
                 gender=gender,
                 description=description,
-                file=file_path,
-                number_items=number_items
-            )
-    )
+                file=upload,
+                number_items=number_items,
+                use_cache=use_cache
+            ))
+        if upload is not None:
+            # L'appel partagé garde le fichier jusqu'à sa fin, même si la requête qui l'a lancé est partie.
+            upload.retain()
+            task.add_done_callback(lambda _: upload.release())
+        return task
+
+    return await single_flight.run(key, work)
 
 @router.post("/",
              response_model=FullResponse,
@@ -51,9 +91,9 @@ def get_recommendations_sync(age: float, gender: str, description: str, file_pat
              description="""Takes a mandatory free-text description and an optional file (.txt, .pdf, .docx) describing the student's profile. Along with age and gender, it returns a full profile including strengths, challenges, needs, goals, and means.
              
              - **The `description` field is mandatory.**
-             - If a `file` is provided, it will be saved to disk with a temporary name, and its path will be transmitted along with the description for a richer analysis.
+             - If a `file` is provided, it is read in chunks (kept in memory when small, spooled to a temporary file otherwise); its text is extracted page by page, up to a token budget, and added to the description for a richer analysis. Files larger than the configured maximum are rejected with 413, and temporary files are always removed.
              
-             A timeout of 5 minutes is applied for file processing and full generation.""",
+             A timeout of 1 minute is applied for file processing and full generation. Longer generations should use the job mode (`POST /profile/full/jobs`), which does not hold the connection.""",
              responses={
                  status.HTTP_200_OK: {
                      "description": "Success. Returns the full student profile recommendations.",
@@ -69,6 +109,12 @@ def get_recommendations_sync(age: float, gender: str, description: str, file_pat
                          }
                      }
                  },
+                 status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {
+                     "description": "The file exceeds the maximum upload size.",
+                 },
+                 status.HTTP_422_UNPROCESSABLE_ENTITY: {
+                     "description": "The text of the file could not be extracted (corrupt file, or optional parser not installed).",
+                 },
                  status.HTTP_500_INTERNAL_SERVER_ERROR: {
                      "description": "Internal application error.",
                  },
@@ -81,43 +127,27 @@ async def get_full_recommendation(
     file: Optional[UploadFile] = File(None),
     age: Optional[float] = Form(None),
     gender: Literal["male", "female", "other", "undefined"] = Form("undefined"),
+    pipeline: bool = Form(variables.full_profile_pipeline, description="Generates the profile with concurrent per-domain stages instead of a single prompt."),
     background_tasks: BackgroundTasks = BackgroundTasks(),
+    cache_control: Optional[str] = Header(None),
 ):
     potential_filename = uuid.uuid4()
     full_logger.info(f"Request received for full profile. Age: {age}, Gender: {gender},  description: {description}, potential_file_name: {potential_filename}")
 
-    file_path = None
-    if file:
-        file_extension = mimetypes.guess_extension(file.content_type)
-        if file_extension not in SUPPORTED_FILE_TYPES.values():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Unsupported file type: {file_extension}. Supported types are: {', '.join(SUPPORTED_FILE_TYPES.values())}"
-            )
-        
-        # Sauvegarde du fichier avec un nom temporaire
-        temp_filename = f"{potential_filename}{file_extension}"
-        file_path = os.path.join(TEMP_FILE_UPLOAD_DIR, temp_filename)
+    upload = await read_upload(file)
 
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        full_logger.info(f"File saved to temporary path: {file_path}")
-    
 
+    set_deadline(60.0)
+    request_priority.set(PRIORITY_FULL)
     try:
-        # future = executor.submit(get_recommendations_sync, age, gender, description, file_path)
-        # result_dict = await asyncio.wait_for(future, timeout=60.0)
-        
-        loop = asyncio.get_running_loop()
-        future = loop.run_in_executor(executor, get_recommendations_sync, age, gender, description, file_path, variables.number_of_items)
-
-        # future = executor.submit(get_recommendations_sync, request.age, request.description)
-        result_dict = await asyncio.wait_for(future, timeout=60.0)
-        
-    except TimeoutError:
-        error_message = "The request took longer than the allowed 5 minutes to process."
+        result_dict = await asyncio.wait_for(
+            get_recommendations(age, gender, description, upload, variables.number_of_items, use_cache=not bypass_requested(cache_control), pipeline=pipeline),
+            timeout=60.0
+        )
         
+    except asyncio.TimeoutError:
+        error_message = "The request took longer than the allowed 1 minute to process."
+        # Le traitement de la requête a dépassé le délai autorisé de 1 minute.
         full_logger.error(f"Timeout: {error_message}")
         
         background_tasks.add_task(full_logger.info, f"Response (error): {error_message}")
@@ -127,6 +157,25 @@ async def get_full_recommendation(
             detail={"error": True, "message": error_message}
         )
         
+    except DocumentExtractionError as e:
+        error_message = str(e)
+        # Le texte du fichier envoyé n'a pas pu être extrait.
+        full_logger.error(f"File extraction error: {error_message}")
+        background_tasks.add_task(full_logger.info, f"Response (error): {error_message}")
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"error": True, "message": error_message}
+        )
+    except UpstreamUnavailableError as e:
+        error_message = str(e)
+        # Le service de recommandation est temporairement indisponible.
+        full_logger.error(f"Upstream unavailable: {error_message}")
+        background_tasks.add_task(full_logger.info, f"Response (error): {error_message}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"error": True, "message": error_message},
+            headers={"Retry-After": str(max(1, int(e.retry_after or 1)))}
+        )
     except Exception as e:
         error_message = f"An unexpected internal error has occurred during processing: {str(e)}"
         
@@ -139,11 +188,9 @@ async def get_full_recommendation(
         )
         
     finally:
-        # Nettoyage du fichier temporaire si tout s'est bien passé
-        # if file_path and os.path.exists(file_path):
-        #     os.remove(file_path)
-        #     full_logger.info(f"Temporary file deleted: {file_path}")
-        pass
+        # Nettoyage du fichier temporaire, quel que soit le résultat
+        if upload is not None:
+            upload.release()
 
     background_tasks.add_task(full_logger.info, f"Response: {result_dict}")
 
@@ -153,4 +200,67 @@ async def get_full_recommendation(
             detail={"error": True, "message": result_dict.get("message", "Internal error in the full recommendation algorithm.")}
         )
     
-    return FullResponse(data=FullResponseData(**result_dict.get("data")), error=False)
\ No newline at end of file
+    return FullResponse(data=FullResponseData(**result_dict.get("data")), error=False, message=result_dict.get("message"))
+
+
+@router.post("/jobs",
+             response_model=FullJob,
+             status_code=status.HTTP_202_ACCEPTED,
+             summary="Queues the generation of a full student profile.",
+             # Met en file d'attente la génération d'un profil étudiant complet.
+             description="""Same form as the full profile endpoint, but returns `202 Accepted` with a job right away, instead of holding the connection during the generation. The job is stored in a durable queue and processed by a bounded pool of workers; it survives the restarts of the workers.
+
+             - Poll `GET /jobs/{job_id}` (the `Location` header), with `wait` to long-poll until the job is finished.
+             - Or give a `callback_url`: the finished job is sent to it by POST.
+
+             A timeout of `ELSIA_JOB_TIMEOUT` seconds (5 minutes by default) is applied to the generation.""",
+             responses={
+                 status.HTTP_400_BAD_REQUEST: {"description": "Bad Request: unsupported file type or invalid callback URL."},
+                 status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {"description": "The file exceeds the maximum upload size."},
+             })
+async def create_full_job(
+    response: Response,
+    description: str = Form(...),
+    file: Optional[UploadFile] = File(None),
+    age: Optional[float] = Form(None),
+    gender: Literal["male", "female", "other", "undefined"] = Form("undefined"),
+    pipeline: bool = Form(variables.full_profile_pipeline, description="Generates the profile with concurrent per-domain stages instead of a single prompt."),
+    callback_url: Optional[str] = Form(None, description="URL receiving the finished job by POST (JSON body)."),
+    cache_control: Optional[str] = Header(None),
+):
+    full_logger.info(f"Job request received for full profile. Age: {age}, Gender: {gender},  description: {description}, callback_url: {callback_url}")
+    if callback_url and not callback_url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail={"error": True, "message": "The callback URL must be an http(s) URL."})
+
+    upload = await read_upload(file)
+    try:
+        job = await submit_job(age, gender, description, upload, pipeline, use_cache=not bypass_requested(cache_control), callback_url=callback_url or None)
+    finally:
+        # La tâche garde sa propre copie du fichier.
+        if upload is not None:
+            upload.release()
+
+    full_logger.info(f"Job queued: {job['id']}")
+    response.headers["Location"] = f"/api/v1/jobs/{job['id']}"
+    return FullJob(**job)
+
+
+@router.post("/stream",
+             status_code=status.HTTP_200_OK,
+             summary="Streams a full student profile based on a free-text description.",
+             # Diffuse en continu un profil étudiant complet à partir d'une description libre.
+             description="""Same as the full profile endpoint, but returns a `text/event-stream` response: each section of the profile (strengths, challenges, needs, goals, means) is sent as a `section` event as soon as it is generated, followed by a `done` event (or an `error` event).
+             
+             A timeout of 5 minutes is applied.""",
+             response_class=StreamingResponse)
+async def stream_full_recommendation(
+    description: str = Form(...),
+    age: Optional[float] = Form(None),
+    gender: Literal["male", "female", "other", "undefined"] = Form("undefined"),
+    cache_control: Optional[str] = Header(None),
+):
+    full_logger.info(f"Stream request received for full profile. Age: {age}, Gender: {gender},  description: {description}")
+    set_deadline(300.0)
+    request_priority.set(PRIORITY_FULL)
+    items = full_recommender.recommend_stream(age=age, gender=gender, description=description, file=None, number_items=variables.number_of_items, use_cache=not bypass_requested(cache_control))
+    return sse_response(items, "section", 300.0, full_logger)
@@ -1,24 +1,29 @@
 from typing import Optional, List
-from fastapi import APIRouter, HTTPException, BackgroundTasks, status
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Header, status
+from fastapi.responses import StreamingResponse
 import asyncio
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from models.goals_models import GoalsRequest, GoalsResponse, Goal
 from recommendations.generate_goals import GoalsRecommendation
+from recommendations.cache import bypass_requested
+from recommendations.prompt_registry import prompt_registry
+from recommendations.single_flight import single_flight, make_key
+from recommendations.resilience import UpstreamUnavailableError, set_deadline
 from utils.logging_setup import setup_logger
+from utils.sse import sse_response
 
 import utils.variables as variables
 
 router = APIRouter(prefix="/goals", tags=["Goals"])
 goals_logger = setup_logger("goals")
-executor = ThreadPoolExecutor(max_workers=5)
 
-def get_recommendations_sync(age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], number_items:int=10):
+async def get_recommendations(age: Optional[float], gender: str, strengths: Optional[List[str]], challenges: Optional[List[str]], needs: Optional[List[str]], number_items:int=10, use_cache: bool = True):
     """
-    Synchronous function for generating goal recommendations.
+    Asynchronous function for generating goal recommendations.
     """
-    # Fonction synchrone pour la génération des recommandations d'objectifs.
-    recommender = GoalsRecommendation()
-    return recommender.recommend(age, gender, strengths, challenges, needs, number_items)
+    # Fonction asynchrone pour la génération des recommandations d'objectifs.
+    recommender = prompt_registry.recommender(GoalsRecommendation)
+    key = make_key("goals", language=recommender.language, age=age, gender=gender, strengths=strengths, challenges=challenges, needs=needs, number_items=number_items, use_cache=use_cache)
+    return await single_flight.run(key, lambda: recommender.recommend_async(age, gender, strengths, challenges, needs, number_items, use_cache=use_cache))
 
 # Exemples pour la documentation
 success_example = GoalsResponse(
@@ -88,23 +93,20 @@ timeout_error_example = GoalsResponse(error=True, message="The request took long
              })
 
 
-async def get_goals_recommendation(request: GoalsRequest, background_tasks: BackgroundTasks = BackgroundTasks()):
+async def get_goals_recommendation(request: GoalsRequest, background_tasks: BackgroundTasks = BackgroundTasks(), cache_control: Optional[str] = Header(None)):
     goals_logger.info(f"Request received (fr: Requête reçue): {request.model_dump_json()}")
     
     # Validation personnalisée (gérée par Pydantic grâce au @model_validator)
     # L'exception sera automatiquement capturée par FastAPI et renverra un statut 422.
     
+    set_deadline(60.0)
     try:
-        # future = executor.submit(get_recommendations_sync, request.model_dump())
-        # result_dict = await asyncio.wait_for(future, timeout=60.0)
-        
-        loop = asyncio.get_running_loop()
-        future = loop.run_in_executor(executor, get_recommendations_sync, request.age, request.gender, request.strengths, request.challenges, request.needs, variables.number_of_items)
-
-        # future = executor.submit(get_recommendations_sync, request.age, request.description)
-        result_dict = await asyncio.wait_for(future, timeout=60.0)
+        result_dict = await asyncio.wait_for(
+            get_recommendations(request.age, request.gender, request.strengths, request.challenges, request.needs, variables.number_of_items, use_cache=not bypass_requested(cache_control)),
+            timeout=60.0
+        )
         
-    except TimeoutError:
+    except asyncio.TimeoutError:
         error_message = "The request took longer than the allowed 1 minute to process."
         # Le traitement de la requête a dépassé le délai autorisé de 1 minute.
         goals_logger.error(f"Timeout: {error_message}")
@@ -114,6 +116,16 @@ async def get_goals_recommendation(request: GoalsRequest, background_tasks: Back
             status_code=status.HTTP_504_GATEWAY_TIMEOUT,
             detail={"error": True, "message": error_message}
         )
+    except UpstreamUnavailableError as e:
+        error_message = str(e)
+        # Le service de recommandation est temporairement indisponible.
+        goals_logger.error(f"Upstream unavailable: {error_message}")
+        background_tasks.add_task(goals_logger.info, f"Response (error): {error_message}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"error": True, "message": error_message},
+            headers={"Retry-After": str(max(1, int(e.retry_after or 1)))}
+        )
     except Exception as e:
         error_message = f"An unexpected internal error has occurred.: {str(e)}"
         # Une erreur interne inattendue est survenue
@@ -135,4 +147,18 @@ async def get_goals_recommendation(request: GoalsRequest, background_tasks: Back
         )
     
     # La réponse de succès est envoyée avec le statut 200 par défaut.
-    return GoalsResponse(data=result_dict.get("data"), error=False)
\ No newline at end of file
+    return GoalsResponse(data=result_dict.get("data"), error=False)
+
+
+@router.post("/stream",
+             status_code=status.HTTP_200_OK,
+             summary="Streams student goals recommended from their profile.",
+             # Diffuse en continu les objectifs recommandés pour un étudiant à partir de son profil.
+             description="Same as the goals endpoint, but returns a `text/event-stream` response: each goal is sent as an `item` event as soon as it is generated, followed by a `done` event (or an `error` event). A timeout of 1 minute is applied.",
+             response_class=StreamingResponse)
+async def stream_goals_recommendation(request: GoalsRequest, cache_control: Optional[str] = Header(None)):
+    goals_logger.info(f"Stream request received (fr: Requête reçue en continu): {request.model_dump_json()}")
+    recommender = prompt_registry.recommender(GoalsRecommendation)
+    set_deadline(60.0)
+    items = recommender.recommend_stream(request.age, request.gender, request.strengths, request.challenges, request.needs, variables.number_of_items, use_cache=not bypass_requested(cache_control))
+    return sse_response(items, "item", 60.0, goals_logger)
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, HTTPException, Query, status
+
+from models.job_models import FullJob
+from recommendations.jobs import wait_for_job
+
+import utils.variables as variables
+
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+@router.get("/{job_id}",
+            response_model=FullJob,
+            status_code=status.HTTP_200_OK,
+            summary="Returns the state of a full profile job.",
+            # Retourne l'état d'une tâche de profil complet.
+            description="Returns the job queued by `POST /profile/full/jobs`, with the full profile once it has succeeded. With `wait`, the response is held until the job is finished or for `wait` seconds at most (long polling).",
+            responses={status.HTTP_404_NOT_FOUND: {"description": "Unknown job."}})
+async def get_job(job_id: str, wait: float = Query(0.0, ge=0.0, le=variables.job_max_wait, description="Maximum time to wait for the end of the job, in seconds.")):
+    job = await wait_for_job(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"error": True, "message": f"Unknown job: {job_id}"})
+    return FullJob(**job)
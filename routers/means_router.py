@@ -1,25 +1,41 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, status
+from typing import Optional
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Header, status
+from fastapi.responses import StreamingResponse
 import asyncio
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from models.means_models import MeansRequest, MeansResponse, Mean
 from recommendations.generate_means import MeansRecommendation
+from recommendations.cache import bypass_requested
+from recommendations.prompt_registry import prompt_registry
+from recommendations.single_flight import single_flight, make_key
+from recommendations.resilience import UpstreamUnavailableError, set_deadline
 from utils.logging_setup import setup_logger
+from utils.sse import sse_response
 
 import utils.variables as variables
 
 
 router = APIRouter(prefix="/means", tags=["Means"])
 means_logger = setup_logger("means")
-executor = ThreadPoolExecutor(max_workers=5)
 
-def get_recommendations_sync(request_data: dict, number_items: int = 10):
+async def get_recommendations(request_data: dict, number_items: int = 10, use_cache: bool = True):
     """
-    Synchronous function for generating means recommendations.
+    Asynchronous function for generating means recommendations.
     """
-    # Fonction synchrone pour la génération des recommandations de moyens.
-    recommender = MeansRecommendation()
-    
-    return recommender.recommend(age=request_data["age"], gender=request_data["gender"], strengths=request_data["strengths"], challenges=request_data["challenges"], needs=request_data["needs"], goals=request_data["goals"], number_items=request_data.get("number_items", number_items))
+    # Fonction asynchrone pour la génération des recommandations de moyens.
+    recommender = prompt_registry.recommender(MeansRecommendation)
+    number_items = request_data.get("number_items", number_items)
+    fan_out = _fan_out(request_data.get("fan_out"))
+    if fan_out:
+        number_items = variables.means_per_goal
+    key = make_key("means", language=recommender.language, age=request_data["age"], gender=request_data["gender"], strengths=request_data["strengths"], challenges=request_data["challenges"], needs=request_data["needs"], goals=request_data["goals"], number_items=number_items, use_cache=use_cache, fan_out=fan_out, goal_ids=request_data.get("goal_ids"))
+    if fan_out:
+        return await single_flight.run(key, lambda: recommender.recommend_fan_out(age=request_data["age"], gender=request_data["gender"], strengths=request_data["strengths"], challenges=request_data["challenges"], needs=request_data["needs"], goals=request_data["goals"], number_items=number_items, use_cache=use_cache, goal_ids=request_data.get("goal_ids")))
+    return await single_flight.run(key, lambda: recommender.recommend_async(age=request_data["age"], gender=request_data["gender"], strengths=request_data["strengths"], challenges=request_data["challenges"], needs=request_data["needs"], goals=request_data["goals"], number_items=number_items, use_cache=use_cache))
+
+
+def _fan_out(requested: Optional[bool]) -> bool:
+    # Le champ `fan_out` de la requête l'emporte sur le réglage du serveur.
+    return variables.means_fan_out if requested is None else requested
 
 # Examples for documentation
 # Exemples pour la documentation
@@ -40,7 +56,7 @@ timeout_error_example = MeansResponse(error=True, message="The request took long
              status_code=status.HTTP_200_OK,
              summary="Recommends student means to achieve goals.",
              # Recommande des moyens pour que l'étudiant atteigne ses objectifs.
-             description="Takes a student's profile (strengths, challenges, needs, age, and gender) and their goals as input, then returns a list of recommended means. A timeout of 1 minute is applied.",
+             description="Takes a student's profile (strengths, challenges, needs, age, and gender) and their goals as input, then returns a list of recommended means. With `fan_out`, the means of each goal are generated by their own query, all goals concurrently, and tagged with their goal. A timeout of 1 minute is applied.",
              # Prend en entrée le profil de l'étudiant (forces, défis, besoins, âge et sexe) et ses objectifs, puis retourne une liste de moyens recommandés. Un timeout de 1 minute est appliqué.
              responses={
                  status.HTTP_200_OK: {
@@ -73,18 +89,13 @@ timeout_error_example = MeansResponse(error=True, message="The request took long
              })
 
 
-async def get_means_recommendation(request: MeansRequest, background_tasks: BackgroundTasks = BackgroundTasks()):
+async def get_means_recommendation(request: MeansRequest, background_tasks: BackgroundTasks = BackgroundTasks(), cache_control: Optional[str] = Header(None)):
     means_logger.info(f"Request received (fr: Requête reçue): {request.model_dump_json()}")
     
+    set_deadline(60.0)
     try:
-        loop = asyncio.get_running_loop()
-        future = loop.run_in_executor(executor, get_recommendations_sync, request.model_dump(), variables.number_of_items)
-        
-        
-
-        # future = executor.submit(get_recommendations_sync, request.age, request.description)
-        result_dict = await asyncio.wait_for(future, timeout=60.0)
-    except TimeoutError:
+        result_dict = await asyncio.wait_for(get_recommendations(request.model_dump(), variables.number_of_items, use_cache=not bypass_requested(cache_control)), timeout=60.0)
+    except asyncio.TimeoutError:
         error_message = "The request took longer than the allowed 1 minute to process."
         # Le traitement de la requête a dépassé le délai autorisé de 1 minute.
         means_logger.error(f"Timeout: {error_message}")
@@ -94,6 +105,16 @@ async def get_means_recommendation(request: MeansRequest, background_tasks: Back
             status_code=status.HTTP_504_GATEWAY_TIMEOUT,
             detail={"error": True, "message": error_message}
         )
+    except UpstreamUnavailableError as e:
+        error_message = str(e)
+        # Le service de recommandation est temporairement indisponible.
+        means_logger.error(f"Upstream unavailable: {error_message}")
+        background_tasks.add_task(means_logger.info, f"Response (error): {error_message}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"error": True, "message": error_message},
+            headers={"Retry-After": str(max(1, int(e.retry_after or 1)))}
+        )
     except Exception as e:
         error_message = f"An unexpected internal error has occurred.: {str(e)}"
         # Une erreur interne inattendue est survenue
@@ -115,4 +136,22 @@ async def get_means_recommendation(request: MeansRequest, background_tasks: Back
         )
     
     # La réponse de succès est envoyée avec le statut 200 par défaut.
-    return MeansResponse(data=result_dict.get("data"), error=False)
\ No newline at end of file
+    return MeansResponse(data=result_dict.get("data"), error=False, message=result_dict.get("message"))
+
+
+@router.post("/stream",
+             status_code=status.HTTP_200_OK,
+             summary="Streams the means recommended to achieve a student's goals.",
+             # Diffuse en continu les moyens recommandés pour atteindre les objectifs d'un étudiant.
+             description="Same as the means endpoint, but returns a `text/event-stream` response: each mean is sent as an `item` event as soon as it is generated (with `fan_out`, the means of each goal as soon as its query completes), followed by a `done` event (or an `error` event). A timeout of 1 minute is applied.",
+             response_class=StreamingResponse)
+async def stream_means_recommendation(request: MeansRequest, cache_control: Optional[str] = Header(None)):
+    means_logger.info(f"Stream request received (fr: Requête reçue en continu): {request.model_dump_json()}")
+    recommender = prompt_registry.recommender(MeansRecommendation)
+    set_deadline(60.0)
+    if _fan_out(request.fan_out):
+        # Les moyens de chaque objectif sont envoyés dès que sa requête se termine.
+        items = recommender.recommend_fan_out_stream(request.age, request.gender, request.strengths, request.challenges, request.needs, request.goals, variables.means_per_goal, use_cache=not bypass_requested(cache_control), goal_ids=request.goal_ids)
+    else:
+        items = recommender.recommend_stream(request.age, request.gender, request.strengths, request.challenges, request.needs, request.goals, variables.number_of_items, use_cache=not bypass_requested(cache_control))
+    return sse_response(items, "item", 60.0, means_logger)
@@ -0,0 +1,48 @@
+import asyncio
+
+from fastapi import APIRouter, status
+from fastapi.responses import PlainTextResponse
+
+from recommendations.admission import admission
+from recommendations.extraction import pool_status
+from recommendations.jobs import job_store
+from recommendations.single_flight import single_flight
+from utils.load_shedding import load_shedder
+from utils.metrics import metrics
+
+router = APIRouter(tags=["Metrics"])
+
+# Counts of the job queue, read from SQLite off the event loop before each rendering.
+# Nombre de tâches de la file, lu dans SQLite hors de la boucle d'événements avant chaque rendu.
+_job_counts = {}
+
+
+# Gauges read when /metrics is scraped.
+# Jauges lues lors de la collecte de /metrics.
+metrics.gauge("elsia_model_calls_in_flight", "Calls to the Claude model holding an admission slot.",
+              lambda: admission.status()["in_flight"])
+metrics.gauge("elsia_model_calls_limit", "Current concurrency limit of the admission controller.",
+              lambda: admission.status()["limit"])
+metrics.gauge("elsia_model_calls_queued", "Calls to the Claude model waiting for an admission slot, by priority class.",
+              lambda: admission.status()["queued"], label="priority")
+metrics.gauge("elsia_extraction_workers_active", "Worker processes extracting the text of an uploaded file.",
+              lambda: pool_status()["active"])
+metrics.gauge("elsia_extraction_queued", "Text extractions waiting for a worker process.",
+              lambda: pool_status()["queued"])
+metrics.gauge("elsia_recommendations_in_flight", "Distinct recommendations in flight, after the coalescing of identical requests.",
+              lambda: single_flight.stats()["in_flight"])
+metrics.gauge("elsia_requests_in_progress", "Recommendation requests queued or in flight, by work class (light or full).",
+              lambda: load_shedder.status()["in_progress"], label="class")
+metrics.gauge("elsia_jobs", "Full profile jobs in the durable queue, by status (shared by all the workers).",
+              lambda: _job_counts, label="status")
+
+
+@router.get("/metrics",
+            status_code=status.HTTP_200_OK,
+            response_class=PlainTextResponse,
+            summary="Returns the metrics of the worker in the Prometheus text format.",
+            # Retourne les métriques du worker au format texte de Prometheus.
+            description="Returns the latency histograms of the HTTP requests (by route) and of the model calls, the time to first token of the streamed calls, the token counters, the JSON parse failures, the timeouts, and the gauges of the admission queue and of the extraction pool. The values are those of the worker that answers the scrape.")
+async def get_metrics():
+    _job_counts.update(await asyncio.to_thread(job_store.counts))
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,100 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Header, Path, status
+import asyncio
+from models.plan_models import PlanRequest, PlanResponse
+from recommendations.cache import bypass_requested
+from recommendations.plan_sessions import get_plan, plan_store, update_plan
+from recommendations.resilience import UpstreamUnavailableError, set_deadline
+from utils.logging_setup import setup_logger
+
+import utils.variables as variables
+
+
+router = APIRouter(prefix="/plans", tags=["Plans"])
+plans_logger = setup_logger("plans")
+
+PLAN_ID = Path(..., min_length=1, max_length=128, description="Identifier of the plan, chosen by the client (e.g. the identifier of the student's file).")
+
+internal_error_example = PlanResponse(error=True, message="Internal error in the recommendation algorithm.")
+# Erreur interne de l'algorithme de recommandation.
+
+
+@router.put("/{plan_id}",
+            response_model=PlanResponse,
+            status_code=status.HTTP_200_OK,
+            summary="Submits an intervention plan and recommends only what changed.",
+            # Soumet un plan d'intervention et ne recommande que ce qui a changé.
+            description="Takes a student's profile and, optionally, the goals of the plan as edited by the professional, and returns the goals and their means. The last inputs and outputs of each plan are stored: a new submission only recomputes the stages whose inputs changed (the goals when the profile changed, the means of the new or edited goals only), and `recomputed` lists them. The timeout is `ELSIA_PLAN_SESSION_TIMEOUT` (2 minutes by default).",
+            # Prend en entrée le profil de l'étudiant et, facultativement, les objectifs modifiés par le professionnel, puis retourne les objectifs et leurs moyens. Une nouvelle soumission ne recalcule que les étapes dont les entrées ont changé.
+            responses={
+                status.HTTP_500_INTERNAL_SERVER_ERROR: {
+                    "description": "Internal application error.",
+                    # Erreur interne de l'application.
+                    "content": {"application/json": {"example": internal_error_example.model_dump()}}
+                },
+                status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "The service is overloaded; retry after the delay of the `Retry-After` header."},
+                status.HTTP_504_GATEWAY_TIMEOUT: {"description": "Timeout error."},
+            })
+async def put_plan(request: PlanRequest, plan_id: str = PLAN_ID, background_tasks: BackgroundTasks = BackgroundTasks(), cache_control: Optional[str] = Header(None)):
+    plans_logger.info(f"Request received (fr: Requête reçue) for plan {plan_id}: {request.model_dump_json()}")
+
+    timeout = variables.plan_session_timeout
+    set_deadline(timeout)
+    try:
+        result_dict = await asyncio.wait_for(update_plan(plan_id, request.model_dump(), variables.number_of_items, use_cache=not bypass_requested(cache_control)), timeout=timeout)
+    except asyncio.TimeoutError:
+        error_message = f"The request took longer than the allowed {timeout:g} seconds to process."
+        # Le traitement de la requête a dépassé le délai autorisé.
+        plans_logger.error(f"Timeout: {error_message}")
+        background_tasks.add_task(plans_logger.info, f"Response (error): {error_message}")
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail={"error": True, "message": error_message})
+    except UpstreamUnavailableError as e:
+        error_message = str(e)
+        # Le service de recommandation est temporairement indisponible.
+        plans_logger.error(f"Upstream unavailable: {error_message}")
+        background_tasks.add_task(plans_logger.info, f"Response (error): {error_message}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail={"error": True, "message": error_message},
+                            headers={"Retry-After": str(max(1, int(e.retry_after or 1)))})
+    except Exception as e:
+        error_message = f"An unexpected internal error has occurred.: {str(e)}"
+        # Une erreur interne inattendue est survenue
+        plans_logger.error(f"Unhandled internal error: {error_message}")
+        background_tasks.add_task(plans_logger.info, f"Response (error): {error_message}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail={"error": True, "message": error_message})
+
+    background_tasks.add_task(plans_logger.info, f"Response: {result_dict}")
+
+    if result_dict.get("error"):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"error": True, "message": result_dict.get("message", "Internal error in the recommendation algorithm.")}
+            # Erreur interne de l'algorithme de recommandation.
+        )
+    # Les objectifs dont les moyens n'ont pas pu être générés sont indiqués dans `message`.
+    return PlanResponse(data=result_dict["data"], error=False, message=result_dict.get("message"))
+
+
+@router.get("/{plan_id}",
+            response_model=PlanResponse,
+            status_code=status.HTTP_200_OK,
+            summary="Returns the recommendations of an intervention plan.",
+            # Retourne les recommandations d'un plan d'intervention.
+            description="Returns the goals and means stored by the last submission of the plan, without any model call.",
+            responses={status.HTTP_404_NOT_FOUND: {"description": "Unknown plan."}})
+async def read_plan(plan_id: str = PLAN_ID):
+    data = await asyncio.to_thread(get_plan, plan_id)
+    if data is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"error": True, "message": f"Unknown plan: {plan_id}"})
+    return PlanResponse(data=data, error=False)
+
+
+@router.delete("/{plan_id}",
+               status_code=status.HTTP_204_NO_CONTENT,
+               summary="Deletes an intervention plan.",
+               # Supprime un plan d'intervention.
+               description="Deletes the stored inputs and outputs of the plan: its next submission is computed from scratch.",
+               responses={status.HTTP_404_NOT_FOUND: {"description": "Unknown plan."}})
+async def delete_plan(plan_id: str = PLAN_ID):
+    if not await asyncio.to_thread(plan_store.delete, plan_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"error": True, "message": f"Unknown plan: {plan_id}"})
+    plans_logger.info(f"Plan deleted: {plan_id}")
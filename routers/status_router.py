@@ -0,0 +1,69 @@
+import asyncio
+
+from fastapi import APIRouter, status
+
+import recommendations.init
+from recommendations.cache import response_cache
+from recommendations.resilience import breaker
+from recommendations.admission import admission
+from recommendations.single_flight import single_flight
+from recommendations.document_store import document_store
+from utils.load_shedding import load_shedder
+
+router = APIRouter(prefix="/status", tags=["Status"])
+
+
+@router.get("/cache",
+            status_code=status.HTTP_200_OK,
+            summary="Returns the hit/miss counters of the Claude response cache.",
+            # Retourne les compteurs de succès/échecs du cache des réponses de Claude.
+            description="Returns the number of memory hits, disk hits, misses, stores and bypasses of the response cache since the worker started.")
+async def get_cache_status():
+    return response_cache.stats()
+
+
+@router.get("/usage",
+            status_code=status.HTTP_200_OK,
+            summary="Returns the tokens consumed by the Claude calls, including prompt cache reads and writes.",
+            # Retourne les tokens consommés par les appels à Claude, y compris les lectures et écritures du cache de prompt.
+            description="Returns the input, output, cache creation and cache read tokens reported in `usage` since the worker started, and the number of model calls aborted because their deadline expired or their client went away (`abandoned_calls`).")
+async def get_usage_status():
+    return dict(recommendations.init.usage_totals)
+
+
+@router.get("/upstream",
+            status_code=status.HTTP_200_OK,
+            summary="Returns the state of the circuit breaker protecting the calls to the Claude API.",
+            # Retourne l'état du disjoncteur qui protège les appels à l'API Claude.
+            description="Returns the state of the circuit breaker (`closed`, `open` or `half_open`), the number of consecutive failures, and the success, failure, retry and rejection counters since the worker started.")
+async def get_upstream_status():
+    return breaker.status()
+
+
+@router.get("/admission",
+            status_code=status.HTTP_200_OK,
+            summary="Returns the state of the admission controller of the Claude calls.",
+            # Retourne l'état du contrôleur d'admission des appels à Claude.
+            description="Returns the current concurrency limit, the calls in flight and queued per priority class (`interactive`, `full`, `batch`), the last `anthropic-ratelimit-*-remaining` budgets, and the admitted, waited, shed and rate-limited counters since the worker started. `endpoints` returns the load shedding of the HTTP requests: the budgets and requests in progress per work class (`light`, `full`), the latency and estimated wait of every endpoint, and the requests shed because their class was full or their estimated wait exceeded the timeout of their route.")
+async def get_admission_status():
+    return {**admission.status(), "endpoints": load_shedder.status()}
+
+
+@router.get("/coalescing",
+            status_code=status.HTTP_200_OK,
+            summary="Returns the counters of the coalescing of identical in-flight requests.",
+            # Retourne les compteurs du regroupement des requêtes identiques en cours de traitement.
+            description="Returns the number of requests that started a recommendation (`leaders`), the number of identical requests that awaited the result of an in-flight one instead of calling the model (`coalesced`), the number of shared calls cancelled because every request awaiting them had gone (`abandoned`), and the number of recommendations in flight.")
+async def get_coalescing_status():
+    return single_flight.stats()
+
+
+@router.get("/documents",
+            status_code=status.HTTP_200_OK,
+            summary="Returns the size and the counters of the store of the uploaded documents.",
+            # Retourne la taille et les compteurs du stockage des documents envoyés.
+            description="Returns the backend, the number of documents and the bytes of text of the content-addressed document store, and the number of hits (uploads whose text or Files API `file_id` was reused), misses, stores and evictions since the worker started. Returns `{\"backend\": \"none\"}` when the store is disabled.")
+async def get_documents_status():
+    if document_store is None:
+        return {"backend": "none"}
+    return await asyncio.to_thread(document_store.stats)
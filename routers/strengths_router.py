@@ -1,25 +1,30 @@
 # routers/strengths_router.py
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks, status
+from typing import Optional
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Header, status
+from fastapi.responses import StreamingResponse
 import asyncio
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from models.strengths_models import StrengthsRequest, StrengthsResponse
 from recommendations.generate_strengths import StrengthsRecommendation
-from utils.logging_setup import setup_logger # Importez la fonction ici
+from recommendations.cache import bypass_requested
+from recommendations.prompt_registry import prompt_registry
+from recommendations.single_flight import single_flight, make_key
+from recommendations.resilience import UpstreamUnavailableError, set_deadline
+from utils.logging_setup import setup_logger
+from utils.sse import sse_response # Importez la fonction ici
 
 import utils.variables as variables
 
 router = APIRouter(prefix="/strengths", tags=["Forces"])
 strengths_logger = setup_logger("strengths") # Le logger est configuré une seule fois
 
-executor = ThreadPoolExecutor(max_workers=5)
-
-def get_recommendations_sync(age: float, description: str):
-    """Synchronous function for generating recommendations."""
-    #Fonction synchrone pour la génération des recommandations.
+async def get_recommendations(age: float, description: str, use_cache: bool = True):
+    """Asynchronous function for generating recommendations."""
+    #Fonction asynchrone pour la génération des recommandations.
     
-    recommender = StrengthsRecommendation()
-    return recommender.recommend(age, description, variables.number_of_items)
+    recommender = prompt_registry.recommender(StrengthsRecommendation)
+    key = make_key("strengths", language=recommender.language, age=age, description=description, number_items=variables.number_of_items, use_cache=use_cache)
+    return await single_flight.run(key, lambda: recommender.recommend_async(age, description, variables.number_of_items, use_cache=use_cache))
 
 
 # Les exemples pour la documentation
@@ -58,16 +63,13 @@ timeout_error_example = StrengthsResponse(error=True, message="The request took
                      }
                  }
              })
-async def get_strengths_recommendation(request: StrengthsRequest, background_tasks: BackgroundTasks = BackgroundTasks()):
+async def get_strengths_recommendation(request: StrengthsRequest, background_tasks: BackgroundTasks = BackgroundTasks(), cache_control: Optional[str] = Header(None)):
     strengths_logger.info(f"Request received (Requête reçue): {request.model_dump_json()}")
     
+    set_deadline(60.0)
     try:
-        loop = asyncio.get_running_loop()
-        future = loop.run_in_executor(executor, get_recommendations_sync, request.age, request.description)
-
-        # future = executor.submit(get_recommendations_sync, request.age, request.description)
-        result_dict = await asyncio.wait_for(future, timeout=60.0)
-    except TimeoutError:
+        result_dict = await asyncio.wait_for(get_recommendations(request.age, request.description, use_cache=not bypass_requested(cache_control)), timeout=60.0)
+    except asyncio.TimeoutError:
         error_message = "The request took longer than the allowed 1 minute to process."#Le traitement de la requête a dépassé le délai autorisé de 1 minute.
         strengths_logger.error(f"Timeout: {error_message}")
         response_data = {"error": True, "message": error_message}
@@ -79,6 +81,16 @@ async def get_strengths_recommendation(request: StrengthsRequest, background_tas
             detail={"error": True, "message": error_message}
         )    
         
+    except UpstreamUnavailableError as e:
+        error_message = str(e)
+        # Le service de recommandation est temporairement indisponible.
+        strengths_logger.error(f"Upstream unavailable: {error_message}")
+        background_tasks.add_task(strengths_logger.info, f"Response (error): {error_message}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"error": True, "message": error_message},
+            headers={"Retry-After": str(max(1, int(e.retry_after or 1)))}
+        )
     except Exception as e:
         error_message = f"An unexpected internal error has occurred.: {str(e)}"#Une erreur interne inattendue est survenue
         strengths_logger.error(f"Unhandled internal error (fr: Erreur interne non gérée): {error_message}")
@@ -101,3 +113,16 @@ async def get_strengths_recommendation(request: StrengthsRequest, background_tas
         )
     
     return StrengthsResponse(data=result_dict.get("data"), error=False)
+
+
+@router.post("/stream",
+             status_code=status.HTTP_200_OK,
+             summary="Streams a student's strengths recommended from a free description.",#Diffuse en continu les forces recommandées d'un étudiant à partir d'une description libre.
+             description="Same as the strengths endpoint, but returns a `text/event-stream` response: each strength is sent as an `item` event as soon as it is generated, followed by a `done` event (or an `error` event). A timeout of 1 minute is applied.",
+             response_class=StreamingResponse)
+async def stream_strengths_recommendation(request: StrengthsRequest, cache_control: Optional[str] = Header(None)):
+    strengths_logger.info(f"Stream request received (Requête reçue en continu): {request.model_dump_json()}")
+    recommender = prompt_registry.recommender(StrengthsRecommendation)
+    set_deadline(60.0)
+    items = recommender.recommend_stream(request.age, request.description, variables.number_of_items, use_cache=not bypass_requested(cache_control))
+    return sse_response(items, "item", 60.0, strengths_logger)
@@ -0,0 +1,93 @@
+"""
+Local fake of the Anthropic Message Batches API, to exercise the /api/v1/batch endpoints without calling Anthropic.
+
+Usage:
+    uvicorn tools.fake_batch_server:app --port 8001
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8001 uvicorn main:app
+
+Batches end FAKE_BATCH_DELAY seconds (default 2) after their submission, and every item gets a deterministic
+`<output>[...]</output>` answer.
+"""
+# Faux serveur local de l'API Message Batches d'Anthropic, pour tester les endpoints /api/v1/batch sans appeler Anthropic.
+import hashlib
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+app = FastAPI(title="Fake Anthropic Message Batches API")
+batches = {}
+delay = float(os.getenv("FAKE_BATCH_DELAY", "2"))
+
+
+def _timestamp(value: float) -> str:
+    return datetime.fromtimestamp(value, tz=timezone.utc).isoformat()
+
+
+def _answer(params: dict) -> str:
+    """
+    Returns a deterministic answer in the format expected by `process_response`.
+    """
+    prompt = json.dumps(params.get("messages"), sort_keys=True)
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+    items = [f"Recommendation {digest}-{index}" for index in range(3)]
+    if "gender: " in prompt:
+        return "<output>" + json.dumps({key: items for key in ("strengths", "challenges", "needs", "goals", "means")}) + "</output>"
+    return "<output>" + json.dumps(items) + "</output>"
+
+
+def _batch_object(request: Request, batch: dict) -> dict:
+    ended = time.time() >= batch["created_at"] + delay
+    total = len(batch["requests"])
+    return {
+        "id": batch["id"],
+        "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": {"processing": 0 if ended else total, "succeeded": total if ended else 0, "errored": 0, "canceled": 0, "expired": 0},
+        "created_at": _timestamp(batch["created_at"]),
+        "expires_at": _timestamp(batch["created_at"] + timedelta(days=1).total_seconds()),
+        "ended_at": _timestamp(batch["created_at"] + delay) if ended else None,
+        "cancel_initiated_at": None,
+        "archived_at": None,
+        "results_url": str(request.url_for("batch_results", batch_id=batch["id"])) if ended else None,
+    }
+
+
+@app.post("/v1/messages/batches")
+async def create_batch(request: Request):
+    body = await request.json()
+    batch = {"id": f"msgbatch_{uuid.uuid4().hex}", "requests": body["requests"], "created_at": time.time()}
+    batches[batch["id"]] = batch
+    return _batch_object(request, batch)
+
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def retrieve_batch(batch_id: str, request: Request):
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail={"type": "not_found_error", "message": "Batch not found."})
+    return _batch_object(request, batches[batch_id])
+
+
+@app.get("/v1/messages/batches/{batch_id}/results", name="batch_results")
+async def batch_results(batch_id: str):
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail={"type": "not_found_error", "message": "Batch not found."})
+    lines = []
+    for item in batches[batch_id]["requests"]:
+        params = item["params"]
+        message = {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": params.get("model"),
+            "content": [{"type": "text", "text": _answer(params)}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 100, "output_tokens": 50, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0},
+        }
+        lines.append(json.dumps({"custom_id": item["custom_id"], "result": {"type": "succeeded", "message": message}}))
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="application/x-jsonl")
@@ -0,0 +1,174 @@
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+
+from recommendations.admission import AdmissionController, admission
+from utils.metrics import shed_requests
+
+import utils.variables as variables
+
+
+# Work classes of the HTTP requests, in the order of the priority of their model calls.
+# Classes de travail des requêtes HTTP, dans l'ordre de priorité de leurs appels au modèle.
+WORK_CLASSES = ("light", "full")
+
+
+class LoadShedder:
+    """
+    Endpoint-level admission of the HTTP requests, before their body is read.
+    Tracks the requests in progress (queued or in flight) per endpoint and the EWMA of their latency, and rejects
+    a request when its work class is over budget, or when its estimated completion time exceeds the timeout of its route:
+    the work ahead of it (the requests in progress of its class and of the classes served before it, weighted by their
+    latency) divided by the concurrency limit of the admission controller, plus its own latency.
+    It must only be used from the event loop of the worker.
+    """
+    # Admission des requêtes HTTP par endpoint, avant la lecture de leur corps.
+
+    def __init__(self, controller: AdmissionController, budgets: Dict[str, int], alpha: float = 0.2, min_samples: int = 5):
+        self.controller = controller
+        self.budgets = budgets
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self._in_progress: Dict[str, int] = defaultdict(int)
+        self._classes: Dict[str, str] = {}
+        self._latency: Dict[str, float] = {}
+        self._samples: Dict[str, int] = defaultdict(int)
+        self._counters = {"admitted": 0, "shed_budget": 0, "shed_wait": 0, "failed": 0}
+
+    def _known_latency(self, endpoint: str) -> Optional[float]:
+        return self._latency.get(endpoint) if self._samples[endpoint] >= self.min_samples else None
+
+    def estimated_wait(self, endpoint: str, work_class: str) -> Optional[float]:
+        """
+        Returns the estimated completion time of a new request of the endpoint, or None while its latency is unknown.
+        """
+        latency = self._known_latency(endpoint)
+        if latency is None:
+            return None
+        ahead = WORK_CLASSES[:WORK_CLASSES.index(work_class) + 1]
+        backlog = sum(count * self._latency.get(other, latency) for other, count in self._in_progress.items()
+                      if count and self._classes[other] in ahead)
+        return backlog / max(1, self.controller.limit) + latency
+
+    def admit(self, endpoint: str, work_class: str, timeout: float) -> Optional[Tuple[str, float]]:
+        """
+        Admits a request of the endpoint, which must then call `done`.
+        :return: None if the request is admitted, otherwise a tuple (reason, delay after which it may be retried in seconds),
+            the reason being "budget" or "wait".
+        """
+        self._classes[endpoint] = work_class
+        in_class = sum(count for other, count in self._in_progress.items() if self._classes[other] == work_class)
+        if in_class >= self.budgets[work_class]:
+            self._counters["shed_budget"] += 1
+            return "budget", max(1.0, self._known_latency(endpoint) or 1.0)
+        wait = self.estimated_wait(endpoint, work_class)
+        if wait is not None and wait > timeout:
+            self._counters["shed_wait"] += 1
+            return "wait", max(1.0, wait - timeout)
+        self._in_progress[endpoint] += 1
+        self._counters["admitted"] += 1
+        return None
+
+    def done(self, endpoint: str, duration: Optional[float] = None, failed: bool = False) -> None:
+        """
+        Ends an admitted request, and updates the latency of the endpoint with its `duration` when it ran to completion.
+        :param failed: Whether the request ended with an exception rather than a response; it is counted, without latency sample.
+        """
+        self._in_progress[endpoint] -= 1
+        if failed:
+            self._counters["failed"] += 1
+            return
+        if duration is not None:
+            previous = self._latency.get(endpoint)
+            self._latency[endpoint] = duration if previous is None else (1 - self.alpha) * previous + self.alpha * duration
+            self._samples[endpoint] += 1
+
+    def status(self) -> dict:
+        """
+        Returns the requests in progress, the latency and the estimated wait of every endpoint, and the counters of the shedder.
+        """
+        endpoints = {
+            endpoint: {"class": work_class, "in_progress": self._in_progress[endpoint], "latency": self._latency.get(endpoint),
+                       "estimated_wait": self.estimated_wait(endpoint, work_class)}
+            for endpoint, work_class in self._classes.items()
+        }
+        in_progress = {work_class: 0 for work_class in WORK_CLASSES}
+        for endpoint, count in self._in_progress.items():
+            in_progress[self._classes[endpoint]] += count
+        return {"budgets": dict(self.budgets), "in_progress": in_progress, "endpoints": endpoints, **self._counters}
+
+
+class LoadSheddingMiddleware:
+    """
+    ASGI middleware admitting the recommendation requests through a `LoadShedder`, before their body is read:
+    a request that would wait longer than the timeout of its route is rejected right away with 503 and `Retry-After`,
+    instead of holding a connection until its 504.
+
+    `routes` maps the path of each route (without its trailing slash, `*` standing for the last segment)
+    to its work class and its timeout; the other paths are not admitted.
+    """
+    # Middleware ASGI qui rejette (503) les requêtes dont l'attente estimée dépasse le timeout de leur route.
+
+    def __init__(self, app, shedder: LoadShedder, routes: Dict[str, Tuple[str, float]], methods=("POST", "PUT")):
+        self.app = app
+        self.shedder = shedder
+        self.routes = routes
+        self.methods = methods
+
+    def _route(self, path: str) -> Optional[Tuple[str, Tuple[str, float]]]:
+        path = path.rstrip("/")
+        if path in self.routes:
+            return path, self.routes[path]
+        pattern = path.rsplit("/", 1)[0] + "/*"
+        if pattern in self.routes:
+            return pattern, self.routes[pattern]
+        return None
+
+    async def __call__(self, scope, receive, send):
+        route = self._route(scope["path"]) if scope["type"] == "http" and scope["method"] in self.methods else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        endpoint, (work_class, timeout) = route
+        rejection = self.shedder.admit(endpoint, work_class, timeout)
+        if rejection is not None:
+            reason, retry_after = rejection
+            shed_requests.inc(endpoint=endpoint, reason=reason)
+            response = JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"detail": {"error": True, "message": "The recommendation service is overloaded, please retry later."}},
+                headers={"Retry-After": str(max(1, int(retry_after + 0.5)))}
+            )
+            await response(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            # Exception levée (client parti, erreur interne) : comptée à part, sans échantillon de latence.
+            self.shedder.done(endpoint, failed=True)
+            raise
+        # Seules les réponses 2xx et les 504 (la requête a occupé tout son timeout) mesurent la latence :
+        # les erreurs de validation, les 503 en amont et les erreurs internes rapides la fausseraient.
+        measured = 200 <= status_code < 300 or status_code == 504
+        self.shedder.done(endpoint, time.perf_counter() - start if measured else None)
+
+
+load_shedder = LoadShedder(
+    admission,
+    budgets={"light": variables.shed_light_budget, "full": variables.shed_full_budget},
+    alpha=variables.shed_latency_alpha,
+)
@@ -1,6 +1,16 @@
+import atexit
+import copy
+import json
 import logging
-from datetime import date
 import os
+import queue
+import random
+import threading
+from datetime import date, datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+import utils.variables as variables
 
 def setup_logger_old(endpoint_name: str) -> logging.Logger:
     """
@@ -31,36 +41,172 @@ def setup_logger_old(endpoint_name: str) -> logging.Logger:
     return logger
 
 
-def setup_logger(endpoint_name: str) -> logging.Logger:
+class JsonLinesFormatter(logging.Formatter):
     """
-    Configure un logger pour un endpoint donné.
-    Crée dynamiquement un dossier de log journalier et un fichier de log dédié.
-    La configuration du logger est effectuée une seule fois.
+    Formats a record as one JSON object per line: time, level, logger, message and exception.
     """
-    today_str = date.today().isoformat()
-    log_dir = os.path.join("logs", today_str)
+    # Formate un enregistrement en un objet JSON par ligne.
 
-    # Crée le dossier de date s'il n'existe pas
-    os.makedirs(log_dir, exist_ok=True)
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
 
-    log_file_path = os.path.join(log_dir, f"{endpoint_name}_logs.log")
 
+class DailyRotatingFileHandler(logging.Handler):
+    """
+    Writes the records of every logger to `<directory>/<day>/<logger>_logs.log`.
+    The day is computed for every record, so a long-running process moves to a new directory at midnight,
+    and each file is rotated by size (`.1`, `.2`...) within its day.
+    """
+    # Écrit les enregistrements de chaque logger dans `<dossier>/<jour>/<logger>_logs.log`, avec rotation par jour et par taille.
+
+    def __init__(self, directory: str, max_bytes: int, backup_count: int):
+        super().__init__()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._handlers: Dict[str, tuple] = {}
+
+    def _handler(self, record: logging.LogRecord) -> RotatingFileHandler:
+        day = date.fromtimestamp(record.created).isoformat()
+        current = self._handlers.get(record.name)
+        if current is not None and current[0] == day:
+            return current[1]
+        if current is not None:
+            current[1].close()
+        log_dir = os.path.join(self.directory, day)
+        os.makedirs(log_dir, exist_ok=True)
+        handler = RotatingFileHandler(os.path.join(log_dir, f"{record.name}_logs.log"), maxBytes=self.max_bytes,
+                                      backupCount=self.backup_count, encoding="utf-8")
+        handler.setFormatter(self.formatter)
+        self._handlers[record.name] = (day, handler)
+        return handler
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self._handler(record).emit(record)
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        for _, handler in self._handlers.values():
+            handler.close()
+        self._handlers.clear()
+        super().close()
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queue handler used by the request path: the message is formatted, truncated or sampled out when it is large,
+    and dropped (and counted) rather than blocking when the queue is full.
+    """
+    # Handler de file d'attente : le message volumineux est tronqué ou écarté, et la requête n'attend jamais l'écriture.
+
+    def __init__(self, log_queue: queue.Queue, max_chars: int, large_sample_rate: float):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self.large_sample_rate = large_sample_rate
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> Optional[logging.LogRecord]:
+        message = record.getMessage()
+        if len(message) > self.max_chars:
+            if random.random() >= self.large_sample_rate:
+                return None
+            message = f"{message[:self.max_chars]}... [truncated {len(message) - self.max_chars} characters]"
+        record = copy.copy(record)
+        record.msg = message
+        record.args = None
+        if record.exc_info:
+            # La trace est formatée ici : l'objet exception ne traverse pas la file.
+            record.msg = f"{message}\n{logging.Formatter().formatException(record.exc_info)}"
+            record.exc_info = None
+            record.exc_text = None
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            prepared = self.prepare(record)
+            if prepared is not None:
+                self.enqueue(prepared)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.queue.put_nowait(record)
+
+
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+_lock = threading.Lock()
+
+
+def _get_queue_handler() -> NonBlockingQueueHandler:
+    """
+    Starts, once per process, the listener thread that writes the queued records to the files.
+    """
+    global _queue_handler, _listener
+    with _lock:
+        if _queue_handler is None:
+            log_queue = queue.Queue(maxsize=variables.log_queue_size)
+            file_handler = DailyRotatingFileHandler(variables.log_directory, variables.log_max_bytes, variables.log_backup_count)
+            file_handler.setFormatter(JsonLinesFormatter())
+            _listener = QueueListener(log_queue, file_handler)
+            _listener.start()
+            atexit.register(stop_logging)
+            _queue_handler = NonBlockingQueueHandler(log_queue, variables.log_max_message_chars, variables.log_large_sample_rate)
+    return _queue_handler
+
+
+def stop_logging() -> None:
+    """
+    Writes the records still in the queue and stops the listener thread.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+
+
+def dropped_records() -> int:
+    """
+    Returns the number of records dropped because the queue was full.
+    """
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def setup_logger(endpoint_name: str) -> logging.Logger:
+    """
+    Configure un logger pour un endpoint donné.
+    Les enregistrements passent par une file d'attente et sont écrits en lignes JSON par un thread dédié,
+    dans un fichier de log journalier (`logs/<jour>/<endpoint>_logs.log`) avec rotation par taille.
+    La configuration du logger est effectuée une seule fois.
+    """
     # Obtient ou crée un logger avec un nom unique pour l'endpoint
     logger = logging.getLogger(endpoint_name)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(variables.log_level)
 
     # Empêche la propagation au logger racine, évitant la duplication
     logger.propagate = False
     
     # Vérifie si le logger a déjà un handler pour ne pas le dupliquer
     if not logger.handlers:
-        file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        logger.addHandler(_get_queue_handler())
 
     return logger
 
 # Exemple d'utilisation dans un endpoint
 # strengths_logger = setup_logger("strengths")
-# strengths_logger.info("Requête reçue: ...")
\ No newline at end of file
+# strengths_logger.info("Requête reçue: ...")
@@ -0,0 +1,215 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+
+# Default buckets of the latency histograms, in seconds: from a cached response to a full profile.
+# Seuils par défaut des histogrammes de latence, en secondes : d'une réponse en cache à un profil complet.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.label_names, key)} {_number(value)}"
+
+
+class Histogram:
+    """
+    Histogram of observations with cumulative buckets, a sum and a count, optionally split by labels.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Compteurs par seuil (non cumulés), puis somme et nombre d'observations.
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = {key: list(series) for key, series in self._values.items()}
+        for key, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                bound_label = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.label_names, key, bound_label)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, key)} {_number(series[-2])}"
+            yield f"{self.name}_count{_labels(self.label_names, key)} {series[-1]}"
+
+
+class Gauge:
+    """
+    Gauge read from a function when the metrics are collected, so that it costs nothing on the request path.
+    The function returns a number, or a dictionary {label value: number} for a gauge with one label.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], object], label: Optional[str] = None):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.label = label
+
+    def samples(self) -> Iterable[str]:
+        value = self.read()
+        if self.label is None:
+            yield f"{self.name} {_number(value)}"
+            return
+        for label_value, number in sorted(value.items()):
+            yield f"{self.name}{_labels((self.label,), (label_value,))} {_number(number)}"
+
+
+class MetricsRegistry:
+    """
+    In-process metrics of the worker, rendered in the Prometheus text format by `/metrics`.
+    """
+    # Métriques du worker, en mémoire, exposées au format texte de Prometheus par `/metrics`.
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], object], label: Optional[str] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, read, label))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.samples())
+            except Exception:
+                # Une jauge illisible ne doit pas empêcher l'export des autres métriques.
+                continue
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+http_request_duration = metrics.histogram(
+    "elsia_http_request_duration_seconds", "Duration of the HTTP requests, by endpoint, method and status code.",
+    ("endpoint", "method", "status"))
+model_call_duration = metrics.histogram(
+    "elsia_model_call_duration_seconds", "Duration of the calls to the Claude model, until the full response.", ("mode",))
+model_time_to_first_token = metrics.histogram(
+    "elsia_model_time_to_first_token_seconds", "Time until the first text token of the streamed calls to the Claude model.")
+model_tokens = metrics.counter(
+    "elsia_model_tokens_total", "Tokens reported in the usage of the Claude responses.", ("type",))
+parse_failures = metrics.counter(
+    "elsia_parse_failures_total", "Model responses whose JSON output could not be parsed.", ("reason", "output"))
+parsed_responses = metrics.counter(
+    "elsia_parsed_responses_total", "Model responses whose JSON output was parsed, by output mode (tool or text).", ("output",))
+json_repairs = metrics.counter(
+    "elsia_json_repairs_total", "Invalid JSON outputs repaired locally, by kind of repair.", ("kind",))
+json_reasks = metrics.counter(
+    "elsia_json_reasks_total", "Invalid JSON outputs sent back to the model for correction, by outcome.", ("outcome",))
+jobs_finished = metrics.counter(
+    "elsia_jobs_finished_total", "Full profile jobs finished by the workers of this process, by status.", ("status",))
+shed_requests = metrics.counter(
+    "elsia_shed_requests_total", "HTTP requests rejected with 503 before being processed, by endpoint and reason (budget or wait).", ("endpoint", "reason"))
+model_escalations = metrics.counter(
+    "elsia_model_escalations_total", "Outputs of the small model that failed validation and were generated again by the large model, by recommender.", ("output",))
+single_flight_requests = metrics.counter(
+    "elsia_single_flight_requests_total", "Recommendation requests by role in the coalescing of identical requests: leader (runs the call), coalesced (shares the call of a leader) or abandoned (call cancelled, nobody waits for it).", ("role",))
+timeouts = metrics.counter(
+    "elsia_timeouts_total", "Requests and model calls that exceeded their time limit.", ("scope",))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the duration of every HTTP request by endpoint, and the requests that timed out (504).
+    The endpoint is the name of the matched route (e.g. `get_strengths_recommendation`), which keeps the cardinality
+    bounded whatever the path parameters, and does not depend on the prefixes of the included routers.
+    """
+    # Middleware ASGI qui mesure la durée des requêtes HTTP par route.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = getattr(scope.get("route"), "name", None) or "unmatched"
+            http_request_duration.observe(time.perf_counter() - start, endpoint=endpoint, method=scope["method"], status=status_code)
+            if status_code == 504:
+                timeouts.inc(scope="request")
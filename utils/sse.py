@@ -0,0 +1,69 @@
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+
+
+def format_event(event: str, data) -> str:
+    """
+    Formats a Server-Sent Event.
+    :param event: The name of the event.
+    :param data: The JSON-serializable payload of the event.
+    :return: The event, ready to be written to the response body.
+    """
+    # Formate un événement Server-Sent Events.
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def event_stream(items: AsyncIterator, event: str, timeout: float, logger: logging.Logger) -> AsyncIterator[str]:
+    """
+    Converts an asynchronous iterator of recommendations into Server-Sent Events.
+    Every item is sent as an `event` event, followed by a `done` event, or by an `error` event
+    if the generation fails or exceeds the timeout.
+
+    :param items: The asynchronous iterator of the recommendations.
+    :param event: The name of the events carrying the items.
+    :param timeout: The maximum duration of the whole stream, in seconds.
+    :param logger: The logger of the endpoint.
+    """
+    deadline = time.monotonic() + timeout
+    count = 0
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                item = await asyncio.wait_for(items.__anext__(), timeout=remaining)
+            except StopAsyncIteration:
+                break
+            count += 1
+            yield format_event(event, item)
+        logger.info(f"Streamed response: {count} {event} events")
+        yield format_event("done", {"error": False, "count": count})
+    except asyncio.TimeoutError:
+        error_message = f"The request took longer than the allowed {int(timeout)} seconds to process."
+        # Le traitement de la requête a dépassé le délai autorisé.
+        logger.error(f"Timeout: {error_message}")
+        yield format_event("error", {"error": True, "message": error_message})
+    except Exception as e:
+        error_message = f"An unexpected internal error has occurred.: {str(e)}"
+        # Une erreur interne inattendue est survenue
+        logger.error(f"Unhandled internal error: {error_message}")
+        yield format_event("error", {"error": True, "message": error_message})
+    finally:
+        await items.aclose()
+
+
+def sse_response(items: AsyncIterator, event: str, timeout: float, logger: logging.Logger) -> StreamingResponse:
+    """
+    Returns a `text/event-stream` response streaming the recommendations produced by `items`.
+    """
+    return StreamingResponse(
+        event_stream(items, event, timeout, logger),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from typing import Dict, Optional
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+
+import utils.variables as variables
+
+
+class UploadTooLargeError(ValueError):
+    """
+    Raised when an uploaded file exceeds the maximum size.
+    """
+    # Levée lorsqu'un fichier envoyé dépasse la taille maximale.
+
+
+class StoredUpload:
+    """
+    An uploaded file: kept in memory when it is small, spooled to the upload directory otherwise.
+    The file is removed when the last holder releases it (the request, and the shared call that uses it).
+    """
+    # Un fichier envoyé : conservé en mémoire s'il est petit, écrit dans le dossier des envois sinon.
+
+    def __init__(self, filename: str, extension: str, size: int, sha256: str, data: Optional[bytes] = None, path: Optional[str] = None):
+        self.filename = filename
+        self.extension = extension
+        self.size = size
+        self.sha256 = sha256
+        self.data = data
+        self.path = path
+        self._references = 1
+
+    def read_bytes(self) -> bytes:
+        """
+        Returns the content of the file. For a spooled file this reads the disk: call it off the event loop.
+        """
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as file:
+            return file.read()
+
+    def retain(self) -> None:
+        self._references += 1
+
+    def release(self) -> None:
+        """
+        Releases a reference to the upload, and removes the spooled file once nobody holds it.
+        """
+        self._references -= 1
+        if self._references <= 0 and self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def __repr__(self) -> str:
+        location = "memory" if self.data is not None else self.path
+        return f"StoredUpload({self.filename!r}, {self.size} bytes, {location})"
+
+
+def _write_chunk(file, chunk: bytes) -> None:
+    file.write(chunk)
+
+
+async def ingest_upload(upload: UploadFile, extension: str, max_bytes: int = variables.upload_max_bytes,
+                        memory_threshold: int = variables.upload_memory_threshold, directory: str = variables.upload_directory,
+                        chunk_size: int = variables.upload_chunk_size) -> StoredUpload:
+    """
+    Reads an uploaded file chunk by chunk, computing its SHA-256 and enforcing its maximum size.
+    The first `memory_threshold` bytes are kept in memory; beyond that the file is spooled to `directory`.
+    The disk operations run in worker threads, off the event loop.
+
+    :param upload: The uploaded file.
+    :param extension: The extension of the spooled file (e.g. ".pdf").
+    :param max_bytes: The maximum size of the file.
+    :param memory_threshold: The maximum size of a file kept in memory.
+    :param directory: The directory of the spooled files.
+    :param chunk_size: The size of the chunks read from the request.
+    :return: The stored upload; the caller must `release` it.
+    :raises UploadTooLargeError: If the file exceeds `max_bytes`; nothing is left on disk.
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray()
+    size = 0
+    path = None
+    file = None
+    try:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(f"The file exceeds the maximum size of {max_bytes} bytes.")
+            digest.update(chunk)
+            if file is None and size <= memory_threshold:
+                buffer.extend(chunk)
+                continue
+            if file is None:
+                os.makedirs(directory, exist_ok=True)
+                path = os.path.join(directory, f"{uuid.uuid4()}{extension}")
+                file = await asyncio.to_thread(open, path, "wb")
+                chunk, buffer = bytes(buffer) + chunk, None
+            await asyncio.to_thread(_write_chunk, file, chunk)
+    except BaseException:
+        if file is not None:
+            await asyncio.to_thread(file.close)
+            os.remove(path)
+        raise
+    if file is not None:
+        await asyncio.to_thread(file.close)
+        return StoredUpload(upload.filename, extension, size, digest.hexdigest(), path=path)
+    return StoredUpload(upload.filename, extension, size, digest.hexdigest(), data=bytes(buffer))
+
+
+def sweep_orphans(directory: str = variables.upload_directory, max_age: float = variables.upload_orphan_max_age) -> int:
+    """
+    Removes the spooled uploads older than `max_age` seconds, left behind by a crashed or killed worker.
+    :return: The number of removed files.
+    """
+    removed = 0
+    if not os.path.isdir(directory):
+        return removed
+    limit = time.time() - max_age
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < limit:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+
+async def janitor(interval: float, logger) -> None:
+    """
+    Sweeps the orphan uploads every `interval` seconds, off the event loop, until cancelled.
+    """
+    while True:
+        try:
+            removed = await asyncio.to_thread(sweep_orphans)
+            if removed:
+                logger.info(f"Upload janitor removed {removed} orphan files.")
+        except Exception as e:
+            logger.error(f"Upload janitor failed: {e}")
+        await asyncio.sleep(interval)
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware rejecting with 413 the request bodies larger than the limit of their path prefix,
+    from the `Content-Length` header or while the body is received, before it is buffered by the form parser.
+    """
+    # Middleware ASGI qui rejette (413) les corps de requête plus grands que la limite de leur chemin.
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    def _limit(self, path: str) -> Optional[int]:
+        for prefix, limit in self.limits.items():
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def __call__(self, scope, receive, send):
+        limit = self._limit(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        too_large = HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                  detail={"error": True, "message": f"The request body exceeds the maximum size of {limit} bytes."})
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse(status_code=too_large.status_code, content={"detail": too_large.detail})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise too_large
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -1 +1,152 @@
-number_of_items = 10
\ No newline at end of file
+import os
+
+number_of_items = 10
+
+# Pool de connexions HTTP du client asynchrone Claude, partagé par tous les routeurs.
+# HTTP connection pool of the shared asynchronous Claude client.
+llm_max_connections = int(os.getenv("ELSIA_LLM_MAX_CONNECTIONS", "100"))
+llm_max_keepalive_connections = int(os.getenv("ELSIA_LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+llm_keepalive_expiry = float(os.getenv("ELSIA_LLM_KEEPALIVE_EXPIRY", "30.0"))
+
+# Backend des appels au modèle : "anthropic", ou "fake" (réponses déterministes, sans clé ni crédit d'API) pour les tests de charge.
+# Backend of the model calls: "anthropic", or "fake" (deterministic answers, no API key nor credit) for the load tests.
+llm_backend = os.getenv("ELSIA_LLM_BACKEND", "anthropic").lower()
+# Latence du faux backend ("fixed:0.5", "uniform:0.2,1.0", "lognormal:0.5,0.4", "exponential:0.5"), taux d'erreurs 529 et rythme du flux.
+# Latency of the fake backend, rate of 529 errors, delay between two streamed chunks and seed of the random draws.
+fake_llm_latency = os.getenv("ELSIA_FAKE_LLM_LATENCY", "lognormal:0.5,0.3")
+fake_llm_error_rate = float(os.getenv("ELSIA_FAKE_LLM_ERROR_RATE", "0.0"))
+fake_llm_chunk_delay = float(os.getenv("ELSIA_FAKE_LLM_CHUNK_DELAY", "0.02"))
+fake_llm_seed = int(os.getenv("ELSIA_FAKE_LLM_SEED", "0"))
+
+# Modèles par niveau : le grand modèle pour la génération, un modèle plus petit et plus rapide pour l'extraction de mots-clés.
+# Models by tier: the large model for the generation, a smaller and faster model for the keyword extraction.
+model_tiers = {
+    "large": {"model": os.getenv("ELSIA_MODEL_LARGE", "claude-sonnet-4-20250514"), "max_tokens": int(os.getenv("ELSIA_MAX_TOKENS_LARGE", "10000"))},
+    "small": {"model": os.getenv("ELSIA_MODEL_SMALL", "claude-haiku-4-5-20251001"), "max_tokens": int(os.getenv("ELSIA_MAX_TOKENS_SMALL", "2000"))},
+}
+# Niveau de chaque recommandation (ELSIA_<RECOMMANDATION>_TIER, "large" ou "small").
+# Tier of each recommender (ELSIA_<RECOMMENDER>_TIER, "large" or "small").
+recommender_tiers = {
+    output: os.getenv(f"ELSIA_{output.upper()}_TIER", default).lower()
+    for output, default in (("strengths", "small"), ("challenges", "small"), ("needs", "small"), ("goals", "large"), ("means", "large"), ("full", "large"))
+}
+# Sortie du petit modèle invalide (ou tronquée) : elle est générée à nouveau par le grand modèle.
+# Invalid (or truncated) output of the small model: it is generated again by the large model.
+model_escalation = os.getenv("ELSIA_MODEL_ESCALATION", "true").lower() == "true"
+
+# Cache des réponses de Claude (niveau mémoire LRU + niveau SQLite optionnel partagé entre workers).
+# Claude response cache (in-memory LRU tier + optional SQLite tier shared between workers).
+cache_enabled = os.getenv("ELSIA_CACHE_ENABLED", "true").lower() == "true"
+cache_max_entries = int(os.getenv("ELSIA_CACHE_MAX_ENTRIES", "1024"))
+cache_ttl_seconds = float(os.getenv("ELSIA_CACHE_TTL_SECONDS", "86400"))
+cache_sqlite_path = os.getenv("ELSIA_CACHE_SQLITE_PATH", "")
+
+# Mode pipeline de /profile/full : étapes concurrentes avec timeout et relance par étape.
+# Pipelined mode of /profile/full: concurrent stages with a per-stage timeout and retry.
+full_profile_pipeline = os.getenv("ELSIA_FULL_PROFILE_PIPELINE", "false").lower() == "true"
+pipeline_stage_timeout = float(os.getenv("ELSIA_PIPELINE_STAGE_TIMEOUT", "45"))
+pipeline_stage_retries = int(os.getenv("ELSIA_PIPELINE_STAGE_RETRIES", "1"))
+means_per_goal = int(os.getenv("ELSIA_MEANS_PER_GOAL", "3"))
+# Mode éclaté de /means par défaut : une requête par objectif, tous les objectifs en parallèle.
+# Default fan-out mode of /means: one query per goal, all goals concurrently.
+means_fan_out = os.getenv("ELSIA_MEANS_FAN_OUT", "false").lower() == "true"
+
+# Base SQLite des tâches par lot (Message Batches API).
+# SQLite database of the batch jobs (Message Batches API).
+batch_store_path = os.getenv("ELSIA_BATCH_STORE_PATH", os.path.join("data", "batch_jobs.sqlite3"))
+
+# Base SQLite des plans d'intervention : dernières entrées et sorties de chaque plan, supprimées après ELSIA_PLAN_SESSION_MAX_AGE secondes sans soumission.
+# SQLite database of the intervention plans: last inputs and outputs of each plan, deleted after ELSIA_PLAN_SESSION_MAX_AGE seconds without a submission.
+plan_store_path = os.getenv("ELSIA_PLAN_STORE_PATH", os.path.join("data", "plans.sqlite3"))
+plan_session_max_age = float(os.getenv("ELSIA_PLAN_SESSION_MAX_AGE", str(30 * 24 * 3600)))
+plan_session_timeout = float(os.getenv("ELSIA_PLAN_SESSION_TIMEOUT", "120"))
+
+# File d'attente SQLite des tâches de profil complet : survit aux redémarrages, traitée par un pool borné de workers par processus.
+# SQLite queue of the full profile jobs: survives the restarts, processed by a bounded pool of workers per process.
+job_store_path = os.getenv("ELSIA_JOB_STORE_PATH", os.path.join("data", "jobs.sqlite3"))
+job_files_directory = os.getenv("ELSIA_JOB_FILES_DIR", os.path.join("data", "job_files"))
+job_workers = int(os.getenv("ELSIA_JOB_WORKERS", "2"))
+job_timeout = float(os.getenv("ELSIA_JOB_TIMEOUT", "300"))
+job_max_attempts = int(os.getenv("ELSIA_JOB_MAX_ATTEMPTS", "3"))
+# Bail d'une tâche en cours, renouvelé par son worker : à son expiration (worker arrêté), la tâche est reprise par un autre.
+# Lease of a running job, renewed by its worker: once it expires (stopped worker), the job is taken over by another one.
+job_lease = float(os.getenv("ELSIA_JOB_LEASE", "30"))
+job_poll_interval = float(os.getenv("ELSIA_JOB_POLL_INTERVAL", "0.5"))
+job_max_wait = float(os.getenv("ELSIA_JOB_MAX_WAIT", "60"))
+job_retention = float(os.getenv("ELSIA_JOB_RETENTION", str(7 * 24 * 3600)))
+job_callback_timeout = float(os.getenv("ELSIA_JOB_CALLBACK_TIMEOUT", "10"))
+job_callback_attempts = int(os.getenv("ELSIA_JOB_CALLBACK_ATTEMPTS", "3"))
+
+# Relances avec backoff exponentiel et disjoncteur autour des appels à Claude.
+# Retries with exponential backoff and circuit breaker around the Claude calls.
+retry_max_attempts = int(os.getenv("ELSIA_RETRY_MAX_ATTEMPTS", "4"))
+retry_base_delay = float(os.getenv("ELSIA_RETRY_BASE_DELAY", "0.5"))
+retry_max_delay = float(os.getenv("ELSIA_RETRY_MAX_DELAY", "8.0"))
+breaker_failure_threshold = int(os.getenv("ELSIA_BREAKER_FAILURE_THRESHOLD", "5"))
+breaker_reset_timeout = float(os.getenv("ELSIA_BREAKER_RESET_TIMEOUT", "30.0"))
+
+# Contrôle d'admission des appels à Claude, dimensionné par les en-têtes anthropic-ratelimit-*.
+# Admission control of the Claude calls, sized from the anthropic-ratelimit-* headers.
+admission_max_concurrency = int(os.getenv("ELSIA_ADMISSION_MAX_CONCURRENCY", "32"))
+admission_min_concurrency = int(os.getenv("ELSIA_ADMISSION_MIN_CONCURRENCY", "1"))
+admission_max_queue = int(os.getenv("ELSIA_ADMISSION_MAX_QUEUE", "200"))
+
+# Délestage des requêtes HTTP : rejet (503) lorsque la classe est pleine ou que l'attente estimée dépasse le timeout de la route.
+# Load shedding of the HTTP requests: rejection (503) when the class is full or when the estimated wait exceeds the timeout of the route.
+load_shedding = os.getenv("ELSIA_LOAD_SHEDDING", "true").lower() == "true"
+shed_light_budget = int(os.getenv("ELSIA_SHED_LIGHT_BUDGET", "256"))
+shed_full_budget = int(os.getenv("ELSIA_SHED_FULL_BUDGET", "32"))
+shed_latency_alpha = float(os.getenv("ELSIA_SHED_LATENCY_ALPHA", "0.2"))
+
+# Modèles de prompt, chargés au démarrage ; rechargement optionnel lorsque les fichiers sont modifiés.
+# Prompt templates, loaded at startup; optional reload when the files are modified.
+prompts_directory = os.getenv("ELSIA_PROMPTS_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts"))
+prompts_hot_reload = os.getenv("ELSIA_PROMPTS_HOT_RELOAD", "false").lower() == "true"
+prompts_reload_interval = float(os.getenv("ELSIA_PROMPTS_RELOAD_INTERVAL", "2.0"))
+
+# Envois de fichiers de /profile/full : taille maximale, seuil de conservation en mémoire et nettoyage des fichiers orphelins.
+# File uploads of /profile/full: maximum size, in-memory threshold and sweep of the orphan files.
+upload_max_bytes = int(os.getenv("ELSIA_UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+upload_memory_threshold = int(os.getenv("ELSIA_UPLOAD_MEMORY_THRESHOLD", str(1024 * 1024)))
+upload_chunk_size = int(os.getenv("ELSIA_UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+upload_directory = os.getenv("ELSIA_UPLOAD_DIR", "temp_uploads")
+upload_orphan_max_age = float(os.getenv("ELSIA_UPLOAD_ORPHAN_MAX_AGE", "3600"))
+upload_janitor_interval = float(os.getenv("ELSIA_UPLOAD_JANITOR_INTERVAL", "600"))
+# Marge du corps multipart au-delà du fichier (description et autres champs du formulaire).
+# Allowance of the multipart body beyond the file (description and the other form fields).
+upload_form_allowance = int(os.getenv("ELSIA_UPLOAD_FORM_ALLOWANCE", str(1024 * 1024)))
+
+# Extraction du texte des fichiers envoyés (PDF, DOCX, TXT) dans un pool de processus, bornée par un budget de tokens.
+# Text extraction of the uploaded files (PDF, DOCX, TXT) in a process pool, capped by a token budget.
+extraction_workers = int(os.getenv("ELSIA_EXTRACTION_WORKERS", "2"))
+extraction_max_tokens = int(os.getenv("ELSIA_EXTRACTION_MAX_TOKENS", "8000"))
+
+# Stockage des documents envoyés, adressé par le SHA-256 de leur contenu : texte extrait et `file_id` de la Files API.
+# Store of the uploaded documents, addressed by the SHA-256 of their content: extracted text and Files API `file_id`.
+document_store_backend = os.getenv("ELSIA_DOCUMENT_STORE", "sqlite").lower()
+document_store_path = os.getenv("ELSIA_DOCUMENT_STORE_PATH", os.path.join("data", "document_store.sqlite3"))
+document_store_max_bytes = int(os.getenv("ELSIA_DOCUMENT_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Envoi des PDF à la Files API (une seule fois par contenu) au lieu d'insérer leur texte extrait dans le prompt.
+# Upload the PDFs to the Files API (once per content) instead of inserting their extracted text in the prompt.
+document_files_api = os.getenv("ELSIA_DOCUMENT_FILES_API", "false").lower() == "true"
+
+# Journaux : lignes JSON écrites par un thread dédié, rotation par jour et par taille, troncature des messages volumineux.
+# Logs: JSON lines written by a dedicated thread, rotation by day and by size, truncation of the large messages.
+log_directory = os.getenv("ELSIA_LOG_DIR", "logs")
+log_level = os.getenv("ELSIA_LOG_LEVEL", "INFO").upper()
+log_max_bytes = int(os.getenv("ELSIA_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+log_backup_count = int(os.getenv("ELSIA_LOG_BACKUP_COUNT", "5"))
+log_queue_size = int(os.getenv("ELSIA_LOG_QUEUE_SIZE", "10000"))
+log_max_message_chars = int(os.getenv("ELSIA_LOG_MAX_MESSAGE_CHARS", "4000"))
+# Fraction des messages volumineux (au-delà de ELSIA_LOG_MAX_MESSAGE_CHARS) qui sont écrits, tronqués ; les autres sont ignorés.
+# Fraction of the large messages (beyond ELSIA_LOG_MAX_MESSAGE_CHARS) that are written, truncated; the others are dropped.
+log_large_sample_rate = float(os.getenv("ELSIA_LOG_LARGE_SAMPLE_RATE", "1.0"))
+
+# Sortie structurée : le modèle répond par un appel d'outil dont l'entrée suit le schéma JSON du modèle de réponse.
+# Structured output: the model answers with a tool call whose input follows the JSON schema of the response model.
+structured_output = os.getenv("ELSIA_STRUCTURED_OUTPUT", "false").lower() == "true"
+
+# Sortie JSON invalide malgré la réparation locale : une seule demande de correction au modèle, bornée en tokens.
+# Invalid JSON output despite the local repair: a single correction request to the model, bounded in tokens.
+json_reask = os.getenv("ELSIA_JSON_REASK", "true").lower() == "true"
+json_reask_max_tokens = int(os.getenv("ELSIA_JSON_REASK_MAX_TOKENS", "4000"))